@@ -0,0 +1,219 @@
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+
+from typing import Callable, Iterable, Iterator, List, Tuple
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from alternator_lb import AlternatorLB
+
+BATCH_WRITE_LIMIT = 25
+
+
+@dataclass
+class BulkWriteStats:
+    items: int = 0
+    batches: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class BulkWriter:
+    """
+    Writes a stream of items to one table with BatchWriteItem through an
+    AlternatorLB-patched client.
+
+    Items (DynamoDB typed dicts, as taken by put_item) are consumed lazily
+    and grouped into 25-item batches, which a bounded pool of workers sends
+    concurrently; the LB spreads them over the live nodes. Items a node
+    returns as UnprocessedItems are resent with jittered exponential backoff.
+    At most 2 * workers batches are buffered, so a generator input is never
+    read far ahead of what the cluster has accepted. A batch must not hold
+    the same key twice, BatchWriteItem rejects that.
+
+    How to use:
+    ```
+        writer = BulkWriter(lb, 'test_table')
+        stats = writer.write({'id': {'N': str(i)}} for i in range(1000000))
+        print(stats.items_per_second, stats.retries)
+    ```
+    """
+    _logger = logging.getLogger('AlternatorBulk')
+
+    def __init__(self, lb: AlternatorLB, table: str, workers: int = 0, client=None,
+                 max_retries: int = 10, backoff: float = 0.05, max_backoff: float = 5.0,
+                 report_interval: float = 10.0):
+        self._table = table
+        self._workers = workers or 2 * len(lb.get_known_nodes())
+        self._client = client or lb.new_botocore_dynamodb_client()
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._report_interval = report_interval
+        self._stats_lock = threading.Lock()
+
+    def write(self, items: Iterable[dict]) -> BulkWriteStats:
+        return self._run(
+            (None, [{'PutRequest': {'Item': item}} for item in batch])
+            for batch in chunked(items, BATCH_WRITE_LIMIT))
+
+    def delete(self, keys: Iterable[dict]) -> BulkWriteStats:
+        return self._run(
+            (None, [{'DeleteRequest': {'Key': key}} for key in batch])
+            for batch in chunked(keys, BATCH_WRITE_LIMIT))
+
+    def write_batches(self, batches: Iterable[Tuple[object, List[dict]]],
+                      on_written: Callable[[object], None]) -> BulkWriteStats:
+        """
+        Writes batches the caller already grouped, as (tag, items) pairs of at
+        most 25 items, calling on_written(tag) from a worker thread once every
+        item of the batch is stored. Batches complete out of order.
+        """
+        return self._run(
+            ((tag, [{'PutRequest': {'Item': item}} for item in items]) for (tag, items) in batches),
+            on_written)
+
+    def _run(self, batches: Iterable[Tuple[object, List[dict]]],
+             on_written: Callable[[object], None] = None) -> BulkWriteStats:
+        stats = BulkWriteStats()
+        slots = threading.BoundedSemaphore(2 * self._workers)
+        futures = []
+        start = time.perf_counter()
+        next_report = start + self._report_interval
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            for (tag, batch) in batches:
+                slots.acquire()
+                future = executor.submit(self._write_batch, batch, stats, tag, on_written)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+                if len(futures) >= 4 * self._workers:
+                    futures = self._reap(futures)
+                if self._report_interval and time.perf_counter() >= next_report:
+                    stats.elapsed = time.perf_counter() - start
+                    self._logger.info(
+                        f"{stats.items} items written to '{self._table}', "
+                        f"{stats.items_per_second:.0f} items/sec, {stats.retries} retries")
+                    next_report += self._report_interval
+            for future in futures:
+                future.result()
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+    @staticmethod
+    def _reap(futures):
+        # Surface failed batches early and keep only the ones still running.
+        pending = []
+        for future in futures:
+            if future.done():
+                future.result()
+            else:
+                pending.append(future)
+        return pending
+
+    def _write_batch(self, requests: List[dict], stats: BulkWriteStats, tag=None,
+                     on_written: Callable[[object], None] = None):
+        size = len(requests)
+        attempt = 0
+        while True:
+            response = self._client.batch_write_item(
+                RequestItems={self._table: requests})
+            requests = response.get('UnprocessedItems', {}).get(self._table)
+            if not requests:
+                break
+            attempt += 1
+            if attempt > self._max_retries:
+                raise RuntimeError(
+                    f"{len(requests)} items still unprocessed after {self._max_retries} retries")
+            with self._stats_lock:
+                stats.retries += 1
+            delay = min(self._max_backoff, self._backoff * 2 ** (attempt - 1))
+            time.sleep(random.uniform(delay / 2, delay))
+        with self._stats_lock:
+            stats.items += size
+            stats.batches += 1
+        if on_written is not None:
+            on_written(tag)
+
+
+_SEGMENT_DONE = object()
+
+
+def parallel_scan(lb: AlternatorLB, table: str, total_segments: int = 0, workers: int = 0,
+                  client=None, max_buffered_pages: int = 0, **scan_kwargs) -> Iterator[dict]:
+    """
+    Reads a whole table with a segmented Scan (Segment/TotalSegments) whose
+    segments run concurrently, each pinned to one of lb.get_known_nodes() so
+    the whole cluster serves the read. Items are yielded as pages arrive;
+    at most `max_buffered_pages` pages are held in memory, workers block
+    until the consumer catches up. Extra keyword arguments (FilterExpression,
+    ProjectionExpression, Limit, ...) are passed on to every Scan call.
+
+    Items come out in no particular order. Closing the generator early stops
+    the remaining segments.
+    """
+    nodes = lb.get_known_nodes()
+    total_segments = total_segments or 2 * len(nodes)
+    workers = min(workers or total_segments, total_segments)
+    client = client or lb.new_botocore_dynamodb_client()
+    pages = queue.Queue(maxsize=max_buffered_pages or 2 * workers)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan_segment(segment: int):
+        try:
+            request = dict(scan_kwargs, TableName=table,
+                           Segment=segment, TotalSegments=total_segments)
+            with lb.pinned_node(nodes[segment % len(nodes)]):
+                while not stop.is_set():
+                    response = client.scan(**request)
+                    if not put(response.get('Items', [])):
+                        return
+                    last_key = response.get('LastEvaluatedKey')
+                    if not last_key:
+                        break
+                    request['ExclusiveStartKey'] = last_key
+            put(_SEGMENT_DONE)
+        except Exception as e:
+            put(e)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for segment in range(total_segments):
+            executor.submit(scan_segment, segment)
+        remaining = total_segments
+        while remaining:
+            entry = pages.get()
+            if entry is _SEGMENT_DONE:
+                remaining -= 1
+            elif isinstance(entry, Exception):
+                raise entry
+            else:
+                yield from entry
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,116 @@
+import copy
+import threading
+
+from dataclasses import dataclass, replace
+
+COALESCED_OPERATIONS = ('GetItem', 'Query')
+
+
+@dataclass
+class CoalescingStats:
+    requests: int = 0
+    coalesced: int = 0
+    fallbacks: int = 0
+
+
+class _Flight:
+    __slots__ = ('done', 'waiters', 'http_response', 'parsed')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.http_response = None
+        self.parsed = None
+
+
+class ReadCoalescer:
+    """
+    Single-flight for eventually consistent GetItem and Query calls.
+
+    Requests are identical when their serialized bodies are, which covers
+    the table, key, projection and every other parameter. The first one
+    goes to the cluster; identical requests that arrive while it is in
+    flight wait for it and each get their own copy of its response, so a
+    burst on a hot key costs one round-trip. Nothing is kept once the
+    response is handed out, so unlike ItemCache this never serves anything
+    older than a request that was already running.
+
+    If the shared request fails, the waiting callers send their own.
+    ConsistentRead=True requests are never coalesced. A caller served with
+    another request's response has FOLLOWER_KEY set in its request context.
+    """
+    FOLLOWER_KEY = 'alternator_coalesce_follower'
+    _ELIGIBLE_KEY = 'alternator_coalesce'
+    _LEADER_KEY = 'alternator_coalesce_leader'
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = CoalescingStats()
+
+    def stats(self) -> CoalescingStats:
+        with self._lock:
+            return replace(self._stats)
+
+    def register_client_hooks(self, client):
+        events = client.meta.events
+        for operation in COALESCED_OPERATIONS:
+            events.register(f'provide-client-params.dynamodb.{operation}', self._on_params,
+                            unique_id=f'alternator-lb-coalesce-eligible-{operation}')
+            events.register(f'before-call.dynamodb.{operation}', self._on_before_call,
+                            unique_id=f'alternator-lb-coalesce-{operation}')
+            events.register(f'after-call.dynamodb.{operation}', self._on_after_call,
+                            unique_id=f'alternator-lb-coalesce-done-{operation}')
+            events.register(f'after-call-error.dynamodb.{operation}', self._on_after_call_error,
+                            unique_id=f'alternator-lb-coalesce-failed-{operation}')
+
+    def _on_params(self, params, context, **kwargs):
+        if not params.get('ConsistentRead'):
+            context[self._ELIGIBLE_KEY] = True
+
+    def _on_before_call(self, model, params, context, **kwargs):
+        # Flights are only opened here, after parameter validation and
+        # endpoint resolution, because from this point botocore always
+        # emits after-call or after-call-error and the flight gets closed.
+        if not context.pop(self._ELIGIBLE_KEY, False):
+            return None
+        key = (model.name, params['url_path'], params['body'])
+        with self._lock:
+            self._stats.requests += 1
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = flight = _Flight()
+                context[self._LEADER_KEY] = (key, flight)
+                return None
+            flight.waiters += 1
+        flight.done.wait()
+        if flight.parsed is None:
+            with self._lock:
+                self._stats.fallbacks += 1
+            return None
+        with self._lock:
+            self._stats.coalesced += 1
+        context[self.FOLLOWER_KEY] = True
+        return (flight.http_response, copy.deepcopy(flight.parsed))
+
+    def _land(self, context, http_response=None, parsed=None):
+        leader = context.pop(self._LEADER_KEY, None)
+        if leader is None:
+            return
+        (key, flight) = leader
+        with self._lock:
+            del self._flights[key]
+        if flight.waiters and parsed is not None:
+            # The leader's caller gets `parsed` itself and may change it
+            # while the waiters are still copying.
+            (flight.http_response, flight.parsed) = (http_response, copy.deepcopy(parsed))
+        flight.done.set()
+
+    def _on_after_call(self, http_response, parsed, context, **kwargs):
+        if http_response.status_code >= 300:
+            # Let every waiter retry on its own rather than all failing.
+            parsed = None
+        self._land(context, http_response, parsed)
+
+    def _on_after_call_error(self, context, **kwargs):
+        self._land(context)
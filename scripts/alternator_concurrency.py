@@ -0,0 +1,107 @@
+import math
+import time
+
+
+class AIMDLimit:
+    """
+    Additive-increase/multiplicative-decrease concurrency limit for one node.
+
+    When the node's recent latency (a fast moving average) rises above
+    `tolerance` times its long-term average, or a request fails, the limit
+    is cut by `backoff_ratio`, at most once per long-term round-trip so a
+    burst of slow responses counts as one signal. Otherwise, while the node
+    is using at least half of its limit, every completion adds 1/limit,
+    about one extra slot per round-trip.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int,
+                 tolerance: float = 2.0, backoff_ratio: float = 0.9,
+                 short_decay: float = 0.1, long_decay: float = 0.002):
+        self._min = min_limit
+        self._max = max_limit
+        self._tolerance = tolerance
+        self._backoff_ratio = backoff_ratio
+        self._short_decay = short_decay
+        self._long_decay = long_decay
+        self._limit = float(initial)
+        self._short = None
+        self._long = None
+        self._last_decrease = 0.0
+        self.limit = initial
+
+    def on_sample(self, latency: float, in_flight: int, failed: bool):
+        if self._long is None:
+            self._short = self._long = latency
+        self._short += self._short_decay * (latency - self._short)
+        self._long += self._long_decay * (latency - self._long)
+
+        if failed or self._short > self._tolerance * self._long:
+            now = time.monotonic()
+            if now - self._last_decrease >= self._long:
+                self._last_decrease = now
+                self._limit = max(self._min, self._limit * self._backoff_ratio)
+        elif in_flight * 2 >= self._limit:
+            self._limit = min(self._max, self._limit + 1 / self._limit)
+        self.limit = int(self._limit)
+
+
+class GradientLimit:
+    """
+    Latency-gradient concurrency limit for one node, after Netflix's
+    Gradient2. Samples are averaged over windows of about one round-trip
+    (`limit` completions); each window's average is compared with a slow
+    moving average over many windows. When the window is slower the limit
+    is scaled down by the ratio (never below half at once); when it is not,
+    the limit grows by about sqrt(limit). Failures count as a sample at
+    twice the long-term latency. The limit only grows while the node is
+    using at least half of it.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int,
+                 tolerance: float = 1.5, smoothing: float = 0.2, long_decay: float = 0.01):
+        self._min = min_limit
+        self._max = max_limit
+        self._tolerance = tolerance
+        self._smoothing = smoothing
+        self._long_decay = long_decay
+        self._limit = float(initial)
+        self._long = None
+        self._window_sum = 0.0
+        self._window_count = 0
+        self._window_in_flight = 0
+        self.limit = initial
+
+    def on_sample(self, latency: float, in_flight: int, failed: bool):
+        if failed and self._long is not None:
+            latency = 2 * self._long
+        self._window_sum += latency
+        self._window_count += 1
+        self._window_in_flight = max(self._window_in_flight, in_flight)
+        if self._window_count < max(4, self.limit):
+            return
+        short = self._window_sum / self._window_count
+        in_flight = self._window_in_flight
+        self._window_sum = 0.0
+        self._window_count = 0
+        self._window_in_flight = 0
+
+        if self._long is None:
+            self._long = short
+        self._long += self._long_decay * (short - self._long)
+        if self._long > 2 * short:
+            # The node recovered from a long slow period, forget it faster.
+            self._long *= 0.95
+
+        gradient = max(0.5, min(1.0, self._tolerance * self._long / short))
+        if gradient == 1.0 and in_flight * 2 < self._limit:
+            return
+        target = self._limit * gradient + math.sqrt(self._limit)
+        limit = self._limit * (1 - self._smoothing) + target * self._smoothing
+        self._limit = max(self._min, min(self._max, limit))
+        self.limit = int(self._limit)
+
+
+CONCURRENCY_LIMITERS = {
+    "aimd": AIMDLimit,
+    "gradient": GradientLimit,
+}
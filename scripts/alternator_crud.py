@@ -1,67 +1,71 @@
+import argparse
+import functools
+import json
 import logging
-import re
+import multiprocessing.util
+import os
+import signal
 import time
-import random
+from dataclasses import asdict
 from alternator_lb import AlternatorLB, Config as ALBConfig
-import botocore.httpsession
-import urllib3.connection
-
-# -----------------------------------
-# Custom Logging Filter
-# -----------------------------------
-class AlternatorNodeLogFilter(logging.Filter):
-    def filter(self, record):
-        return bool(re.search(r'http://\d+\.\d+\.\d+\.\d+:8000', record.getMessage()))
+from alternator_bulk import BulkWriter
+from alternator_loadgen import IntervalReport, run_open_loop
+from alternator_workloads import KEY_DISTRIBUTIONS, WORKLOADS, Workload, WorkloadProfile
 
 # -----------------------------------
 # Base Logger Setup
 # -----------------------------------
 logging.basicConfig(
-    level=logging.INFO  # Set higher default to reduce spam
+    level=logging.INFO,
+    format='%(asctime)s - %(message)s'
 )
-logger = logging.getLogger("AlternatorNodeLogger")
-logger.propagate = False
-logger.setLevel(logging.DEBUG)
-
-# Add a dedicated handler just for filtered Alternator node output
-handler = logging.StreamHandler()
-handler.setLevel(logging.DEBUG)
-handler.addFilter(AlternatorNodeLogFilter())
-formatter = logging.Formatter('%(asctime)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+logger = logging.getLogger("AlternatorCrud")
 
 # -----------------------------------
-# Patch urllib3 to log only node connection events
+# Alternator LB Setup
 # -----------------------------------
-_original_send = botocore.httpsession.URLLib3Session.send
+table_name = 'test_table'
+
 
-def patched_send(self, request):
-    logger.debug(f"HTTP Request → {request.url}")
-    return _original_send(self, request)
+def new_lb(args) -> AlternatorLB:
+    return AlternatorLB(ALBConfig(
+        schema="http",
+        nodes=args.nodes,
+        port=args.port,
+        datacenter=args.datacenter,
+        update_interval=5,
+        max_pool_connections=max(100, args.threads),
+        trace_sample_rate=args.trace_sample,
+    ))
 
-botocore.httpsession.URLLib3Session.send = patched_send
 
 # -----------------------------------
-# Alternator LB Setup
+# Request Tracing
 # -----------------------------------
-lb = AlternatorLB(ALBConfig(
-    schema="http",
-    nodes=['10.1.0.3'],  # Add more if available
-    port=8000,
-    datacenter="DC1",
-    update_interval=5,
-    max_pool_connections=100,
-))
-
-dynamodb = lb.new_botocore_dynamodb_client()
-table_name = 'test_table'
+def enable_trace_dumps(lb, args):
+    """
+    Writes the sampled requests of the process to args.trace on SIGUSR1 and
+    when the process exits; with several processes each one writes its own
+    args.trace.<pid>.
+    """
+    path = args.trace if args.processes == 1 else f"{args.trace}.{os.getpid()}"
+
+    def dump(*_):
+        with open(path, "w") as f:
+            count = lb.dump_traces(f)
+        logger.info(f"Wrote {count} sampled requests to {path}")
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, dump)
+    # Unlike atexit, multiprocessing's finalizers also run when a load
+    # process exits.
+    multiprocessing.util.Finalize(None, dump, exitpriority=10)
 
 
 # -----------------------------------
 # Create Table
 # -----------------------------------
-def create_table():
+def create_table(dynamodb):
     try:
         dynamodb.describe_table(TableName=table_name)
         logger.info(f"Table '{table_name}' exists. Deleting...")
@@ -90,37 +94,114 @@ def create_table():
 # -----------------------------------
 # Write Items
 # -----------------------------------
-def write_items(n):
+def write_items(lb, dynamodb, n):
     logger.info(f"Writing {n} items to table '{table_name}'")
-    start = time.time()
-    for i in range(n):
-        dynamodb.put_item(
-            TableName=table_name,
-            Item={
-                'id': {'N': str(i)},
-                'payload': {'S': f'data_{i}'}
-            }
-        )
-    end = time.time()
-    logger.info(f"Wrote {n} items in {end - start:.2f} seconds")
-
-
-def read_items(n):
-    logger.info(f"Reading {n} items from table '{table_name}'")
-    start = time.time()
-    for _ in range(n):
-        rand_id = random.randint(0, n - 1)
-        dynamodb.get_item(
-            TableName=table_name,
-            Key={'id': {'N': str(rand_id)}}
-        )
-    end = time.time()
-    logger.info(f"Read {n} items in {end - start:.2f} seconds")
+    writer = BulkWriter(lb, table_name, client=dynamodb)
+    stats = writer.write(
+        {
+            'id': {'N': str(i)},
+            'payload': {'S': f'data_{i}'}
+        }
+        for i in range(n)
+    )
+    logger.info(f"Wrote {stats.items} items in {stats.elapsed:.2f} seconds "
+                f"({stats.items_per_second:.0f} items/sec, {stats.retries} retries)")
+
+
+# -----------------------------------
+# Load
+# -----------------------------------
+def make_operation(args):
+    """
+    Builds the operation each load process runs: the YCSB workload named by
+    args.workload or, without one, a GetItem/UpdateItem mix with
+    args.read_ratio reads, over the args.keys loaded keys. Called once per
+    process, so every process has its own LB.
+    """
+    lb = new_lb(args)
+    if args.trace:
+        enable_trace_dumps(lb, args)
+    dynamodb = lb.new_fast_dynamodb_client() if args.fast_client else lb.new_botocore_dynamodb_client()
+    if args.workload:
+        profile = WORKLOADS[args.workload]
+    else:
+        profile = WorkloadProfile(read=args.read_ratio, update=1 - args.read_ratio,
+                                  distribution='uniform')
+    workload = Workload(profile, args.keys, distribution=args.distribution, theta=args.theta)
+    return workload.operation(dynamodb, table_name)
+
+
+def print_report(report: IntervalReport):
+    print(f"{report.start:>7.1f}s {report.ops_per_second:>9.0f} ops/s  "
+          f"p50 {report.p50:>7.2f}  p99 {report.p99:>7.2f}  p99.9 {report.p999:>7.2f}  "
+          f"max {report.max:>8.2f} ms  errors {report.errors}  lag {report.max_lag:.2f} ms",
+          flush=True)
+
 
 # -----------------------------------
 # Main
 # -----------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="Open-loop YCSB-style load against Alternator with "
+                    "coordinated-omission corrected latency percentiles.")
+    parser.add_argument("--nodes", nargs="+", default=['10.1.0.3'])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--datacenter", default="DC1")
+    parser.add_argument("--create-table", action="store_true",
+                        help="(re)create the table before loading")
+    parser.add_argument("--load", type=int, default=0, metavar="N",
+                        help="write items 0..N-1 before the run")
+    parser.add_argument("--rate", type=float, default=1000, help="target operations per second")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--threads", type=int, default=32, help="threads per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=1.0, help="report interval, seconds")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS),
+                        help="YCSB core workload; without one, --read-ratio reads and the rest updates")
+    parser.add_argument("--read-ratio", type=float, default=0.5)
+    parser.add_argument("--distribution", choices=KEY_DISTRIBUTIONS,
+                        help="key distribution, by default the workload's (zipfian for most YCSB "
+                             "workloads, uniform without --workload)")
+    parser.add_argument("--theta", type=float, default=0.99, help="zipfian skew, 0 < theta < 1")
+    parser.add_argument("--keys", type=int, default=100000,
+                        help="loaded keys (0..keys-1) the workload reads and updates")
+    parser.add_argument("--fast-client", action="store_true", help="use FastDynamoDBClient")
+    parser.add_argument("--report", metavar="PATH", help="also write the reports as JSON lines")
+    parser.add_argument("--trace-sample", type=float, default=0.0, metavar="RATE",
+                        help="fraction of requests whose node, operation, latency and status "
+                             "are kept in the trace buffer")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="write the trace buffer as JSON lines here on SIGUSR1 and at exit")
+    args = parser.parse_args()
+    if args.trace and not args.trace_sample:
+        parser.error("--trace needs --trace-sample")
+
+    if args.create_table or args.load:
+        lb = new_lb(args)
+        dynamodb = lb.new_botocore_dynamodb_client()
+        if args.create_table:
+            create_table(dynamodb)
+        if args.load:
+            write_items(lb, dynamodb, args.load)
+
+    reports = []
+
+    def on_report(report):
+        reports.append(report)
+        print_report(report)
+
+    total = run_open_loop(functools.partial(make_operation, args), args.rate, args.duration,
+                          threads=args.threads, processes=args.processes,
+                          interval=args.interval, on_report=on_report)
+    print("  total:")
+    print_report(total)
+    if args.report:
+        with open(args.report, "w") as f:
+            for report in reports:
+                f.write(json.dumps(asdict(report)) + "\n")
+            f.write(json.dumps(dict(asdict(total), total=True)) + "\n")
+
+
 if __name__ == "__main__":
-    #create_table()
-    write_items(100) 
-    read_items(100)
\ No newline at end of file
+    main()
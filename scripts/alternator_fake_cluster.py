@@ -0,0 +1,816 @@
+import argparse
+import base64
+import bisect
+import collections
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+
+from decimal import Decimal, InvalidOperation
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from alternator_token_ring import partition_key_token
+
+_ERROR_PREFIX = 'com.amazonaws.dynamodb.v20120810#'
+_MIN_TOKEN = -(1 << 63)
+
+
+def constant_latency(seconds: float) -> Callable[[], float]:
+    return lambda: seconds
+
+
+def exponential_latency(mean: float) -> Callable[[], float]:
+    return lambda: random.expovariate(1 / mean)
+
+
+def lognormal_latency(median: float, sigma: float = 0.5) -> Callable[[], float]:
+    mu = math.log(median)
+    return lambda: random.lognormvariate(mu, sigma)
+
+
+def bimodal_latency(fast: float, slow: float, slow_ratio: float) -> Callable[[], float]:
+    """`fast` seconds, except for `slow_ratio` of the requests that take `slow`, e.g. a GC pause."""
+    return lambda: slow if random.random() < slow_ratio else fast
+
+
+class FakeAlternatorError(Exception):
+    def __init__(self, code: str, message: str, status: int = 400):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+def _validation(message: str) -> FakeAlternatorError:
+    return FakeAlternatorError('ValidationException', message)
+
+
+def _sortable(value: dict):
+    # Typed attribute value -> Python value that orders and compares the
+    # way DynamoDB orders key attributes of that type.
+    (kind, data) = next(iter(value.items()))
+    if kind == 'N':
+        try:
+            return Decimal(data)
+        except InvalidOperation:
+            raise _validation(f"Invalid number: {data}")
+    if kind == 'B':
+        return base64.b64decode(data)
+    return data
+
+
+class FakeTable:
+    """One table of the in-memory store: partitions keyed by hash key value, each a dict of items by sort key."""
+
+    def __init__(self, request: dict):
+        self.name = request['TableName']
+        self.key_schema = request['KeySchema']
+        self.attribute_definitions = request.get('AttributeDefinitions', [])
+        self.provisioned_throughput = request.get('ProvisionedThroughput')
+        self.hash_key = next(key['AttributeName'] for key in self.key_schema if key['KeyType'] == 'HASH')
+        self.range_key = next((key['AttributeName'] for key in self.key_schema
+                               if key['KeyType'] == 'RANGE'), None)
+        self.created = time.time()
+        self.partitions: Dict[object, Dict[object, dict]] = {}
+        self.tokens: Dict[object, int] = {}
+        self.count = 0
+        # Item keys in scan (token) order, rebuilt when items come or go.
+        self._scan_order = None
+
+    def describe(self, status: str = 'ACTIVE') -> dict:
+        description = {
+            'TableName': self.name,
+            'KeySchema': self.key_schema,
+            'AttributeDefinitions': self.attribute_definitions,
+            'TableStatus': status,
+            'CreationDateTime': self.created,
+            'ItemCount': self.count,
+            'TableArn': f"arn:scylla-alternator:fake:::table/{self.name}",
+        }
+        if self.provisioned_throughput:
+            description['ProvisionedThroughput'] = dict(
+                self.provisioned_throughput, NumberOfDecreasesToday=0)
+        else:
+            description['BillingModeSummary'] = {'BillingMode': 'PAY_PER_REQUEST'}
+        return description
+
+    def key(self, attributes: dict, exact: bool = True):
+        names = [self.hash_key] + ([self.range_key] if self.range_key else [])
+        if exact and set(attributes) != set(names):
+            raise _validation(f"The provided key element does not match the schema of table {self.name}")
+        try:
+            return tuple(_sortable(attributes[name]) for name in names)
+        except KeyError as e:
+            raise _validation(f"Missing the key {e.args[0]} in the item")
+
+    def key_attributes(self, item: dict) -> dict:
+        key = {self.hash_key: item[self.hash_key]}
+        if self.range_key:
+            key[self.range_key] = item[self.range_key]
+        return key
+
+    def token(self, hash_value: dict) -> int:
+        (kind, data) = next(iter(hash_value.items()))
+        return partition_key_token({'B': base64.b64decode(data)} if kind == 'B' else hash_value)
+
+    def get(self, key: tuple) -> Optional[dict]:
+        partition = self.partitions.get(key[0])
+        return partition.get(key[1:]) if partition is not None else None
+
+    def put(self, key: tuple, item: dict) -> Optional[dict]:
+        partition = self.partitions.get(key[0])
+        if partition is None:
+            partition = self.partitions[key[0]] = {}
+            self.tokens[key[0]] = self.token(item[self.hash_key])
+        old = partition.get(key[1:])
+        partition[key[1:]] = item
+        if old is None:
+            self.count += 1
+            self._scan_order = None
+        return old
+
+    def delete(self, key: tuple) -> Optional[dict]:
+        partition = self.partitions.get(key[0])
+        if partition is None:
+            return None
+        old = partition.pop(key[1:], None)
+        if old is not None:
+            self.count -= 1
+            self._scan_order = None
+            if not partition:
+                del self.partitions[key[0]]
+                del self.tokens[key[0]]
+        return old
+
+    def scan_order(self) -> List[tuple]:
+        if self._scan_order is None:
+            self._scan_order = sorted(
+                (self.tokens[hash_value],) + (hash_value,) + sort_key
+                for (hash_value, partition) in self.partitions.items()
+                for sort_key in partition)
+        return self._scan_order
+
+
+_KEY_CONDITION = re.compile(r'^\s*\(?\s*([#\w]+)\s*=\s*(:\w+)\s*\)?(?:\s+AND\s+(.+))?$', re.I | re.S)
+_RANGE_CONDITIONS = (
+    ('between', re.compile(r'^\(?\s*([#\w]+)\s+BETWEEN\s+(:\w+)\s+AND\s+(:\w+)\s*\)?$', re.I)),
+    ('begins_with', re.compile(r'^\(?\s*begins_with\s*\(\s*([#\w]+)\s*,\s*(:\w+)\s*\)\s*\)?$', re.I)),
+    ('compare', re.compile(r'^\(?\s*([#\w]+)\s*(=|<=|<|>=|>)\s*(:\w+)\s*\)?$')),
+)
+_CONDITION = re.compile(
+    r'^\s*(?:(attribute_exists|attribute_not_exists)\s*\(\s*([#\w]+)\s*\)'
+    r'|([#\w]+)\s*(=|<>|<=|<|>=|>)\s*(:\w+))\s*$', re.I)
+_SET_ACTION = re.compile(
+    r'^\s*([#\w]+)\s*=\s*(?:(:\w+)|([#\w]+)\s*([+-])\s*(:\w+)'
+    r'|if_not_exists\s*\(\s*([#\w]+)\s*,\s*(:\w+)\s*\))\s*$', re.I)
+_UPDATE_CLAUSE = re.compile(r'\b(SET|REMOVE|ADD|DELETE)\b', re.I)
+_COMPARE = {
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def _split_top_level(expression: str) -> List[str]:
+    # Splits on commas outside parentheses.
+    (parts, depth, start) = ([], 0, 0)
+    for (i, c) in enumerate(expression):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(expression[start:i])
+            start = i + 1
+    parts.append(expression[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+class _Expressions:
+    # ExpressionAttributeNames/Values of one request.
+
+    def __init__(self, request: dict):
+        self._names = request.get('ExpressionAttributeNames') or {}
+        self._values = request.get('ExpressionAttributeValues') or {}
+
+    def name(self, token: str) -> str:
+        if token.startswith('#'):
+            if token not in self._names:
+                raise _validation(f"Undefined attribute name {token}")
+            return self._names[token]
+        return token
+
+    def value(self, token: str) -> dict:
+        if token not in self._values:
+            raise _validation(f"Undefined attribute value {token}")
+        return self._values[token]
+
+
+class FakeStore:
+    """
+    In-memory DynamoDB JSON API, enough of it for the demo scripts and the
+    LB benchmarks: CreateTable, DeleteTable, DescribeTable, ListTables,
+    PutItem, GetItem, UpdateItem (SET and REMOVE), DeleteItem, Query (key
+    conditions), Scan (with segments, in token order like Alternator),
+    BatchWriteItem and BatchGetItem. ConditionExpression supports
+    attribute_exists, attribute_not_exists and comparisons joined by AND;
+    FilterExpression and secondary indexes are not supported. Shared by
+    every node of a FakeAlternatorCluster and guarded by one lock.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, FakeTable] = {}
+        self._lock = threading.Lock()
+
+    def handle(self, operation: str, request: dict) -> dict:
+        handler = getattr(self, f'_{re.sub(r"(?<!^)(?=[A-Z])", "_", operation).lower()}', None)
+        if handler is None or operation not in self.OPERATIONS:
+            raise FakeAlternatorError('UnknownOperationException', f"Unknown operation {operation}")
+        with self._lock:
+            return handler(request)
+
+    OPERATIONS = frozenset((
+        'CreateTable', 'DeleteTable', 'DescribeTable', 'ListTables', 'PutItem', 'GetItem',
+        'UpdateItem', 'DeleteItem', 'Query', 'Scan', 'BatchWriteItem', 'BatchGetItem'))
+
+    def table(self, name: str) -> FakeTable:
+        table = self.tables.get(name)
+        if table is None:
+            raise FakeAlternatorError('ResourceNotFoundException', f"Requested resource not found: Table: {name} not found")
+        return table
+
+    def _create_table(self, request):
+        if request.get('TableName') in self.tables:
+            raise FakeAlternatorError('ResourceInUseException', f"Table {request['TableName']} already exists")
+        if request.get('GlobalSecondaryIndexes') or request.get('LocalSecondaryIndexes'):
+            raise _validation("Secondary indexes are not supported by the fake cluster")
+        table = self.tables[request['TableName']] = FakeTable(request)
+        return {'TableDescription': table.describe()}
+
+    def _delete_table(self, request):
+        table = self.table(request['TableName'])
+        del self.tables[table.name]
+        return {'TableDescription': table.describe('DELETING')}
+
+    def _describe_table(self, request):
+        return {'Table': self.table(request['TableName']).describe()}
+
+    def _list_tables(self, request):
+        return {'TableNames': sorted(self.tables)}
+
+    @staticmethod
+    def _check_condition(request: dict, item: Optional[dict]):
+        expression = request.get('ConditionExpression')
+        if not expression:
+            return
+        expressions = _Expressions(request)
+        for clause in re.split(r'\s+AND\s+', expression, flags=re.I):
+            match = _CONDITION.match(clause)
+            if match is None:
+                raise _validation(f"Unsupported condition by the fake cluster: {clause}")
+            (function, function_path, path, op, value) = match.groups()
+            if function:
+                exists = item is not None and expressions.name(function_path) in item
+                ok = exists == (function.lower() == 'attribute_exists')
+            else:
+                current = (item or {}).get(expressions.name(path))
+                expected = expressions.value(value)
+                ok = current is not None and next(iter(current)) == next(iter(expected)) and \
+                    _COMPARE[op](_sortable(current), _sortable(expected))
+            if not ok:
+                raise FakeAlternatorError('ConditionalCheckFailedException', "The conditional request failed")
+
+    @staticmethod
+    def _project(request: dict, item: dict) -> dict:
+        projection = request.get('ProjectionExpression')
+        if not projection:
+            return item
+        expressions = _Expressions(request)
+        names = [expressions.name(name) for name in _split_top_level(projection)]
+        return {name: item[name] for name in names if name in item}
+
+    @staticmethod
+    def _return_values(request: dict, old: Optional[dict], new: Optional[dict]) -> dict:
+        wanted = request.get('ReturnValues', 'NONE')
+        if wanted == 'ALL_OLD' and old is not None:
+            return {'Attributes': old}
+        if wanted == 'ALL_NEW' and new is not None:
+            return {'Attributes': new}
+        return {}
+
+    def _put_item(self, request):
+        table = self.table(request['TableName'])
+        item = request['Item']
+        key = table.key(item, exact=False)
+        self._check_condition(request, table.get(key))
+        old = table.put(key, item)
+        return self._return_values(request, old, None)
+
+    def _get_item(self, request):
+        table = self.table(request['TableName'])
+        item = table.get(table.key(request['Key']))
+        return {'Item': self._project(request, item)} if item is not None else {}
+
+    def _delete_item(self, request):
+        table = self.table(request['TableName'])
+        key = table.key(request['Key'])
+        self._check_condition(request, table.get(key))
+        old = table.delete(key)
+        return self._return_values(request, old, None)
+
+    def _update_item(self, request):
+        table = self.table(request['TableName'])
+        key = table.key(request['Key'])
+        old = table.get(key)
+        self._check_condition(request, old)
+        # Copy on write, so a response being serialized never sees the change.
+        item = dict(old) if old is not None else dict(request['Key'])
+        expressions = _Expressions(request)
+        expression = request.get('UpdateExpression', '')
+        parts = _UPDATE_CLAUSE.split(expression)
+        if parts[0].strip():
+            raise _validation(f"Invalid UpdateExpression: {expression}")
+        for (clause, body) in zip(parts[1::2], parts[2::2]):
+            clause = clause.upper()
+            if clause == 'REMOVE':
+                for path in _split_top_level(body):
+                    item.pop(expressions.name(path), None)
+            elif clause == 'SET':
+                for action in _split_top_level(body):
+                    self._apply_set(item, action, expressions)
+            else:
+                raise _validation(f"{clause} in UpdateExpression is not supported by the fake cluster")
+        for name in request['Key']:
+            if item.get(name) != request['Key'][name]:
+                raise _validation(f"Cannot update attribute {name}. This attribute is part of the key")
+        table.put(key, item)
+        return self._return_values(request, old, item)
+
+    @staticmethod
+    def _apply_set(item: dict, action: str, expressions: _Expressions):
+        match = _SET_ACTION.match(action)
+        if match is None:
+            raise _validation(f"Unsupported SET action by the fake cluster: {action}")
+        (path, value, operand, sign, delta, default_path, default) = match.groups()
+        name = expressions.name(path)
+        if value:
+            item[name] = expressions.value(value)
+        elif default:
+            if expressions.name(default_path) not in item:
+                item[name] = expressions.value(default)
+        else:
+            base = item.get(expressions.name(operand))
+            change = expressions.value(delta)
+            if base is None or 'N' not in base or 'N' not in change:
+                raise _validation("An operand in the update expression has an incorrect data type")
+            result = Decimal(base['N']) + (Decimal(change['N']) if sign == '+' else -Decimal(change['N']))
+            item[name] = {'N': str(result)}
+
+    @staticmethod
+    def _page(request: dict, items: List[dict], more: bool, table: FakeTable) -> dict:
+        response = {'Count': len(items), 'ScannedCount': len(items)}
+        if request.get('Select') != 'COUNT':
+            response['Items'] = [FakeStore._project(request, item) for item in items]
+        if more and items:
+            response['LastEvaluatedKey'] = table.key_attributes(items[-1])
+        return response
+
+    def _query(self, request):
+        table = self.table(request['TableName'])
+        if request.get('IndexName'):
+            raise _validation("Secondary indexes are not supported by the fake cluster")
+        if request.get('FilterExpression'):
+            raise _validation("FilterExpression is not supported by the fake cluster")
+        expressions = _Expressions(request)
+        match = _KEY_CONDITION.match(request.get('KeyConditionExpression', ''))
+        if match is None or expressions.name(match.group(1)) != table.hash_key:
+            raise _validation(f"Unsupported KeyConditionExpression: {request.get('KeyConditionExpression')}")
+        partition = table.partitions.get(_sortable(expressions.value(match.group(2))), {})
+        matches = self._range_filter(match.group(3), table, expressions)
+        keys = sorted(sort_key for sort_key in partition if matches(sort_key))
+        if request.get('ScanIndexForward') is False:
+            keys.reverse()
+        start = request.get('ExclusiveStartKey')
+        if start:
+            position = table.key(start)[1:]
+            keys = [key for key in keys if (key < position if request.get('ScanIndexForward') is False
+                                            else key > position)]
+        limit = request.get('Limit') or len(keys)
+        return self._page(request, [partition[key] for key in keys[:limit]], len(keys) > limit, table)
+
+    @staticmethod
+    def _range_filter(condition: Optional[str], table: FakeTable, expressions: _Expressions):
+        if not condition:
+            return lambda sort_key: True
+        for (kind, pattern) in _RANGE_CONDITIONS:
+            match = pattern.match(condition.strip())
+            if match is None:
+                continue
+            if expressions.name(match.group(1)) != table.range_key:
+                break
+            if kind == 'between':
+                (low, high) = (_sortable(expressions.value(match.group(2))),
+                               _sortable(expressions.value(match.group(3))))
+                return lambda sort_key: low <= sort_key[0] <= high
+            if kind == 'begins_with':
+                prefix = _sortable(expressions.value(match.group(2)))
+                return lambda sort_key: sort_key[0].startswith(prefix)
+            (op, operand) = (_COMPARE[match.group(2)], _sortable(expressions.value(match.group(3))))
+            return lambda sort_key: op(sort_key[0], operand)
+        raise _validation(f"Unsupported key condition by the fake cluster: {condition}")
+
+    def _scan(self, request):
+        table = self.table(request['TableName'])
+        if request.get('FilterExpression'):
+            raise _validation("FilterExpression is not supported by the fake cluster")
+        order = table.scan_order()
+        position = 0
+        start = request.get('ExclusiveStartKey')
+        if start:
+            key = table.key(start, exact=False)
+            position = bisect.bisect_right(order, (table.tokens.get(key[0], table.token(
+                start[table.hash_key])),) + key)
+        total = request.get('TotalSegments', 1)
+        segment = request.get('Segment', 0)
+        limit = request.get('Limit') or len(order)
+        items = []
+        more = False
+        for entry in order[position:]:
+            if total > 1 and ((entry[0] - _MIN_TOKEN) * total) >> 64 != segment:
+                continue
+            if len(items) == limit:
+                more = True
+                break
+            items.append(table.partitions[entry[1]][entry[2:]])
+        return self._page(request, items, more, table)
+
+    def _batch_write_item(self, request):
+        for (name, writes) in request.get('RequestItems', {}).items():
+            table = self.table(name)
+            for write in writes:
+                if 'PutRequest' in write:
+                    item = write['PutRequest']['Item']
+                    table.put(table.key(item, exact=False), item)
+                else:
+                    table.delete(table.key(write['DeleteRequest']['Key']))
+        return {'UnprocessedItems': {}}
+
+    def _batch_get_item(self, request):
+        responses = {}
+        for (name, reads) in request.get('RequestItems', {}).items():
+            table = self.table(name)
+            items = (table.get(table.key(key)) for key in reads.get('Keys', []))
+            responses[name] = [self._project(reads, item) for item in items if item is not None]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+
+class FakeNode:
+    """
+    One node of a FakeAlternatorCluster. Set `latency` to a callable
+    returning seconds to delay each DynamoDB API request by (see
+    constant_latency, exponential_latency, lognormal_latency and
+    bimodal_latency), and `error_rate` to the fraction of requests answered
+    with `error_status` (500 InternalServerError or 503 ServiceUnavailable).
+    Discovery requests are never delayed or failed.
+
+    `requests` counts the API requests served per operation; with
+    FakeAlternatorCluster(track_replicas=True) `replica_requests` counts
+    single-item requests this node was a replica for, out of
+    `keyed_requests`.
+    """
+
+    def __init__(self, address: str, rack: str, datacenter: str, tokens: List[int]):
+        self.address = address
+        self.rack = rack
+        self.datacenter = datacenter
+        self.tokens = tokens
+        self.latency: Optional[Callable[[], float]] = None
+        self.error_rate = 0.0
+        self.error_status = 500
+        self.requests = collections.Counter()
+        self.keyed_requests = 0
+        self.replica_requests = 0
+        self.listed = False
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    @property
+    def up(self) -> bool:
+        return self.server is not None
+
+    def __repr__(self):
+        state = "up" if self.up else "down"
+        return f"FakeNode({self.address}, {self.datacenter}/{self.rack}, {state})"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK and adds milliseconds to every request.
+    disable_nagle_algorithm = True
+    _KEYED_FIELDS = {'GetItem': 'Key', 'DeleteItem': 'Key', 'UpdateItem': 'Key', 'PutItem': 'Item'}
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.node.lock:
+            self.server.node.connections.add(self.connection)
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            # stop_node() shut the connection down under a request.
+            pass
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            with self.server.node.lock:
+                self.server.node.connections.discard(self.connection)
+
+    def _send(self, status: int, body, content_type: str = 'application/x-amz-json-1.0'):
+        data = body if isinstance(body, bytes) else json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, error: FakeAlternatorError):
+        self._send(error.status, {'__type': _ERROR_PREFIX + error.code, 'message': str(error)})
+
+    def do_GET(self):
+        (cluster, node) = (self.server.cluster, self.server.node)
+        url = urlsplit(self.path)
+        if url.path == '/localnodes':
+            query = {name: values[0] for (name, values) in parse_qs(url.query).items()}
+            self._send(200, cluster.local_nodes(node, query.get('rack'), query.get('dc')),
+                       'application/json')
+        elif url.path.startswith('/storage_service/describe_ring/'):
+            keyspace = url.path.rsplit('/', 1)[-1]
+            ring = cluster.describe_ring(keyspace)
+            if ring is None:
+                self._send(400, {'message': f"Can't find a keyspace {keyspace}", 'code': 400},
+                           'application/json')
+            else:
+                self._send(200, ring, 'application/json')
+        elif url.path == '/':
+            self._send(200, f"healthy: {node.address}:{cluster.port}".encode('utf-8'), 'text/plain')
+        else:
+            self._send(404, {'message': f"Not found: {url.path}", 'code': 404}, 'application/json')
+
+    def do_POST(self):
+        (cluster, node) = (self.server.cluster, self.server.node)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        operation = self.headers.get('X-Amz-Target', '').rsplit('.', 1)[-1]
+        if node.latency is not None:
+            time.sleep(node.latency())
+        with node.lock:
+            node.requests[operation] += 1
+        if node.error_rate and random.random() < node.error_rate:
+            code = 'ServiceUnavailable' if node.error_status == 503 else 'InternalServerError'
+            self._send_error(FakeAlternatorError(code, "Injected failure", node.error_status))
+            return
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            self._send_error(FakeAlternatorError('SerializationException', "Malformed request body"))
+            return
+        try:
+            if cluster.track_replicas and operation in self._KEYED_FIELDS:
+                cluster.count_replica(node, request.get('TableName'),
+                                      request.get(self._KEYED_FIELDS[operation]))
+            response = cluster.store.handle(operation, request)
+        except FakeAlternatorError as e:
+            self._send_error(e)
+            return
+        except (KeyError, TypeError, AttributeError, StopIteration) as e:
+            self._send_error(_validation(f"Malformed request: {e!r}"))
+            return
+        self._send(200, response)
+
+
+class FakeAlternatorCluster:
+    """
+    Local stand-in for an Alternator cluster, for benchmarking and testing
+    AlternatorLB without the docker-compose cluster. Every node is an HTTP
+    listener on its own loopback address (127.0.0.1, 127.0.0.2, ... all
+    route to localhost on Linux) and the same port, serving:
+
+    - `/localnodes`, the listed nodes of the queried node's datacenter, or
+      of the `dc` and `rack` query parameters, like Alternator;
+    - `/storage_service/describe_ring/alternator_<table>` from the same
+      port, with `vnodes` random tokens per node and `replication_factor`
+      replicas per range (SimpleStrategy), so token-aware routing works
+      with Config(api_port=cluster.port);
+    - the DynamoDB JSON API, backed by a FakeStore shared by all nodes.
+      Requests are not authenticated.
+
+    Nodes join with add_node(); stop_node() makes one refuse connections
+    (dropping its open ones) while /localnodes keeps listing it until
+    `delist_after` seconds pass, like a crash before gossip notices;
+    start_node() brings it back and remove_node() decommissions it. Latency
+    and errors are injected per node, see FakeNode.
+
+    How to use:
+    ```
+        with FakeAlternatorCluster(nodes=3) as cluster:
+            lb = AlternatorLB(Config(nodes=cluster.seeds(), port=cluster.port))
+            cluster.nodes[0].latency = exponential_latency(0.005)
+            cluster.stop_node(cluster.nodes[1], delist_after=2.0)
+    ```
+
+    Or as a separate process: `python alternator_fake_cluster.py --nodes 5`.
+    """
+
+    def __init__(self, nodes: int = 3, port: int = 18000, racks: List[str] = None,
+                 datacenter: str = 'DC1', vnodes: int = 16, replication_factor: int = 3,
+                 address_prefix: str = '127.0.0.', track_replicas: bool = False):
+        self.port = port
+        self.store = FakeStore()
+        self.nodes: List[FakeNode] = []
+        self.track_replicas = track_replicas
+        self._racks = racks or ['rack1']
+        self._datacenter = datacenter
+        self._vnodes = vnodes
+        self._replication_factor = replication_factor
+        self._address_prefix = address_prefix
+        self._lock = threading.RLock()
+        self._ring = None
+        for i in range(nodes):
+            self.add_node(rack=self._racks[i % len(self._racks)])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for node in self.nodes:
+            self._stop_listener(node)
+
+    def seeds(self) -> List[str]:
+        """Addresses of the listed nodes, for Config.nodes."""
+        return [node.address for node in self.nodes if node.listed]
+
+    def node(self, address: str) -> FakeNode:
+        return next(node for node in self.nodes if node.address == address)
+
+    def add_node(self, rack: str = None, datacenter: str = None) -> FakeNode:
+        """Starts a new node on the next loopback address and lists it, like a node joining."""
+        with self._lock:
+            address = f"{self._address_prefix}{len(self.nodes) + 1}"
+            rng = random.Random(address)
+            tokens = [rng.randrange(_MIN_TOKEN + 1, 1 << 63) for _ in range(self._vnodes)]
+            node = FakeNode(address, rack or self._racks[0], datacenter or self._datacenter, tokens)
+            self.nodes.append(node)
+            self._start_listener(node)
+            node.listed = True
+            self._ring = None
+        return node
+
+    def stop_node(self, node: FakeNode, delist_after: float = 0.0):
+        self._stop_listener(node)
+        if delist_after:
+            timer = threading.Timer(delist_after, self._delist_if_down, (node,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._delist(node)
+
+    def start_node(self, node: FakeNode):
+        with self._lock:
+            if not node.up:
+                self._start_listener(node)
+            node.listed = True
+            self._ring = None
+
+    def remove_node(self, node: FakeNode):
+        """Decommissions the node: unlisted first, then stopped."""
+        self._delist(node)
+        self._stop_listener(node)
+
+    def _delist(self, node: FakeNode):
+        with self._lock:
+            node.listed = False
+            self._ring = None
+
+    def _delist_if_down(self, node: FakeNode):
+        # Unless start_node() brought it back in the meantime.
+        with self._lock:
+            if not node.up:
+                self._delist(node)
+
+    def _start_listener(self, node: FakeNode):
+        server = ThreadingHTTPServer((node.address, self.port), _Handler)
+        server.daemon_threads = True
+        server.cluster = self
+        server.node = node
+        node.server = server
+        threading.Thread(target=server.serve_forever, daemon=True,
+                         name=f"fake-alternator-{node.address}").start()
+
+    def _stop_listener(self, node: FakeNode):
+        with self._lock:
+            (server, node.server) = (node.server, None)
+        if server is None:
+            return
+        server.shutdown()
+        server.server_close()
+        with node.lock:
+            connections = list(node.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def local_nodes(self, node: FakeNode, rack: str = None, datacenter: str = None) -> List[str]:
+        datacenter = datacenter or node.datacenter
+        with self._lock:
+            return [other.address for other in self.nodes
+                    if other.listed and other.datacenter == datacenter
+                    and (rack is None or other.rack == rack)]
+
+    def _token_ring(self):
+        # (sorted end tokens, replicas of the range ending at each) of the listed nodes.
+        with self._lock:
+            if self._ring is None:
+                owners = sorted((token, node.address) for node in self.nodes if node.listed
+                                for token in node.tokens)
+                distinct = len({address for (token, address) in owners})
+                replicas = []
+                for i in range(len(owners)):
+                    chosen = []
+                    j = i
+                    while len(chosen) < min(self._replication_factor, distinct):
+                        address = owners[j % len(owners)][1]
+                        if address not in chosen:
+                            chosen.append(address)
+                        j += 1
+                    replicas.append(chosen)
+                self._ring = ([token for (token, address) in owners], replicas)
+            return self._ring
+
+    def replicas(self, token: int) -> List[str]:
+        (end_tokens, replicas) = self._token_ring()
+        if not end_tokens:
+            return []
+        index = bisect.bisect_left(end_tokens, token)
+        return replicas[index % len(end_tokens)]
+
+    def describe_ring(self, keyspace: str) -> Optional[List[dict]]:
+        if not keyspace.startswith('alternator_') or keyspace[len('alternator_'):] not in self.store.tables:
+            return None
+        (end_tokens, replicas) = self._token_ring()
+        return [{
+            'start_token': str(end_tokens[i - 1]),
+            'end_token': str(end_tokens[i]),
+            'endpoints': replicas[i],
+        } for i in range(len(end_tokens))]
+
+    def count_replica(self, node: FakeNode, table_name: str, attributes: Optional[dict]):
+        table = self.store.tables.get(table_name)
+        if table is None or not attributes or table.hash_key not in attributes:
+            return
+        replica = node.address in self.replicas(table.token(attributes[table.hash_key]))
+        with node.lock:
+            node.keyed_requests += 1
+            node.replica_requests += replica
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Alternator cluster on loopback addresses.")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--racks", nargs="+", default=["rack1"])
+    parser.add_argument("--datacenter", default="DC1")
+    args = parser.parse_args()
+
+    with FakeAlternatorCluster(nodes=args.nodes, port=args.port, racks=args.racks,
+                               datacenter=args.datacenter) as cluster:
+        print(f"Serving {', '.join(f'{node.address}:{cluster.port}' for node in cluster.nodes)}",
+              flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+from urllib.parse import urlparse
+
+import urllib3
+
+from alternator_governor import READ_OPERATIONS
+from alternator_item_cache import WRITE_OPERATIONS
+
+_TARGET_PREFIX = 'DynamoDB_20120810.'
+_CONTENT_TYPE = 'application/x-amz-json-1.0'
+_RETRYABLE_ERRORS = frozenset((
+    'ProvisionedThroughputExceededException', 'ThrottlingException',
+    'RequestLimitExceeded', 'InternalServerError', 'ServiceUnavailable'))
+
+_exceptions = None
+_exceptions_lock = threading.Lock()
+
+
+def _encode_binary(value):
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _client_exceptions():
+    """DynamoDB's modeled error classes, built once from the botocore service model."""
+    global _exceptions
+    with _exceptions_lock:
+        if _exceptions is None:
+            import botocore.session
+            from botocore.errorfactory import ClientExceptionsFactory
+
+            model = botocore.session.get_session().get_service_model('dynamodb')
+            _exceptions = ClientExceptionsFactory().create_client_exceptions(model)
+        return _exceptions
+
+
+def _decode_binary(obj: dict):
+    if len(obj) == 1:
+        if 'B' in obj and isinstance(obj['B'], str):
+            return {'B': base64.b64decode(obj['B'])}
+        if 'BS' in obj and isinstance(obj['BS'], list):
+            return {'BS': [base64.b64decode(value) for value in obj['BS']]}
+    return obj
+
+
+class FastDynamoDBClient:
+    """
+    Minimal DynamoDB JSON client for the hot path: get_item, put_item,
+    update_item, delete_item, query, scan, batch_write_item and
+    batch_get_item, with the same keyword arguments and response shape as
+    the botocore client (minus ResponseMetadata).
+
+    Requests skip botocore's model-driven validation, serialization, event
+    hooks and parsing: the parameters are dumped to JSON as given and posted
+    through the urllib3 pools AlternatorLB keeps for discovery, to a node
+    picked by the LB's selection policy (token-aware routing, pinned nodes
+    and circuit breakers included), within the LB's throughput limits. Node
+    statistics and sampled traces are fed the same way as for patched
+    botocore clients, and writes drop the items they touch from the LB's
+    item cache. Parameters are not validated, a malformed request is
+    rejected by Alternator with a ValidationException.
+
+    Errors are raised as the same botocore exceptions a botocore client
+    raises (EndpointConnectionError, ..., and for error responses the
+    modeled ClientError subclasses such as ConditionalCheckFailedException,
+    also reachable as `client.exceptions.ConditionalCheckFailedException`),
+    so existing `except` clauses keep working. Connection errors, 5xx responses and throttling
+    are retried on another node with the LB's NodeAwareRetries settings
+    (Config.retry_max_attempts, retry_backoff and retry_max_backoff), within
+    the retry budget the LB shares with its botocore clients.
+
+    Requests are signed with SigV4 using the LB's credentials unless `sign`
+    is False, which is fine when Alternator does not enforce authorization.
+
+    How to use:
+    ```
+        dynamodb = lb.new_fast_dynamodb_client()
+        dynamodb.put_item(TableName='test_table', Item={'id': {'N': '1'}})
+        item = dynamodb.get_item(TableName='test_table', Key={'id': {'N': '1'}}).get('Item')
+    ```
+    """
+    def __init__(self, lb, key: str = "", secret: str = "", region: str = "",
+                 sign: bool = True):
+        config = lb._config
+        self._lb = lb
+        self._key = key or config.aws_access_key_id
+        self._secret = secret or config.aws_secret_access_key
+        self._region = region or config.aws_region_name
+        self._sign = sign
+        self._pools = {}
+        self._signing_key = (None, None)
+
+    @property
+    def exceptions(self):
+        return _client_exceptions()
+
+    def get_item(self, **kwargs) -> dict:
+        return self._call('GetItem', kwargs)
+
+    def put_item(self, **kwargs) -> dict:
+        return self._call('PutItem', kwargs)
+
+    def update_item(self, **kwargs) -> dict:
+        return self._call('UpdateItem', kwargs)
+
+    def delete_item(self, **kwargs) -> dict:
+        return self._call('DeleteItem', kwargs)
+
+    def query(self, **kwargs) -> dict:
+        return self._call('Query', kwargs)
+
+    def scan(self, **kwargs) -> dict:
+        return self._call('Scan', kwargs)
+
+    def batch_write_item(self, **kwargs) -> dict:
+        return self._call('BatchWriteItem', kwargs)
+
+    def batch_get_item(self, **kwargs) -> dict:
+        return self._call('BatchGetItem', kwargs)
+
+    def _pool(self, node: str):
+        pool = self._pools.get(node)
+        if pool is None:
+            parsed = urlparse(node)
+            pool = self._pools[node] = (self._lb._get_connection_pool(parsed), parsed.netloc)
+        return pool
+
+    def _call(self, operation: str, params: dict) -> dict:
+        cache = self._lb._item_cache
+        if cache is None or operation not in WRITE_OPERATIONS:
+            return self._request(operation, params)
+        # Like the hooks of patched botocore clients: drop the items before the
+        # write is sent and again once it completed, so the LB's item cache
+        # does not keep serving what it replaced.
+        cache.invalidate(operation, params)
+        try:
+            return self._request(operation, params)
+        finally:
+            cache.invalidate(operation, params)
+
+    def _request(self, operation: str, params: dict) -> dict:
+        body = json.dumps(params, separators=(',', ':'), default=_encode_binary).encode('utf-8')
+        governor = self._lb._governor
+        charges = (governor.acquire(operation, params, self.exceptions)
+                   if governor is not None else None)
+        # Stands in for botocore's request context, to carry the concurrency
+        # slot the node was picked with.
+        context = {}
+        node = self._lb._next_alternator_node(operation, params, context)
+        self._lb._retries.budget.deposit()
+        tracer = self._lb._tracer
+        traced = tracer is not None and tracer.sample()
+        registry = self._lb._node_stats
+        tried = set()
+        attempt = 1
+        while True:
+            stats = registry.start(node, context)
+            start = time.perf_counter()
+            (response, error) = (None, None)
+            try:
+                (pool, host) = self._pool(node)
+                headers = {
+                    'Content-Type': _CONTENT_TYPE,
+                    'X-Amz-Target': _TARGET_PREFIX + operation,
+                }
+                if self._sign:
+                    self._add_signature(headers, host, body)
+                response = pool.urlopen('POST', '/', body=body, headers=headers,
+                                        retries=False, preload_content=True)
+            except urllib3.exceptions.HTTPError as e:
+                error = self._connection_error(node, e)
+            finally:
+                # Whatever ends the attempt, even an exception that propagates,
+                # so the node's in-flight count and concurrency slot come back.
+                failed = response is None or response.status >= 500
+                latency = time.perf_counter() - start
+                registry.on_complete(stats, latency, failed)
+
+            if response is not None and response.status == 200:
+                stats.breaker.on_success()
+                if traced:
+                    tracer.record(time.time() - latency, node, operation, attempt, latency, 200)
+                result = self._decode(response.data)
+                if charges and operation in READ_OPERATIONS:
+                    governor.settle(operation, params, result, charges)
+                return result
+            if failed:
+                stats.breaker.on_failure(time.monotonic())
+            else:
+                stats.breaker.on_success()
+            if response is not None:
+                error = self._client_error(operation, response)
+            if traced:
+                if response is not None:
+                    (status, code) = (response.status, error.response['Error']['Code'])
+                else:
+                    (status, code) = (0, type(error).__name__)
+                tracer.record(time.time() - latency, node, operation, attempt, latency, status, code)
+            retries = self._lb._retries
+            if not self._retryable(response, error) or not retries.allow(attempt):
+                raise error
+            time.sleep(retries.delay(attempt))
+            attempt += 1
+            tried.add(node)
+            node = self._lb._alternative_node(tried, operation, params, context) or node
+
+    @staticmethod
+    def _decode(data: bytes) -> dict:
+        if b'"B' in data:
+            return json.loads(data, object_hook=_decode_binary)
+        return json.loads(data)
+
+    @staticmethod
+    def _retryable(response, error) -> bool:
+        if response is None or response.status >= 500:
+            return True
+        return error.response['Error']['Code'] in _RETRYABLE_ERRORS
+
+    @staticmethod
+    def _connection_error(node: str, error: Exception):
+        from botocore import exceptions
+
+        if isinstance(error, urllib3.exceptions.NewConnectionError):
+            return exceptions.EndpointConnectionError(endpoint_url=node, error=error)
+        if isinstance(error, urllib3.exceptions.ConnectTimeoutError):
+            return exceptions.ConnectTimeoutError(endpoint_url=node, error=error)
+        if isinstance(error, urllib3.exceptions.ReadTimeoutError):
+            return exceptions.ReadTimeoutError(endpoint_url=node, error=error)
+        return exceptions.ConnectionClosedError(endpoint_url=node, error=error)
+
+    @staticmethod
+    def _client_error(operation: str, response):
+        try:
+            data = json.loads(response.data)
+        except ValueError:
+            data = {}
+        code = data.get('__type', '').rsplit('#', 1)[-1] or str(response.status)
+        message = data.get('message') or data.get('Message') or ''
+        return _client_exceptions().from_code(code)({
+            'Error': {'Code': code, 'Message': message},
+            'ResponseMetadata': {'HTTPStatusCode': response.status},
+        }, operation)
+
+    def _add_signature(self, headers: dict, host: str, body: bytes):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date = amz_date[:8]
+        (key_date, signing_key) = self._signing_key
+        if key_date != date:
+            signing_key = f"AWS4{self._secret}".encode('utf-8')
+            for part in (date, self._region, 'dynamodb', 'aws4_request'):
+                signing_key = hmac.new(signing_key, part.encode('utf-8'), hashlib.sha256).digest()
+            self._signing_key = (date, signing_key)
+
+        scope = f"{date}/{self._region}/dynamodb/aws4_request"
+        canonical_request = (
+            f"POST\n/\n\n"
+            f"content-type:{_CONTENT_TYPE}\nhost:{host}\n"
+            f"x-amz-date:{amz_date}\nx-amz-target:{headers['X-Amz-Target']}\n\n"
+            f"content-type;host;x-amz-date;x-amz-target\n"
+            f"{hashlib.sha256(body).hexdigest()}")
+        string_to_sign = (
+            f"AWS4-HMAC-SHA256\n{amz_date}\n{scope}\n"
+            f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}")
+        signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers['X-Amz-Date'] = amz_date
+        headers['Authorization'] = (
+            f"AWS4-HMAC-SHA256 Credential={self._key}/{scope}, "
+            f"SignedHeaders=content-type;host;x-amz-date;x-amz-target, Signature={signature}")
@@ -0,0 +1,311 @@
+import functools
+import math
+import threading
+import time
+
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+from alternator_coalescing import ReadCoalescer
+from alternator_item_cache import ItemCache
+
+READ_UNIT_BYTES = 4096
+WRITE_UNIT_BYTES = 1024
+
+READ_OPERATIONS = ('GetItem', 'Query', 'Scan', 'BatchGetItem')
+WRITE_OPERATIONS = ('PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems')
+
+
+@dataclass
+class ThroughputLimit:
+    """
+    Capacity units per second allowed for a table (or one operation on it),
+    0 meaning unlimited. Up to `burst_seconds` worth of unused units can be
+    spent at once.
+    """
+    read_units: float = 0.0
+    write_units: float = 0.0
+    burst_seconds: float = 1.0
+
+
+@dataclass
+class ThroughputStats:
+    read_units: float = 0.0
+    write_units: float = 0.0
+    throttled: int = 0
+    waited: float = 0.0
+
+
+def attribute_size(value: dict) -> int:
+    """Approximate stored size of a typed attribute value, as DynamoDB counts it."""
+    (kind, data) = next(iter(value.items()))
+    if kind == 'S':
+        return len(data.encode('utf-8'))
+    if kind == 'N':
+        return len(data.lstrip('-').replace('.', '')) // 2 + 1
+    if kind == 'B':
+        return len(data)
+    if kind in ('BOOL', 'NULL'):
+        return 1
+    if kind == 'SS':
+        return sum(len(item.encode('utf-8')) for item in data)
+    if kind == 'NS':
+        return sum(len(item.lstrip('-').replace('.', '')) // 2 + 1 for item in data)
+    if kind == 'BS':
+        return sum(len(item) for item in data)
+    if kind == 'L':
+        return 3 + sum(attribute_size(item) + 1 for item in data)
+    if kind == 'M':
+        return 3 + item_size(data) + len(data)
+    return 0
+
+
+def item_size(item: dict) -> int:
+    return sum(len(name.encode('utf-8')) + attribute_size(value) for (name, value) in item.items())
+
+
+def write_units(item: Optional[dict]) -> int:
+    return max(1, math.ceil(item_size(item) / WRITE_UNIT_BYTES)) if item else 1
+
+
+def read_units(size: int, consistent: bool) -> float:
+    units = max(1, math.ceil(size / READ_UNIT_BYTES))
+    return units if consistent else units / 2
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out capacity in arrival order. A caller reserves
+    its units right away, driving the balance negative if needed, and is
+    told how long to wait for the refill to cover it; later callers queue
+    behind that debt, so threads sharing a bucket are served first come,
+    first served and a big request can not be starved by small ones.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self._rate = rate
+        self._burst = max(burst, 1.0)
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, units: float, max_wait: float) -> Optional[float]:
+        """Reserves `units` and returns the wait in seconds, or None if it would exceed max_wait."""
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (units - self._tokens) / self._rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= units
+            return wait
+
+    def charge(self, units: float):
+        """Takes (or with a negative amount gives back) units without waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._burst, self._tokens - units)
+
+
+class ThroughputGovernor:
+    """
+    Client-side rate limit on the capacity units each table consumes, since
+    Alternator does not enforce ProvisionedThroughput.
+
+    Limits come from Config.throughput_limits, keyed by table name, or by
+    "table:Operation" for an extra limit on one operation (a Scan budget
+    inside the table's read budget, say). Writes are charged up front from
+    the item size (1 unit per KB, deletes and updates 1 unit). Reads are
+    charged one unit (half for eventually consistent reads) up front and
+    settled from the size of what came back (1 unit per 4KB).
+
+    With Config.throughput_mode "block" a request over the limit waits for
+    its units in arrival order; if the wait would be longer than
+    Config.throughput_max_wait, or in "reject" mode, it fails right away
+    with the client's ProvisionedThroughputExceededException, like a
+    throttled DynamoDB request.
+    """
+    _CONTEXT_KEY = 'alternator_governor'
+
+    def __init__(self, config):
+        if config.throughput_mode not in ("block", "reject"):
+            raise ValueError(
+                f"Unknown throughput mode: {config.throughput_mode}, expected 'block' or 'reject'")
+        self._max_wait = config.throughput_max_wait if config.throughput_mode == "block" else 0.0
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        for (name, limit) in config.throughput_limits.items():
+            for (kind, rate) in (('read', limit.read_units), ('write', limit.write_units)):
+                if rate:
+                    self._buckets[(name, kind)] = TokenBucket(rate, rate * limit.burst_seconds)
+        self._stats: Dict[str, ThroughputStats] = {}
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, ThroughputStats]:
+        with self._lock:
+            return {table: replace(stats) for (table, stats) in self._stats.items()}
+
+    def register_client_hooks(self, client):
+        events = client.meta.events
+        for operation in READ_OPERATIONS + WRITE_OPERATIONS:
+            events.register(f'provide-client-params.dynamodb.{operation}',
+                            functools.partial(self._on_params, exceptions=client.exceptions),
+                            unique_id=f'alternator-lb-governor-{operation}')
+        for operation in READ_OPERATIONS:
+            events.register(f'after-call.dynamodb.{operation}', self._on_after_call,
+                            unique_id=f'alternator-lb-governor-settle-{operation}')
+
+    def _on_params(self, params, model, context, exceptions=None, **kwargs):
+        if ItemCache.HIT_KEY in context:
+            # Served locally, Alternator does no work for it.
+            return
+        charges = self.acquire(model.name, params, exceptions)
+        if charges:
+            context[self._CONTEXT_KEY] = (params, charges)
+
+    def _on_after_call(self, http_response, parsed, model, context, **kwargs):
+        pending = context.pop(self._CONTEXT_KEY, None)
+        if pending is None:
+            return
+        if context.get(ReadCoalescer.FOLLOWER_KEY):
+            # Whether a read gets coalesced is only known once it is about to
+            # be sent, after it was charged: hand the units back, it was
+            # answered with an identical request's response.
+            self.refund(pending[0], pending[1])
+        elif http_response.status_code < 300:
+            self.settle(model.name, pending[0], parsed, pending[1])
+
+    @staticmethod
+    def _demand(operation: str, params: dict) -> List[Tuple[str, str, float]]:
+        # (table, 'read' or 'write', units) charged before the request is sent.
+        if operation in ('GetItem', 'Query', 'Scan'):
+            return [(params.get('TableName'), 'read',
+                     read_units(0, bool(params.get('ConsistentRead'))))]
+        if operation == 'BatchGetItem':
+            return [(table, 'read', len(request.get('Keys', [])) *
+                     read_units(0, bool(request.get('ConsistentRead'))))
+                    for (table, request) in params.get('RequestItems', {}).items()]
+        if operation == 'BatchWriteItem':
+            demand = []
+            for (table, requests) in params.get('RequestItems', {}).items():
+                units = sum(write_units(request.get('PutRequest', {}).get('Item'))
+                            for request in requests)
+                demand.append((table, 'write', units))
+            return demand
+        if operation == 'TransactWriteItems':
+            # Transactional writes cost twice the units of plain ones.
+            demand = []
+            for action in params.get('TransactItems', []):
+                for (kind, request) in action.items():
+                    if kind != 'ConditionCheck':
+                        demand.append((request.get('TableName'), 'write',
+                                       2 * write_units(request.get('Item'))))
+            return demand
+        return [(params.get('TableName'), 'write', write_units(params.get('Item')))]
+
+    def acquire(self, operation: str, params: dict,
+                exceptions=None) -> List[Tuple[TokenBucket, float]]:
+        """
+        Reserves the units `operation` needs up front, sleeping if the limit
+        calls for it. Returns the charges made, for settle(). A rejection is
+        raised as the ProvisionedThroughputExceededException of `exceptions`,
+        the calling client's modeled error classes (client.exceptions).
+        """
+        charges = []
+        # Units per (table, kind) and the longest wait of each table's buckets,
+        # so a table named by several items is recorded once, with all of them.
+        governed: Dict[Tuple[str, str], float] = {}
+        waits: Dict[str, float] = {}
+        for (table, kind, units) in self._demand(operation, params):
+            charged = False
+            for name in (table, f"{table}:{operation}"):
+                bucket = self._buckets.get((name, kind))
+                if bucket is None:
+                    continue
+                bucket_wait = bucket.reserve(units, self._max_wait)
+                if bucket_wait is None:
+                    for (charged_bucket, charged_units) in charges:
+                        charged_bucket.charge(-charged_units)
+                    self._record(table, throttled=1)
+                    raise self._throttled(operation, table, exceptions)
+                charges.append((bucket, units))
+                charged = True
+                waits[table] = max(waits.get(table, 0.0), bucket_wait)
+            if charged:
+                governed[(table, kind)] = governed.get((table, kind), 0.0) + units
+        for ((table, kind), units) in governed.items():
+            self._record(table, **{f"{kind}_units": units})
+        for (table, table_wait) in waits.items():
+            if table_wait:
+                self._record(table, waited=table_wait)
+        wait = max(waits.values(), default=0.0)
+        if wait:
+            time.sleep(wait)
+        return charges
+
+    def settle(self, operation: str, params: dict, response: dict,
+               charges: List[Tuple[TokenBucket, float]]):
+        """Charges the difference between the units a read used and what acquire() took."""
+        if operation == 'BatchGetItem':
+            # Charges were per table; settle each bucket by what its table returned.
+            used = {table: sum(read_units(item_size(item), bool(
+                        params['RequestItems'].get(table, {}).get('ConsistentRead')))
+                        for item in items)
+                    for (table, items) in response.get('Responses', {}).items()}
+            for table in params.get('RequestItems', {}):
+                used.setdefault(table, 0)
+            self._settle_batch(operation, params, charges, used)
+            return
+        consistent = bool(params.get('ConsistentRead'))
+        if operation == 'GetItem':
+            size = item_size(response['Item']) if 'Item' in response else 0
+        else:
+            size = sum(item_size(item) for item in response.get('Items', []))
+        used = read_units(size, consistent)
+        for (bucket, units) in charges:
+            bucket.charge(used - units)
+        self._record(params.get('TableName'), read_units=used - charges[0][1])
+
+    def refund(self, params: dict, charges: List[Tuple[TokenBucket, float]]):
+        """Gives back what acquire() took for a single-table read that sent nothing."""
+        for (bucket, units) in charges:
+            bucket.charge(-units)
+        self._record(params.get('TableName'), read_units=-charges[0][1])
+
+    def _settle_batch(self, operation: str, params: dict, charges, used: Dict[str, float]):
+        charged = iter(charges)
+        for (table, kind, units) in self._demand(operation, params):
+            settled = False
+            for name in (table, f"{table}:{operation}"):
+                if (name, kind) not in self._buckets:
+                    continue
+                (bucket, charged_units) = next(charged)
+                bucket.charge(used[table] - charged_units)
+                if not settled:
+                    self._record(table, read_units=used[table] - charged_units)
+                    settled = True
+
+    def _record(self, table: str, **deltas):
+        with self._lock:
+            stats = self._stats.get(table)
+            if stats is None:
+                stats = self._stats[table] = ThroughputStats()
+            for (name, delta) in deltas.items():
+                setattr(stats, name, getattr(stats, name) + delta)
+
+    @staticmethod
+    def _throttled(operation: str, table: str, exceptions=None):
+        if exceptions is not None:
+            error_class = exceptions.from_code('ProvisionedThroughputExceededException')
+        else:
+            from botocore.exceptions import ClientError as error_class
+
+        return error_class({
+            'Error': {
+                'Code': 'ProvisionedThroughputExceededException',
+                'Message': f"Client-side throughput limit of table {table} exceeded",
+            },
+            'ResponseMetadata': {'HTTPStatusCode': 400},
+        }, operation)
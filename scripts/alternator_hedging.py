@@ -0,0 +1,275 @@
+import collections
+import json
+import logging
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+
+from alternator_metrics import LoadBalancerMetrics
+from alternator_tracing import RequestTracer
+
+HEDGED_OPERATIONS = ('GetItem', 'Query', 'BatchGetItem')
+
+_UNSIGNED_HEADERS = ('authorization', 'x-amz-date', 'x-amz-security-token', 'host')
+
+
+class HedgeBudget:
+    """
+    Token bucket that caps hedges to `ratio` of the hedgeable requests: every
+    request deposits `ratio` tokens (up to `burst`), every hedge spends one.
+    """
+
+    def __init__(self, ratio: float, burst: float = 10.0):
+        self._ratio = ratio
+        self._burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._burst, self._tokens + self._ratio)
+
+    def available(self) -> bool:
+        return self._tokens >= 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class LatencyPercentile:
+    """
+    Sliding window of recent latencies of one operation, with the configured
+    percentile recomputed every `refresh_every` samples rather than per call.
+    """
+
+    def __init__(self, percentile: float, window: int = 1000, refresh_every: int = 100):
+        self._percentile = percentile
+        self._samples = collections.deque(maxlen=window)
+        self._refresh_every = refresh_every
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.value = None
+
+    def add(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+            self._pending += 1
+            if self._pending < self._refresh_every:
+                return
+            self._pending = 0
+            ordered = sorted(self._samples)
+            self.value = ordered[min(len(ordered) - 1, int(len(ordered) * self._percentile))]
+
+
+class HedgedReads:
+    """
+    Speculative retries for idempotent reads (GetItem, Query, BatchGetItem).
+
+    The request is sent to the node picked by the LB; if no response has
+    arrived after the hedge delay, a re-signed copy goes to a second live
+    node and whichever answers first is returned to botocore. The delay is
+    Config.hedge_delay seconds, or when that is 0 the Config.hedge_percentile
+    of recently observed latencies of the operation. Hedges are limited to
+    Config.hedge_budget_ratio of the hedgeable requests so a cluster-wide
+    slowdown cannot double the load.
+
+    A blocking send cannot be abandoned, so the primary has to run on a
+    worker thread for a hedge to be able to win. That hop is only paid when
+    a hedge could follow: without a delay estimate yet, with the budget
+    empty or with every worker busy, the primary is sent on the caller's
+    thread, so the worker cap never queues requests.
+
+    A hedge is recorded against the node it went to: its NodeStats, its
+    breaker and, for sampled calls, a trace record with the next attempt
+    number. When it wins, the primary's own response-received bookkeeping
+    (node stats, breaker, metrics, tracing) is moved off the call and
+    replayed with the primary's real outcome once it finishes, instead of
+    charging the hedge's response to the primary's node.
+
+    Installed on a client by AlternatorLB when Config.hedged_reads is set.
+    """
+    _logger = logging.getLogger('AlternatorLB')
+
+    def __init__(self, lb, config):
+        self._lb = lb
+        self._config = config
+        self._budget = HedgeBudget(config.hedge_budget_ratio)
+        self._latencies = {op: LatencyPercentile(config.hedge_percentile)
+                           for op in HEDGED_OPERATIONS}
+        self._workers = 2 * config.max_pool_connections
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._workers, thread_name_prefix='alternator-hedge')
+        self._busy = 0
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+        # before-send only gets the prepared request, so the request context
+        # is handed over from request-created, which runs on the same thread.
+        self._local = threading.local()
+
+    def register_client_hooks(self, client):
+        send = client._endpoint.http_session.send
+        signer = client._request_signer
+        events = client.meta.events
+        for operation in HEDGED_OPERATIONS:
+            events.register(
+                f'request-created.dynamodb.{operation}', self._on_request_created,
+                unique_id=f'alternator-lb-hedge-context-{operation}')
+            events.register(
+                f'before-send.dynamodb.{operation}',
+                lambda request, event_name, **kwargs: self._send(
+                    send, signer, events, request, event_name),
+                unique_id=f'alternator-lb-hedge-{operation}')
+
+    def _on_request_created(self, request, **kwargs):
+        self._local.context = getattr(request, 'context', None)
+
+    def _delay(self, operation: str) -> float:
+        if self._config.hedge_delay:
+            return self._config.hedge_delay
+        return self._latencies[operation].value
+
+    def _submit(self, fn, *args):
+        """Runs fn on a worker, or returns None when every worker is busy."""
+        with self._lock:
+            if self._busy >= self._workers:
+                return None
+            self._busy += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._lock:
+            self._busy -= 1
+
+    def _send(self, send, signer, events, request, event_name):
+        operation = event_name.rsplit('.', 1)[-1]
+        context = getattr(self._local, 'context', None)
+        self._local.context = None
+        if context is None:
+            context = {}
+        latencies = self._latencies[operation]
+        self._budget.deposit()
+        start = time.perf_counter()
+        delay = self._delay(operation)
+        primary = None
+        if delay is not None and self._budget.available():
+            primary = self._submit(send, request)
+        if primary is None:
+            response = send(request)
+            latencies.add(time.perf_counter() - start)
+            return response
+        try:
+            response = primary.result(timeout=delay)
+            latencies.add(time.perf_counter() - start)
+            return response
+        except FutureTimeoutError:
+            pass
+
+        parsed = urlparse(request.url)
+        registry = self._lb._node_stats
+        reservation = {}
+        node = self._lb._alternative_node({f"{parsed.scheme}://{parsed.netloc}"}, context=reservation)
+        hedge = None
+        if node is not None and not registry.get(node).over_limit() and self._budget.try_spend():
+            hedge = self._submit(self._send_copy, send, signer, request, operation, node,
+                                 reservation, self._trace_attempt(context))
+        if hedge is None:
+            registry.release(reservation)
+            response = primary.result()
+            latencies.add(time.perf_counter() - start)
+            return response
+        with self._lock:
+            self.hedges += 1
+
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            (done, pending) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                if future is hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                    self._finish_primary_later(primary, events, event_name, context)
+                latencies.add(time.perf_counter() - start)
+                return future.result()
+        raise error
+
+    def _trace_attempt(self, context: dict):
+        """The attempt number to trace the hedge of a sampled call as, None if not sampled."""
+        started = context.get(RequestTracer._CONTEXT_KEY)
+        if self._lb._tracer is None or not isinstance(started, tuple):
+            return None
+        return started[2] + 1
+
+    def _finish_primary_later(self, primary, events, event_name, context: dict):
+        keys = (self._lb._node_stats._CONTEXT_KEY, LoadBalancerMetrics._CONTEXT_KEY,
+                RequestTracer._CONTEXT_KEY)
+        detached = {key: context.pop(key) for key in keys if key in context}
+        event = 'response-received' + event_name[len('before-send'):]
+
+        def replay(future):
+            exception = future.exception()
+            response_dict = None
+            if exception is None:
+                response = future.result()
+                response_dict = {'status_code': response.status_code,
+                                 'headers': response.headers, 'body': response.content}
+            events.emit(event, context=detached, exception=exception,
+                        response_dict=response_dict, parsed_response=None)
+
+        primary.add_done_callback(replay)
+
+    def _send_copy(self, send, signer, request, operation: str, node: str, reservation: dict,
+                   trace_attempt=None):
+        from botocore.awsrequest import AWSRequest
+
+        headers = {}
+        for (name, value) in request.headers.items():
+            if name.lower() in _UNSIGNED_HEADERS:
+                continue
+            headers[name] = value.decode('utf-8') if isinstance(value, bytes) else value
+        copy = AWSRequest(
+            method=request.method,
+            url=node + urlparse(request.url).path,
+            data=request.body,
+            headers=headers)
+        signer.sign(operation, copy)
+        registry = self._lb._node_stats
+        stats = registry.start(node, reservation)
+        wall_start = time.time()
+        start = time.perf_counter()
+        (status, error) = (0, None)
+        try:
+            response = send(copy.prepare())
+            status = response.status_code
+            if status >= 400:
+                error = _error_code(response.content)
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            latency = time.perf_counter() - start
+            registry.finish(stats, latency, status == 0 or status >= 500)
+            if trace_attempt is not None:
+                self._lb._tracer.record(wall_start, node, operation, trace_attempt, latency,
+                                        status, error)
+
+
+def _error_code(body: bytes):
+    try:
+        return json.loads(body).get('__type', '').rsplit('#', 1)[-1] or None
+    except ValueError:
+        return None
@@ -0,0 +1,244 @@
+import collections
+import copy
+import json
+import sys
+import threading
+import time
+
+from dataclasses import dataclass, replace
+from typing import Dict
+
+WRITE_OPERATIONS = ('PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems')
+
+# Rough per-entry bookkeeping cost (LRU slot, entry tuple, expiry) on top
+# of the size of the cached response and its keys.
+_ENTRY_OVERHEAD = 256
+
+
+@dataclass
+class ItemCacheStats:
+    hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class _CachedHttpResponse:
+    status_code = 200
+    content = b''
+
+    def __init__(self):
+        # Per instance, a handler adding a header must not leak it into
+        # every other cached response.
+        self.headers = {}
+
+
+def _deep_size(value) -> int:
+    """Memory held by a parsed response: its containers, keys and values."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(key) + _deep_size(item) for (key, item) in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(item) for item in value)
+    return size
+
+
+def _encode_binary(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    raise TypeError(f"Unsupported value in key: {value!r}")
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=_encode_binary)
+
+
+class ItemCache:
+    """
+    Read-through cache of GetItem responses shared by every client patched
+    by one AlternatorLB.
+
+    Entries are kept per item in LRU order and expire after the table's TTL
+    (Config.item_cache_table_ttls, falling back to Config.item_cache_ttl; a
+    TTL of 0 disables caching for that table). The memory held by the cached
+    parsed responses and their keys is counted against
+    Config.item_cache_max_bytes and the least recently used items are
+    evicted to stay under it. Requests with ConsistentRead=True go
+    straight to the cluster.
+
+    PutItem, UpdateItem, DeleteItem, BatchWriteItem and TransactWriteItems
+    sent through a patched client drop the items they touch, both before
+    they are sent and once they complete. A GetItem whose table was written
+    to while it was in flight is not cached, so it can not put back the
+    value the write replaced. Writes from other clients or processes are
+    only seen once the TTL runs out.
+    """
+    HIT_KEY = 'alternator_item_cache_hit'
+    _MISS_KEY = 'alternator_item_cache_miss'
+    _WRITE_KEY = 'alternator_item_cache_write'
+
+    def __init__(self, config):
+        self._max_bytes = config.item_cache_max_bytes
+        self._default_ttl = config.item_cache_ttl
+        self._table_ttls = dict(config.item_cache_table_ttls)
+        # (table, item key) -> {request variant: (expires_at, size, response)}
+        self._items = collections.OrderedDict()
+        self._key_attributes: Dict[str, tuple] = {}
+        self._write_epochs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = ItemCacheStats()
+
+    def stats(self) -> ItemCacheStats:
+        with self._lock:
+            return replace(self._stats)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._stats.entries = 0
+            self._stats.bytes = 0
+
+    def register_client_hooks(self, client):
+        events = client.meta.events
+        events.register('provide-client-params.dynamodb.GetItem', self._on_get_params,
+                        unique_id='alternator-lb-item-cache-lookup')
+        events.register('before-call.dynamodb.GetItem', self._on_get_before_call,
+                        unique_id='alternator-lb-item-cache-serve')
+        events.register('after-call.dynamodb.GetItem', self._on_get_after_call,
+                        unique_id='alternator-lb-item-cache-store')
+        for operation in WRITE_OPERATIONS:
+            events.register(f'provide-client-params.dynamodb.{operation}', self._on_write,
+                            unique_id=f'alternator-lb-item-cache-invalidate-{operation}')
+            events.register(f'after-call.dynamodb.{operation}', self._on_write_done,
+                            unique_id=f'alternator-lb-item-cache-invalidated-{operation}')
+            events.register(f'after-call-error.dynamodb.{operation}', self._on_write_done,
+                            unique_id=f'alternator-lb-item-cache-invalidated-error-{operation}')
+
+    def _ttl(self, table: str) -> float:
+        return self._table_ttls.get(table, self._default_ttl)
+
+    def _on_get_params(self, params, context, **kwargs):
+        table = params.get('TableName')
+        key = params.get('Key')
+        if not table or not key or params.get('ConsistentRead') or not self._ttl(table):
+            with self._lock:
+                self._stats.bypassed += 1
+            return
+        item_key = (table, _canonical(key))
+        variant = _canonical({name: value for (name, value) in params.items()
+                              if name not in ('TableName', 'Key')})
+        now = time.monotonic()
+        with self._lock:
+            if table not in self._key_attributes:
+                self._key_attributes[table] = tuple(key)
+            variants = self._items.get(item_key)
+            entry = variants.get(variant) if variants is not None else None
+            if entry is not None and entry[0] > now:
+                self._items.move_to_end(item_key)
+                self._stats.hits += 1
+                context[self.HIT_KEY] = entry[2]
+                return
+            if entry is not None:
+                self._stats.expirations += 1
+                self._remove_variant(item_key, variant)
+            self._stats.misses += 1
+            context[self._MISS_KEY] = (item_key, variant, self._write_epochs.get(table, 0))
+
+    def _on_get_before_call(self, context, **kwargs):
+        response = context.get(self.HIT_KEY)
+        if response is None:
+            return None
+        return (_CachedHttpResponse(), copy.deepcopy(response))
+
+    def _on_get_after_call(self, http_response, parsed, context, **kwargs):
+        miss = context.pop(self._MISS_KEY, None)
+        if miss is None or http_response.status_code != 200:
+            return
+        (item_key, variant, epoch) = miss
+        size = (_deep_size(parsed) + sys.getsizeof(item_key[1]) + sys.getsizeof(variant)
+                + _ENTRY_OVERHEAD)
+        if size > self._max_bytes:
+            return
+        response = copy.deepcopy(parsed)
+        expires_at = time.monotonic() + self._ttl(item_key[0])
+        with self._lock:
+            if self._write_epochs.get(item_key[0], 0) != epoch:
+                return
+            self._remove_variant(item_key, variant)
+            self._items.setdefault(item_key, {})[variant] = (expires_at, size, response)
+            self._items.move_to_end(item_key)
+            self._stats.entries += 1
+            self._stats.bytes += size
+            while self._stats.bytes > self._max_bytes:
+                (_, evicted) = self._items.popitem(last=False)
+                self._stats.evictions += len(evicted)
+                self._forget(evicted)
+
+    def _remove_variant(self, item_key, variant):
+        variants = self._items.get(item_key)
+        if variants is None or variant not in variants:
+            return
+        self._forget({variant: variants.pop(variant)})
+        if not variants:
+            del self._items[item_key]
+
+    def _forget(self, variants: dict):
+        self._stats.entries -= len(variants)
+        self._stats.bytes -= sum(size for (_, size, _) in variants.values())
+
+    def _on_write(self, params, model, context, **kwargs):
+        context[self._WRITE_KEY] = (model.name, params)
+        self._invalidate(model.name, params)
+
+    def _on_write_done(self, context, **kwargs):
+        write = context.pop(self._WRITE_KEY, None)
+        if write is not None:
+            self._invalidate(*write)
+
+    def invalidate(self, operation: str, params: dict):
+        """Drops the items a write touches, for writes sent by other than a patched client."""
+        self._invalidate(operation, params)
+
+    def _invalidate(self, operation: str, params: dict):
+        targets = []
+        if operation == 'BatchWriteItem':
+            for (table, requests) in params.get('RequestItems', {}).items():
+                for request in requests:
+                    if 'PutRequest' in request:
+                        targets.append((table, None, request['PutRequest'].get('Item')))
+                    elif 'DeleteRequest' in request:
+                        targets.append((table, request['DeleteRequest'].get('Key'), None))
+        elif operation == 'TransactWriteItems':
+            for action in params.get('TransactItems', []):
+                for (kind, request) in action.items():
+                    if kind != 'ConditionCheck':
+                        targets.append((request.get('TableName'), request.get('Key'),
+                                        request.get('Item')))
+        else:
+            targets.append((params.get('TableName'), params.get('Key'), params.get('Item')))
+
+        with self._lock:
+            for (table, key, item) in targets:
+                self._write_epochs[table] = self._write_epochs.get(table, 0) + 1
+                if key is None and item is not None:
+                    # PutItem only has the whole item, take the key attributes
+                    # GetItem was called with. None known means nothing cached.
+                    attributes = self._key_attributes.get(table)
+                    if attributes is None or not all(name in item for name in attributes):
+                        continue
+                    key = {name: item[name] for name in attributes}
+                if key is None:
+                    continue
+                variants = self._items.pop((table, _canonical(key)), None)
+                if variants:
+                    self._stats.invalidations += len(variants)
+                    self._forget(variants)
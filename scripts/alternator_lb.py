@@ -1,17 +1,34 @@
+import collections
+import contextlib
 import ipaddress
+import itertools
 import json
+import random
 import threading
 import time
 import logging
+import weakref
 
-from typing import List
+from typing import Callable, Dict, List, Optional
 from urllib.parse import urlparse, urlunparse
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from concurrent.futures import ThreadPoolExecutor
 
 import urllib3
 from botocore import config
 
+from alternator_coalescing import CoalescingStats, ReadCoalescer
+from alternator_concurrency import CONCURRENCY_LIMITERS
+from alternator_fast_client import FastDynamoDBClient
+from alternator_governor import ThroughputGovernor, ThroughputLimit, ThroughputStats
+from alternator_hedging import HedgedReads
+from alternator_item_cache import ItemCache, ItemCacheStats
+from alternator_metrics import LoadBalancerMetrics, start_http_server
+from alternator_retries import NodeAwareRetries
+from alternator_token_ring import TokenRing, partition_key_token
+from alternator_topology_cache import TopologyCache
+from alternator_tracing import RequestTracer, TraceRecord
+
 
 class ExecutorPool:
     def __init__(self):
@@ -42,6 +59,479 @@ class ExecutorPool:
         return self._executor.submit(fn, *args, **kwargs)
 
 
+class CircuitBreaker:
+    """
+    Passive outlier detection for one node.
+
+    `failure_threshold` consecutive failed requests (connection errors,
+    timeouts or 5xx responses) open the breaker and take the node out of
+    rotation right away, without waiting for the next `/localnodes` poll.
+    Once the backoff has elapsed the breaker goes half-open and the next
+    request is let through as a probe: success closes the breaker, failure
+    opens it again with the backoff doubled, up to `max_backoff`. A probe
+    that never reports back (a call that ended before sending it) does not
+    keep the node out: after another backoff the next request probes.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, node: str, failure_threshold: int, backoff: float, max_backoff: float,
+                 on_transition: Callable[[str, str, str], None]):
+        self._node = node
+        self._failure_threshold = failure_threshold
+        self._base_backoff = backoff
+        self._max_backoff = max_backoff
+        self._on_transition = on_transition
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._backoff = backoff
+        self._retry_at = 0.0
+        self.state = self.CLOSED
+
+    def available(self, now: float) -> bool:
+        # Open with the backoff elapsed, or half-open with the probe overdue.
+        return self.state == self.CLOSED or now >= self._retry_at
+
+    def on_selected(self, now: float):
+        if self.state == self.CLOSED:
+            return
+        with self._lock:
+            if self.state != self.CLOSED and now >= self._retry_at:
+                self._retry_at = now + self._backoff
+                if self.state == self.OPEN:
+                    self._transition(self.HALF_OPEN)
+
+    def on_success(self):
+        if self.state == self.CLOSED and not self._failures:
+            return
+        with self._lock:
+            self._failures = 0
+            self._backoff = self._base_backoff
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def on_failure(self, now: float):
+        if not self._failure_threshold:
+            return
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self._failures >= self._failure_threshold):
+                self._retry_at = now + self._backoff
+                self._backoff = min(self._backoff * 2, self._max_backoff)
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        (old, self.state) = (self.state, state)
+        self._on_transition(self._node, old, state)
+
+
+class NodeStats:
+    """
+    Per-node request statistics fed from completed requests of patched clients:
+    an exponentially weighted moving average of latency (seconds), the
+    number of requests currently in flight, the node's circuit breaker and,
+    with Config.concurrency_limiter, its adaptive concurrency limit.
+    """
+
+    def __init__(self, decay: float, breaker: CircuitBreaker, limiter=None):
+        self._decay = decay
+        self._lock = threading.Lock()
+        self.latency_ewma = 0.0
+        self.in_flight = 0
+        self.completed = 0
+        self.breaker = breaker
+        self.limiter = limiter
+
+    def on_start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def on_cancel(self):
+        # A slot reserved by NodeStatsRegistry.select() whose request was never sent.
+        with self._lock:
+            self.in_flight -= 1
+
+    def on_complete(self, latency: float, failed: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            if self.completed == 1:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self._decay * (latency - self.latency_ewma)
+            if self.limiter is not None:
+                self.limiter.on_sample(latency, self.in_flight + 1, failed)
+
+    def has_capacity(self) -> bool:
+        return self.limiter is None or self.in_flight < self.limiter.limit
+
+    def over_limit(self) -> bool:
+        return self.limiter is not None and self.in_flight > self.limiter.limit
+
+    def cost(self) -> float:
+        # Expected wait of a new request: every request already queued on the
+        # node, plus the new one, takes about one EWMA latency to serve.
+        return self.latency_ewma * (self.in_flight + 1)
+
+
+class _Reservation:
+    """
+    A concurrency slot NodeStatsRegistry.select() took on a node for a
+    request about to be sent. The request's start takes it over; if the
+    request is never sent it is handed back, at the latest when the
+    request context holding it is dropped.
+    """
+    __slots__ = ('_registry', 'node', '_stats')
+
+    def __init__(self, registry: "NodeStatsRegistry", node: str, stats: NodeStats):
+        self._registry = registry
+        self.node = node
+        self._stats = stats
+
+    def take(self) -> bool:
+        (stats, self._stats) = (self._stats, None)
+        return stats is not None
+
+    def release(self):
+        (stats, self._stats) = (self._stats, None)
+        if stats is not None:
+            self._registry._release(stats)
+
+    def __del__(self):
+        # May run from the garbage collector in the middle of code holding
+        # the registry's locks, so only queue the slot to be handed back.
+        (stats, self._stats) = (self._stats, None)
+        if stats is not None:
+            self._registry._abandoned.append(stats)
+
+
+class NodeStatsRegistry:
+    """
+    Keeps NodeStats for every node a client has talked to and installs the
+    botocore event hooks that feed them. Works for botocore and aiobotocore
+    clients alike, both emit the same request events.
+    """
+    _CONTEXT_KEY = 'alternator_lb_started'
+    RESERVED_KEY = 'alternator_lb_reserved'
+    _logger = logging.getLogger('AlternatorLB')
+
+    def __init__(self, config: "Config"):
+        self._config = config
+        self._stats: Dict[str, NodeStats] = {}
+        self._ejected = set()
+        self._listeners = []
+        self._new_limiter = config._get_concurrency_limiter()
+        # Requests waiting for a node under its concurrency limit, oldest
+        # first, as (turn, candidate nodes); only the head of the queue is
+        # woken, when one of its nodes has a free slot.
+        self._queue = collections.deque()
+        self._queue_lock = threading.Lock()
+        self._abandoned = collections.deque()
+
+    def get(self, node: str) -> NodeStats:
+        stats = self._stats.get(node)
+        if stats is None:
+            breaker = CircuitBreaker(
+                node,
+                self._config.circuit_breaker_threshold,
+                self._config.circuit_breaker_backoff,
+                self._config.circuit_breaker_max_backoff,
+                self._on_transition)
+            limiter = self._new_limiter() if self._new_limiter is not None else None
+            stats = self._stats.setdefault(
+                node, NodeStats(self._config.latency_ewma_decay, breaker, limiter))
+        return stats
+
+    def select(self, policy, nodes: List[str], block: bool = True, context: dict = None) -> str:
+        """
+        Picks one of `nodes` with `policy`, skipping nodes with an open
+        circuit breaker. With a concurrency limiter and a `context` (the
+        request context, or any dict standing in for it) the pick also takes
+        a slot on the node, counted as in flight right away so concurrent
+        picks can not overrun the limit; start() takes the slot over when
+        the request is sent, release() hands it back when it is not.
+        """
+        if not self._ejected and self._new_limiter is None:
+            return policy.select(nodes, self)
+        now = time.monotonic()
+        if self._ejected:
+            # With every node ejected keep using all of them rather than failing
+            # outright; the breakers close again as soon as requests succeed.
+            nodes = [node for node in nodes if self.get(node).breaker.available(now)] or nodes
+        if self._new_limiter is None:
+            node = policy.select(nodes, self)
+        elif context is None:
+            # Nothing to carry the slot to the request, which counts itself
+            # once it is sent.
+            node = self._reserve(policy, nodes, block)
+            self._release(self.get(node))
+        else:
+            # A retry replaces the slot of the attempt before it.
+            self.release(context)
+            node = self._reserve(policy, nodes, block)
+            context[self.RESERVED_KEY] = _Reservation(self, node, self.get(node))
+        self.get(node).breaker.on_selected(now)
+        return node
+
+    def _reserve(self, policy, nodes: List[str], block: bool) -> str:
+        while self._abandoned:
+            try:
+                stats = self._abandoned.popleft()
+            except IndexError:
+                break
+            self._release(stats)
+        with self._queue_lock:
+            if not self._queue or not block:
+                available = [node for node in nodes if self.get(node).has_capacity()]
+                if available or not block:
+                    # Not blocking, an over the limit node still beats failing.
+                    return self._take(policy, available or nodes)
+            # Every node is at its limit, or other requests are already
+            # queued and go first. Wait in FIFO order for a slot, with both
+            # the queue length and the wait bounded.
+            if len(self._queue) >= self._config.concurrency_queue_size:
+                raise RuntimeError(
+                    f"All nodes are at their concurrency limit and {len(self._queue)} requests are queued")
+            entry = (threading.Event(), nodes)
+            self._queue.append(entry)
+            self._wake_head()
+        deadline = time.monotonic() + self._config.concurrency_queue_timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not entry[0].wait(remaining):
+                    raise RuntimeError(
+                        f"No node had spare concurrency within {self._config.concurrency_queue_timeout}s")
+                with self._queue_lock:
+                    available = [node for node in nodes if self.get(node).has_capacity()]
+                    if available:
+                        return self._take(policy, available)
+                    entry[0].clear()
+        finally:
+            with self._queue_lock:
+                self._queue.remove(entry)
+                # The next request in line may have room too: a slot this
+                # one gave up on, or a limit that grew.
+                self._wake_head()
+
+    def _take(self, policy, nodes: List[str]) -> str:
+        # Called with _queue_lock held.
+        node = policy.select(nodes, self)
+        self.get(node).on_start()
+        return node
+
+    def _wake_head(self):
+        # Called with _queue_lock held: hands a free slot to the oldest
+        # waiting request, and only to it.
+        if self._queue:
+            (turn, nodes) = self._queue[0]
+            if any(self.get(node).has_capacity() for node in nodes):
+                turn.set()
+
+    def start(self, node: str, context: dict) -> NodeStats:
+        """Counts a request to `node` as in flight, on the slot select() reserved for it if any."""
+        stats = self.get(node)
+        reservation = context.pop(self.RESERVED_KEY, None)
+        if reservation is not None:
+            if reservation.node == node and reservation.take():
+                return stats
+            reservation.release()
+        stats.on_start()
+        return stats
+
+    def release(self, context: dict):
+        """Hands back the slot select() reserved in `context`, if the request was never sent."""
+        reservation = context.pop(self.RESERVED_KEY, None)
+        if reservation is not None:
+            reservation.release()
+
+    def _release(self, stats: NodeStats):
+        stats.on_cancel()
+        self._slot_freed()
+
+    def on_complete(self, stats: NodeStats, latency: float, failed: bool):
+        stats.on_complete(latency, failed)
+        self._slot_freed()
+
+    def _slot_freed(self):
+        if self._queue:
+            with self._queue_lock:
+                self._wake_head()
+
+    def has_ejected(self) -> bool:
+        return bool(self._ejected)
+
+    def healthy_count(self, nodes: List[str]) -> int:
+        if not self._ejected:
+            return len(nodes)
+        now = time.monotonic()
+        return sum(1 for node in nodes if self.get(node).breaker.available(now))
+
+    def add_listener(self, listener: Callable[[str, str, str], None]):
+        self._listeners.append(listener)
+
+    def states(self) -> Dict[str, str]:
+        return {node: stats.breaker.state for (node, stats) in self._stats.items()}
+
+    def _on_transition(self, node: str, old: str, new: str):
+        if new == CircuitBreaker.CLOSED:
+            self._ejected.discard(node)
+        else:
+            self._ejected.add(node)
+        self._logger.warning(f"Node {node} circuit breaker {old} -> {new}")
+        for listener in self._listeners:
+            try:
+                listener(node, old, new)
+            except Exception as e:
+                self._logger.warning(f"Node state listener failed: {e}")
+
+    def snapshot(self) -> Dict[str, NodeStats]:
+        return dict(self._stats)
+
+    def prune(self, nodes: List[str]):
+        keep = set(nodes)
+        for node in list(self._stats):
+            if node not in keep:
+                self._stats.pop(node, None)
+                self._ejected.discard(node)
+
+    def register_client_hooks(self, client):
+        events = client.meta.events
+        events.register('request-created.dynamodb', self._on_request_created,
+                        unique_id='alternator-lb-stats-start')
+        events.register('response-received.dynamodb', self._on_response_received,
+                        unique_id='alternator-lb-stats-end')
+        # A coalesced or failed call may end without sending the request
+        # its node was picked for.
+        events.register('after-call.dynamodb', self._on_call_done,
+                        unique_id='alternator-lb-stats-release')
+        events.register('after-call-error.dynamodb', self._on_call_done,
+                        unique_id='alternator-lb-stats-release-error')
+
+    def _on_request_created(self, request, **kwargs):
+        context = getattr(request, 'context', None)
+        if context is None:
+            return
+        node = context.get('alternator_node')
+        if node is None:
+            return
+        self.start(node, context)
+        context[self._CONTEXT_KEY] = (node, time.perf_counter())
+
+    def _on_call_done(self, context, **kwargs):
+        self.release(context)
+
+    def _on_response_received(self, context, exception=None, response_dict=None, **kwargs):
+        started = context.pop(self._CONTEXT_KEY, None)
+        if started is None:
+            return
+        (node, start) = started
+        failed = exception is not None or (
+            response_dict is not None and response_dict.get('status_code', 0) >= 500)
+        self.finish(self.get(node), time.perf_counter() - start, failed)
+
+    def finish(self, stats: NodeStats, latency: float, failed: bool):
+        """Completes an attempt on the node of `stats`, its breaker included."""
+        self.on_complete(stats, latency, failed)
+        if failed:
+            stats.breaker.on_failure(time.monotonic())
+        else:
+            stats.breaker.on_success()
+
+
+class RoundRobinPolicy:
+    """Cycles through the live nodes regardless of how they perform."""
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def select(self, nodes: List[str], stats: NodeStatsRegistry) -> str:
+        return nodes[next(self._counter) % len(nodes)]
+
+
+class PowerOfTwoChoicesPolicy:
+    """
+    Samples two distinct live nodes at random and takes the one with the
+    lower expected wait (latency EWMA weighted by in-flight requests).
+    """
+
+    def select(self, nodes: List[str], stats: NodeStatsRegistry) -> str:
+        count = len(nodes)
+        if count == 1:
+            return nodes[0]
+        i = int(random.random() * count)
+        j = int(random.random() * (count - 1))
+        a = nodes[i]
+        b = nodes[j + 1 if j >= i else j]
+        return a if stats.get(a).cost() <= stats.get(b).cost() else b
+
+
+class LeastOutstandingPolicy:
+    """
+    Picks the live node with the fewest requests in flight, breaking ties by
+    latency EWMA. The scan starts at a rotating offset so idle nodes share
+    the load instead of the first one in the list taking all of it.
+    """
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def select(self, nodes: List[str], stats: NodeStatsRegistry) -> str:
+        offset = next(self._counter) % len(nodes)
+        best, best_key = None, None
+        for node in nodes[offset:] + nodes[:offset]:
+            node_stats = stats.get(node)
+            key = (node_stats.in_flight, node_stats.latency_ewma)
+            if best_key is None or key < best_key:
+                best, best_key = node, key
+        return best
+
+
+SELECTION_POLICIES = {
+    "round_robin": RoundRobinPolicy,
+    "power_of_two_choices": PowerOfTwoChoicesPolicy,
+    "least_outstanding": LeastOutstandingPolicy,
+}
+
+
+class _PinnedNode(threading.local):
+    node = None
+
+
+class NodeSnapshot:
+    """
+    Immutable, pre-parsed view of the live nodes. AlternatorLB replaces the
+    whole snapshot on refresh with a single attribute assignment, so the
+    request path reads it without taking any lock.
+
+    With tiered routing `tiers` holds the nodes of each routing tier (local
+    rack, rest of the local DC, then every remote DC), empty ones included so
+    a tier keeps its position, and `cumulative` the nodes of each tier
+    together with all the tiers before it. `local_capacity`
+    is the largest size the closest tier was seen with, carried over from the
+    previous snapshot, so nodes that dropped out of `/localnodes` still count
+    as lost capacity of that tier.
+    """
+    __slots__ = ('nodes', 'node_set', 'netlocs', 'tiers', 'cumulative', 'cumulative_sets',
+                 'local_capacity')
+
+    def __init__(self, nodes: List[str], tiers: List[List[str]] = None, local_capacity: int = 0):
+        self.local_capacity = max(local_capacity, len(tiers[0]) if tiers else 0)
+        self.nodes = tuple(nodes)
+        self.node_set = frozenset(self.nodes)
+        self.netlocs = {node: urlparse(node)[:2] for node in self.nodes}
+        self.tiers = tuple(tuple(tier) for tier in (tiers or [nodes]))
+        self.cumulative = tuple(
+            sum(self.tiers[:i + 1], ()) for i in range(len(self.tiers)))
+        self.cumulative_sets = tuple(frozenset(nodes) for nodes in self.cumulative)
+
+    def uri(self, node: str, path: str = "", query: str = "") -> str:
+        (scheme, netloc) = self.netlocs[node]
+        return f"{scheme}://{netloc}{path}?{query}" if query else f"{scheme}://{netloc}{path}"
+
+
 @dataclass
 class Config:
     nodes: List[str]
@@ -57,6 +547,64 @@ class Config:
     update_interval: int = 10
     connect_timeout: int = 3600
     max_pool_connections: int = 10
+    selection_policy: str = "round_robin"
+    latency_ewma_decay: float = 0.3
+    circuit_breaker_threshold: int = 3
+    circuit_breaker_backoff: float = 1.0
+    circuit_breaker_max_backoff: float = 60.0
+    token_aware: bool = False
+    api_port: int = 10000
+    tiered_routing: bool = False
+    remote_datacenters: List[str] = field(default_factory=list)
+    tier_spillover_ratio: float = 0.5
+    prewarm_connections: bool = False
+    prewarm_connect_timeout: float = 1.0
+    hedged_reads: bool = False
+    hedge_delay: float = 0.0
+    hedge_percentile: float = 0.95
+    hedge_budget_ratio: float = 0.05
+    concurrency_limiter: str = None
+    concurrency_min_limit: int = 1
+    concurrency_max_limit: int = 0
+    concurrency_queue_size: int = 1000
+    concurrency_queue_timeout: float = 1.0
+    metrics: bool = False
+    metrics_port: int = 0
+    topology_cache_path: str = None
+    item_cache: bool = False
+    item_cache_ttl: float = 1.0
+    item_cache_table_ttls: Dict[str, float] = field(default_factory=dict)
+    item_cache_max_bytes: int = 64 * 1024 * 1024
+    coalesce_reads: bool = False
+    throughput_limits: Dict[str, ThroughputLimit] = field(default_factory=dict)
+    throughput_mode: str = "block"
+    throughput_max_wait: float = 10.0
+    retry_max_attempts: int = 10
+    retry_backoff: float = 0.05
+    retry_max_backoff: float = 2.0
+    retry_budget_ratio: float = 0.2
+    retry_budget_min_per_second: float = 10.0
+    trace_sample_rate: float = 0.0
+    trace_buffer_size: int = 10000
+
+    def _get_selection_policy(self):
+        if not isinstance(self.selection_policy, str):
+            return self.selection_policy
+        policy = SELECTION_POLICIES.get(self.selection_policy)
+        if policy is None:
+            raise ValueError(
+                f"Unknown selection policy: {self.selection_policy}, expected one of {list(SELECTION_POLICIES)}")
+        return policy()
+
+    def _get_concurrency_limiter(self):
+        if not self.concurrency_limiter:
+            return None
+        limiter = CONCURRENCY_LIMITERS.get(self.concurrency_limiter)
+        if limiter is None:
+            raise ValueError(
+                f"Unknown concurrency limiter: {self.concurrency_limiter}, expected one of {list(CONCURRENCY_LIMITERS)}")
+        max_limit = self.concurrency_max_limit or self.max_pool_connections
+        return lambda: limiter(max_limit, self.concurrency_min_limit, max_limit)
 
     def _get_nodes(self) -> List[str]:
         nodes = []
@@ -78,8 +626,38 @@ class AlternatorLB:
     This class is responsible for:
     - Maintaining a list of live Alternator nodes.
     - Periodically updating the list of nodes by querying an endpoint.
-    - Providing methods to retrieve nodes in a round-robin manner.
+    - Providing methods to retrieve nodes through the configured selection policy
+      (round-robin by default, see SELECTION_POLICIES).
     - Ensuring compatibility with AWS DynamoDB clients by modifying endpoint resolution.
+    - Retrying failed requests on a different live node, with jittered backoff
+      and a retry budget shared by all clients, see NodeAwareRetries.
+    - Optionally (Config.tiered_routing) preferring the local rack, then the local
+      DC, then Config.remote_datacenters, spilling over to the next tier only when
+      less than Config.tier_spillover_ratio of the closer tier's capacity (the most
+      nodes it was seen with) is healthy.
+    - Optionally (Config.hedged_reads) hedging GetItem, Query and BatchGetItem to a
+      second node when the first one is slow to answer, see HedgedReads.
+    - Optionally (Config.token_aware) sending single-item requests straight to a
+      replica that owns the partition key, using the token ring reported by the
+      Scylla REST API on Config.api_port, to save the coordinator hop.
+    - Optionally (Config.concurrency_limiter) capping the requests in flight to
+      each node with a limit that adapts to its latency (AIMD or gradient);
+      nodes at their limit are skipped, and when all are the request waits
+      in a bounded queue.
+    - Optionally (Config.item_cache) serving repeated GetItem calls from a local
+      cache with per-table TTLs, see ItemCache.
+    - Optionally (Config.coalesce_reads) sharing one round-trip between identical
+      GetItem or Query calls in flight at the same time, see ReadCoalescer.
+    - Optionally (Config.throughput_limits) holding each table to a budget of
+      read and write capacity units per second, blocking or rejecting what
+      goes over it, see ThroughputGovernor.
+    - Optionally (Config.topology_cache_path) sharing the live node list with the
+      other processes on the host, see TopologyCache.
+    - Optionally (Config.metrics) collecting per node and operation Prometheus
+      metrics, served on Config.metrics_port, see LoadBalancerMetrics.
+    - Optionally (Config.trace_sample_rate) recording the node, operation,
+      latency and status of a sample of requests in a ring buffer of the last
+      Config.trace_buffer_size ones, see RequestTracer and get_traces().
 
     How to use:
     ```
@@ -98,6 +676,8 @@ class AlternatorLB:
 
     def __del__(self):
         self._pool.remove_ref()
+        if getattr(self, '_prewarm_executor', None) is not None:
+            self._prewarm_executor.shutdown(wait=False)
 
     def __init__(self, config: Config):
         self._pool.add_ref()
@@ -107,19 +687,49 @@ class AlternatorLB:
         if not self._config.nodes:
             raise ValueError("liveNodes cannot be null or empty")
 
-        self._initial_nodes = config._get_nodes()
-        self._live_nodes = self._initial_nodes[:]
+        self._initial_nodes = NodeSnapshot(config._get_nodes())
+        self._snapshot = self._initial_nodes
+        self._topology_cache = None
+        if config.topology_cache_path:
+            self._topology_cache = TopologyCache(
+                config.topology_cache_path, self._topology_cache_key())
+            entry = self._topology_cache.read()
+            if entry is not None:
+                self._snapshot = NodeSnapshot(entry.nodes, entry.tiers)
         self._live_nodes_lock = threading.Lock()
-        self._next_live_node_index = 0
+        self._next_live_node_index = itertools.count()
+        self._policy = config._get_selection_policy()
+        self._node_stats = NodeStatsRegistry(config)
+        self._partition_keys = {}
+        self._token_rings = {}
         self._updating = False
-        self._next_update_time = 0
+        # Set by a timer once update_interval has passed, so the request path
+        # only reads a flag instead of calling time.time() on every request.
+        self._refresh_due = bool(config.update_interval)
+        self._refresh_timer = None
+        self._prewarm_executor = None
+        self._pinned = _PinnedNode()
+        self._retries = NodeAwareRetries(self, config)
+        self._hedging = HedgedReads(self, config) if config.hedged_reads else None
+        self._item_cache = ItemCache(config) if config.item_cache else None
+        self._coalescer = ReadCoalescer() if config.coalesce_reads else None
+        self._governor = ThroughputGovernor(config) if config.throughput_limits else None
+        self._metrics = None
+        if config.metrics:
+            self._metrics = LoadBalancerMetrics()
+            if config.metrics_port:
+                start_http_server(config.metrics_port)
+        self._tracer = None
+        if config.trace_sample_rate:
+            self._tracer = RequestTracer(config.trace_sample_rate, config.trace_buffer_size)
+        self._clients = weakref.WeakSet()
 
     def _get_connection_pool(self, parsed):
         with self._conn_pools_lock:
             pool = self._conn_pools.get(parsed.netloc)
             if pool:
                 return pool
-            if self._config.schema == "http":
+            if parsed.scheme == "http":
                 pool = urllib3.HTTPConnectionPool(
                     host=parsed.hostname,
                     port=parsed.port,
@@ -146,51 +756,276 @@ class AlternatorLB:
             return False
 
     def _update_nodes_if_needed(self):
-        if self._updating or not self._config.update_interval:
-            return
-        now = time.time()
-        if self._next_update_time >= now:
+        if not self._refresh_due:
             return
         with self._live_nodes_lock:
-            if self._next_update_time >= now or self._updating:
+            if self._updating or not self._refresh_due:
                 return
             self._updating = True
+            self._refresh_due = False
         self._pool.submit(self._update_live_nodes)
 
-    def _next_alternator_node(self) -> str:
-        self._update_nodes_if_needed()
+    def _schedule_refresh(self):
+        if not self._config.update_interval:
+            return
+        ref = weakref.ref(self)
+
+        def mark_refresh_due():
+            lb = ref()
+            if lb is not None:
+                lb._refresh_due = True
+
+        # Only one timer is pending at a time, whatever the number of refreshes
+        # that finished, so they cannot pile up into parallel timer chains.
+        timer = threading.Timer(self._config.update_interval, mark_refresh_due)
+        timer.daemon = True
         with self._live_nodes_lock:
-            node = self._live_nodes[self._next_live_node_index % len(
-                self._live_nodes)]
-            self._next_live_node_index += 1
-            return node
+            (previous, self._refresh_timer) = (self._refresh_timer, timer)
+        if previous is not None:
+            previous.cancel()
+        timer.start()
 
-    def _next_as_uri(self, path: str = "", query: str = "") -> str:
-        if not self._live_nodes:
-            with self._live_nodes_lock:
-                self._live_nodes = self._initial_nodes[:]
+    def _next_alternator_node(self, operation: str = None, call_args: dict = None,
+                              context: dict = None) -> str:
+        self._update_nodes_if_needed()
+        pinned = self._pinned.node
+        if pinned is not None:
+            return pinned
+        (owners, nodes) = self._candidates(operation, call_args)
+        return self._node_stats.select(self._policy, owners or nodes, context=context)
+
+    def _candidates(self, operation: str = None, call_args: dict = None):
+        """The live replicas of the request's key (empty if not known) and the nodes of the tiers in use."""
+        snapshot = self._snapshot
+        if self._config.tiered_routing:
+            level = self._tier_level(snapshot)
+            nodes = snapshot.cumulative[level]
+            node_set = snapshot.cumulative_sets[level]
+        else:
+            nodes = snapshot.nodes
+            node_set = snapshot.node_set
+        owners = []
+        if self._config.token_aware and operation is not None:
+            owners = self._token_owners(operation, call_args, node_set)
+        return (owners, nodes)
+
+    def _tier_level(self, snapshot: NodeSnapshot) -> int:
+        # Stay in the closest tier while it has at least tier_spillover_ratio
+        # of its capacity healthy, otherwise widen to the next tier as well.
+        # Capacity is the largest size the tier was seen with, nodes that are
+        # down and no longer listed by /localnodes count as unhealthy.
+        if len(snapshot.tiers) == 1:
+            return 0
+        target = self._config.tier_spillover_ratio * snapshot.local_capacity
+        if (not self._node_stats.has_ejected() and snapshot.tiers[0]
+                and len(snapshot.tiers[0]) >= target):
+            return 0
+        healthy = 0
+        for (level, tier) in enumerate(snapshot.tiers):
+            healthy += self._node_stats.healthy_count(tier)
+            if healthy >= target and snapshot.cumulative[level]:
+                return level
+        return len(snapshot.tiers) - 1
+
+    def _alternative_node(self, tried, operation: str = None, call_args: dict = None,
+                          context: dict = None):
+        """
+        Picks a node for another attempt of a request already sent to the
+        `tried` nodes, from the same candidates as the first attempt: a
+        replica of the key if one is left, else a node of the tiers in use.
+        None if every candidate has been tried, or inside pinned_node(),
+        whose requests stay on the pinned node.
+        """
+        if self._pinned.node is not None:
+            return None
+        for candidates in self._candidates(operation, call_args):
+            nodes = [node for node in candidates if node not in tried]
+            if nodes:
+                return self._node_stats.select(self._policy, nodes, block=False, context=context)
+        return None
+
+    _KEYED_OPERATIONS = {
+        'GetItem': 'Key',
+        'DeleteItem': 'Key',
+        'UpdateItem': 'Key',
+        'PutItem': 'Item',
+    }
+
+    def _token_owners(self, operation: str, call_args: dict, live_nodes: frozenset) -> List[str]:
+        field = self._KEYED_OPERATIONS.get(operation)
+        if field is None or not call_args:
+            return []
+        table = call_args.get('TableName')
+        attributes = call_args.get(field)
+        if not table or not attributes:
+            return []
+
+        ring = self._token_rings.get(table)
+        if ring is None:
+            if table not in self._token_rings:
+                self._request_token_ring(table)
+            return []
+
+        key_name = self._partition_keys.get(table)
+        if key_name is None and field == 'Key' and len(attributes) == 1:
+            key_name = next(iter(attributes))
+        value = attributes.get(key_name) if key_name else None
+        if not value:
+            return []
+        try:
+            token = partition_key_token(value)
+        except ValueError:
+            return []
+        return [node for node in ring.replicas(token) if node in live_nodes]
 
-        node = None
+    def _request_token_ring(self, table: str):
+        # Rings are fetched by the regular refresh cycle, make the next
+        # request kick it off instead of waiting for update_interval.
         with self._live_nodes_lock:
-            node = self._live_nodes[self._next_live_node_index % len(
-                self._live_nodes)]
+            if table in self._token_rings:
+                return
+            self._token_rings = {**self._token_rings, table: None}
+            self._refresh_due = bool(self._config.update_interval)
+
+    def set_partition_key(self, table: str, attribute: str):
+        """
+        Declares the partition key attribute of a table for token-aware
+        routing. Not needed for tables whose DescribeTable or CreateTable went
+        through a patched client, or for requests whose Key holds only the
+        partition key.
+        """
+        self._partition_keys = {**self._partition_keys, table: attribute}
+
+    def _learn_key_schema(self, parsed, **kwargs):
+        table = parsed.get('Table') or parsed.get('TableDescription')
+        if not table or 'TableName' not in table:
+            return
+        for key in table.get('KeySchema', []):
+            if key.get('KeyType') == 'HASH':
+                self.set_partition_key(table['TableName'], key['AttributeName'])
 
-        self._next_live_node_index += 1
-        parsed = urlparse(node)
-        new_uri = urlunparse(
-            (parsed.scheme, parsed.netloc, path, "", query, ""))
-        return new_uri
+    def _next_as_uri(self, path: str = "", query: str = "") -> str:
+        snapshot = self._snapshot
+        node = snapshot.nodes[next(self._next_live_node_index) % len(snapshot.nodes)]
+        return snapshot.uri(node, path, query)
 
     def _update_live_nodes(self):
-        new_hosts = self._get_nodes(self._next_as_local_nodes_uri())
-        if new_hosts:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            if self._topology_cache is not None:
+                (new_hosts, tiers) = self._discover_shared()
+            else:
+                (new_hosts, tiers) = self._discover()
+            if new_hosts:
+                token_rings = self._fetch_token_rings()
+                # Refreshes don't overlap, so the capacity read here is current.
+                snapshot = NodeSnapshot(new_hosts, tiers, self._snapshot.local_capacity)
+                with self._live_nodes_lock:
+                    self._token_rings = {**self._token_rings, **token_rings}
+                    (old, self._snapshot) = (self._snapshot, snapshot)
+                self._node_stats.prune(new_hosts)
+                self._logger.debug(f"Updated hosts to {new_hosts}")
+                added = [node for node in new_hosts if node not in old.node_set]
+                if added and self._config.prewarm_connections:
+                    # Not on the shared refresh executor: connecting to a node
+                    # that is not reachable yet must not hold up refreshes.
+                    self._get_prewarm_executor().submit(
+                        self._prewarm_clients, list(self._clients), added)
+                outcome = "updated"
+            else:
+                outcome = "empty"
+        finally:
+            if self._metrics is not None:
+                self._metrics.observe_refresh(time.perf_counter() - start, outcome)
             with self._live_nodes_lock:
-                self._live_nodes = new_hosts
-                self._next_update_time = time.time() + self._config.update_interval
                 self._updating = False
-            self._logger.debug(f"Updated hosts to {self._live_nodes}")
+            self._schedule_refresh()
+
+    def _discover(self):
+        if self._config.tiered_routing:
+            tiers = self._discover_tiers()
+            return ([node for tier in tiers for node in tier], tiers)
+        return (self._get_nodes(self._next_as_local_nodes_uri()), None)
+
+    def _discover_shared(self):
+        # Only one process per host polls /localnodes when the shared entry is
+        # stale, the others keep using what is there until it is replaced.
+        cache = self._topology_cache
+        entry = cache.read()
+        if entry is not None and entry.age() < self._config.update_interval:
+            return (entry.nodes, entry.tiers)
+        with cache.refresh_lock() as owner:
+            if not owner and entry is not None:
+                return (entry.nodes, entry.tiers)
+            if owner:
+                entry = cache.read()
+                if entry is not None and entry.age() < self._config.update_interval:
+                    return (entry.nodes, entry.tiers)
+            (nodes, tiers) = self._discover()
+            if nodes and owner:
+                cache.write(nodes, tiers)
+            return (nodes, tiers)
+
+    def _topology_cache_key(self) -> str:
+        config = self._config
+        return json.dumps([config.schema, config.port, sorted(config.nodes), config.datacenter,
+                           config.rack, config.tiered_routing, config.remote_datacenters])
+
+    def _get_prewarm_executor(self) -> ThreadPoolExecutor:
+        with self._live_nodes_lock:
+            if self._prewarm_executor is None:
+                self._prewarm_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='alternator-prewarm')
+            return self._prewarm_executor
+
+    def _prewarm_clients(self, clients, nodes: List[str]):
+        for client in clients:
+            self._prewarm_connections(client, nodes)
+
+    def _prewarm_connections(self, client, nodes: List[str]):
+        """
+        Opens max_pool_connections keep-alive connections to each of `nodes`
+        in the client's own urllib3 pools, so the first requests to a node
+        do not pay for TCP and TLS setup. Connecting is bounded by
+        Config.prewarm_connect_timeout rather than the request timeout.
+        """
+        session = client._endpoint.http_session
+
+        def open_connections(node: str):
+            url = node + "/"
+            manager = session._get_connection_manager(
+                url, session._proxy_config.proxy_url_for(url))
+            pool = manager.connection_from_url(url)
+            session._setup_ssl_cert(pool, url, session._verify)
+            connections = []
+            try:
+                # Take them all out of the pool first, otherwise the same idle
+                # connection would be handed back every time.
+                for _ in range(self._config.max_pool_connections):
+                    connection = pool._get_conn()
+                    connections.append(connection)
+                    if connection.sock is None:
+                        timeout = connection.timeout
+                        connection.timeout = self._config.prewarm_connect_timeout
+                        try:
+                            connection.connect()
+                        finally:
+                            connection.timeout = timeout
+            except Exception as e:
+                self._logger.warning(f"Failed to prewarm connections to {node}: {e}")
+            finally:
+                for connection in connections:
+                    pool._put_conn(connection)
+
+        with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            list(executor.map(open_connections, nodes))
 
     def _get_nodes(self, uri: str) -> List[str]:
+        return self._fetch_nodes(uri) or []
+
+    def _fetch_nodes(self, uri: str) -> Optional[List[str]]:
+        """The nodes listed by `uri`, None if the node did not answer."""
         try:
             parsed = urlparse(uri)
             url = parsed.path
@@ -199,25 +1034,87 @@ class AlternatorLB:
             pool = self._get_connection_pool(parsed)
             response = pool.request("GET", url)
             if response.status != 200:
-                return []
+                self._logger.warning(f"Failed to fetch nodes from {uri}: HTTP {response.status}")
+                return None
 
             nodes = json.loads(response.data)
             return [self._host_to_uri(host) for host in nodes if host and self._validate_node(host)]
         except Exception as e:
             self._logger.warning(f"Failed to fetch nodes from {uri}: {e}")
-            return []
+            return None
+
+    def _fetch_token_rings(self):
+        token_rings = dict(self._token_rings)
+        for table in token_rings:
+            ring = self._fetch_token_ring(table)
+            if ring is not None:
+                token_rings[table] = ring
+        return token_rings
+
+    def _fetch_token_ring(self, table: str):
+        parsed = urlparse(self._next_as_uri())
+        uri = f"http://{parsed.hostname}:{self._config.api_port}/storage_service/describe_ring/alternator_{table}"
+        try:
+            parsed = urlparse(uri)
+            response = self._get_connection_pool(parsed).request("GET", parsed.path)
+            if response.status != 200:
+                self._logger.warning(
+                    f"Failed to fetch token ring from {uri}: HTTP {response.status}")
+                return None
+            return TokenRing.from_describe_ring(
+                json.loads(response.data), self._host_to_uri)
+        except Exception as e:
+            self._logger.warning(f"Failed to fetch token ring from {uri}: {e}")
+            return None
 
     def _host_to_uri(self, host: str) -> str:
         return f"{self._config.schema}://{host}:{self._config.port}"
 
-    def _next_as_local_nodes_uri(self) -> str:
+    @staticmethod
+    def _local_nodes_query(rack: str = None, datacenter: str = None) -> str:
         query = ""
+        if rack:
+            query += f"rack={rack}"
+        if datacenter:
+            query += ("&" if query else "") + f"dc={datacenter}"
+        return query
+
+    def _next_as_local_nodes_uri(self) -> str:
+        return self._next_as_uri("/localnodes", self._local_nodes_query(
+            self._config.rack, self._config.datacenter))
+
+    def _discover_tiers(self) -> List[List[str]]:
+        """
+        Fetches every routing tier with its own `/localnodes` query: the local
+        rack, the local DC and each of Config.remote_datacenters. A node is
+        only kept in the closest tier it shows up in. Each query is tried on
+        the known nodes in turn until one answers; if none does, the tier
+        keeps the nodes it had, rather than a failed fetch emptying it.
+        """
+        queries = []
         if self._config.rack:
-            query += f"rack={self._config.rack}"
-        if self._config.datacenter:
-            query += ("&" if query else "") + f"dc={self._config.datacenter}"
+            queries.append(self._local_nodes_query(
+                self._config.rack, self._config.datacenter))
+        queries.append(self._local_nodes_query(None, self._config.datacenter))
+        for datacenter in self._config.remote_datacenters:
+            queries.append(self._local_nodes_query(None, datacenter))
 
-        return self._next_as_uri("/localnodes", query)
+        previous = self._snapshot.tiers
+        if len(previous) != len(queries):
+            previous = [()] * len(queries)
+        tiers = []
+        seen = set()
+        for (level, query) in enumerate(queries):
+            nodes = None
+            for _ in range(len(self._snapshot.nodes)):
+                nodes = self._fetch_nodes(self._next_as_uri("/localnodes", query))
+                if nodes is not None:
+                    break
+            if nodes is None:
+                nodes = list(previous[level])
+            tiers.append([node for node in nodes if node not in seen])
+            seen.update(nodes)
+        return tiers
 
     def check_if_rack_and_datacenter_set_correctly(self):
         if not self._config.rack and not self._config.datacenter:
@@ -241,8 +1138,60 @@ class AlternatorLB:
         return len(hosts_with_fake_rack) != len(hosts_without_rack)
 
     def get_known_nodes(self):
-        with self._live_nodes_lock:
-            return self._live_nodes[:]
+        return list(self._snapshot.nodes)
+
+    @contextlib.contextmanager
+    def pinned_node(self, node: str):
+        """
+        Sends every request the current thread makes through a patched client
+        inside the block to `node` (one of get_known_nodes()), bypassing the
+        selection policy.
+        """
+        previous = self._pinned.node
+        self._pinned.node = node
+        try:
+            yield
+        finally:
+            self._pinned.node = previous
+
+    def get_node_stats(self) -> Dict[str, NodeStats]:
+        return self._node_stats.snapshot()
+
+    def get_node_states(self) -> Dict[str, str]:
+        """Circuit breaker state (closed, open or half_open) of every known node."""
+        return self._node_stats.states()
+
+    def get_item_cache_stats(self) -> ItemCacheStats:
+        if self._item_cache is None:
+            return ItemCacheStats()
+        return self._item_cache.stats()
+
+    def get_coalescing_stats(self) -> CoalescingStats:
+        if self._coalescer is None:
+            return CoalescingStats()
+        return self._coalescer.stats()
+
+    def get_throughput_stats(self) -> Dict[str, ThroughputStats]:
+        """Capacity units consumed, requests throttled and seconds waited, per table."""
+        if self._governor is None:
+            return {}
+        return self._governor.stats()
+
+    def get_traces(self) -> List[TraceRecord]:
+        """The sampled requests still in the trace buffer, oldest first."""
+        if self._tracer is None:
+            return []
+        return self._tracer.records()
+
+    def dump_traces(self, file) -> int:
+        """Writes the sampled requests to `file` as JSON lines, returns how many."""
+        if self._tracer is None:
+            return 0
+        return self._tracer.dump(file)
+
+    def add_node_state_listener(self, listener: Callable[[str, str, str], None]):
+        """Registers listener(node, old_state, new_state), called on every breaker transition."""
+        self._node_stats.add_listener(listener)
 
     def _init_botocore_config(self) -> config.Config:
         config_params = {
@@ -280,6 +1229,10 @@ class AlternatorLB:
         self._patch_dynamodb_client(ddb)
         return ddb
 
+    def new_fast_dynamodb_client(self, key: str = "", secret: str = "", region: str = "",
+                                 sign: bool = True) -> FastDynamoDBClient:
+        return FastDynamoDBClient(self, key, secret, region, sign=sign)
+
     def new_boto3_dynamodb_client(self, key: str = "", secret: str = "", region: str = ""):
         import boto3.session
 
@@ -328,11 +1281,42 @@ class AlternatorLB:
         ):
             from botocore.endpoint_provider import RuleSetEndpoint
             endpoint_info = orig(operation_model, call_args, request_context)
-            if "dynamodb." not in endpoint_info.url:
+            if "dynamodb." not in endpoint_info.url or ItemCache.HIT_KEY in request_context:
+                # Served from the item cache, no node is going to be contacted.
                 return endpoint_info
+            node = self._next_alternator_node(operation_model.name, call_args, request_context)
+            request_context['alternator_node'] = node
+            if self._config.token_aware:
+                # For retries to pick another replica of the key.
+                request_context[NodeAwareRetries.CALL_ARGS_KEY] = call_args
             return RuleSetEndpoint(
-                url=self._next_alternator_node(),
+                url=node,
                 properties=endpoint_info.properties,
                 headers=endpoint_info.headers)
 
-        setattr(current_resolver, 'construct_endpoint', construct_endpoint)
\ No newline at end of file
+        setattr(current_resolver, 'construct_endpoint', construct_endpoint)
+        self._node_stats.register_client_hooks(client)
+        self._retries.register_client_hooks(client)
+        if self._metrics is not None:
+            self._metrics.register_client_hooks(client)
+        if self._tracer is not None:
+            self._tracer.register_client_hooks(client)
+        if self._hedging is not None:
+            self._hedging.register_client_hooks(client)
+        if self._item_cache is not None:
+            self._item_cache.register_client_hooks(client)
+        if self._coalescer is not None:
+            # After the item cache, so cache hits never open a flight.
+            self._coalescer.register_client_hooks(client)
+        if self._governor is not None:
+            # After the item cache too, so cache hits are not charged, and
+            # reads answered by the coalescer are refunded.
+            self._governor.register_client_hooks(client)
+        if self._config.token_aware:
+            for operation in ('DescribeTable', 'CreateTable'):
+                client.meta.events.register(
+                    f'after-call.dynamodb.{operation}', self._learn_key_schema,
+                    unique_id=f'alternator-lb-key-schema-{operation}')
+        self._clients.add(client)
+        if self._config.prewarm_connections:
+            self._prewarm_connections(client, self.get_known_nodes())
\ No newline at end of file
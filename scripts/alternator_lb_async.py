@@ -0,0 +1,238 @@
+import asyncio
+import contextlib
+import json
+import logging
+
+from typing import Callable, Dict, List
+from urllib.parse import urlparse, urlunparse
+
+import aiohttp
+
+from alternator_lb import AlternatorLB, Config, NodeStats, NodeStatsRegistry
+
+
+class AsyncAlternatorLB:
+    """
+    asyncio counterpart of AlternatorLB for aiobotocore DynamoDB clients.
+
+    Node discovery runs as a task on the caller's event loop and talks to
+    `/localnodes` through a shared aiohttp connection pool, so nothing here
+    ever blocks the loop. Nodes are picked by the same selection policy as
+    AlternatorLB; since every coroutine runs on the same loop thread no
+    locking is needed around the live node list.
+
+    How to use:
+    ```
+        lb = AsyncAlternatorLB(Config(nodes=['x.x.x.x'], port=8080))
+        await lb.start()
+        async with lb.new_aiobotocore_dynamodb_client() as dynamodb:
+            await dynamodb.get_item(...)
+        await lb.close()
+    ```
+    """
+    _logger = logging.getLogger('AsyncAlternatorLB')
+
+    def __init__(self, config: Config):
+        self._config = config
+        if not self._config.nodes:
+            raise ValueError("liveNodes cannot be null or empty")
+
+        self._initial_nodes = config._get_nodes()
+        self._live_nodes = self._initial_nodes[:]
+        self._next_live_node_index = 0
+        self._policy = config._get_selection_policy()
+        self._node_stats = NodeStatsRegistry(config)
+        self._http = None
+        self._update_task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self):
+        if self._http is not None:
+            return
+        self._http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit_per_host=self._config.max_pool_connections,
+                ssl=False,
+            ),
+            # Bounded like the urllib3 pools of AlternatorLB (connect_timeout for
+            # connecting and for each read), and a refresh as a whole may not
+            # outlast the interval to the next one, so a hung node cannot stall
+            # the update loop.
+            timeout=aiohttp.ClientTimeout(
+                total=self._config.update_interval or None,
+                sock_connect=self._config.connect_timeout,
+                sock_read=self._config.connect_timeout),
+        )
+        await self._update_live_nodes()
+        if self._config.update_interval:
+            self._update_task = asyncio.create_task(self._update_loop())
+
+    async def close(self):
+        (task, self._update_task) = (self._update_task, None)
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        (http, self._http) = (self._http, None)
+        if http is not None:
+            await http.close()
+
+    async def _update_loop(self):
+        while True:
+            await asyncio.sleep(self._config.update_interval)
+            try:
+                await self._update_live_nodes()
+            except Exception as e:
+                self._logger.warning(f"Failed to update live nodes: {e}")
+
+    def _next_alternator_node(self, context: dict = None) -> str:
+        if not self._live_nodes:
+            self._live_nodes = self._initial_nodes[:]
+        # Never wait for concurrency here, that would block the event loop.
+        return self._node_stats.select(self._policy, self._live_nodes, block=False, context=context)
+
+    def _next_as_uri(self, path: str = "", query: str = "") -> str:
+        if not self._live_nodes:
+            self._live_nodes = self._initial_nodes[:]
+        node = self._live_nodes[self._next_live_node_index % len(
+            self._live_nodes)]
+        self._next_live_node_index += 1
+        parsed = urlparse(node)
+        return urlunparse(
+            (parsed.scheme, parsed.netloc, path, "", query, ""))
+
+    async def _update_live_nodes(self):
+        new_hosts = await self._get_nodes(self._next_as_local_nodes_uri())
+        if new_hosts:
+            self._live_nodes = new_hosts
+            self._node_stats.prune(new_hosts)
+            self._logger.debug(f"Updated hosts to {self._live_nodes}")
+
+    async def _get_nodes(self, uri: str) -> List[str]:
+        try:
+            async with self._http.get(uri) as response:
+                if response.status != 200:
+                    return []
+                nodes = json.loads(await response.read())
+            return [self._host_to_uri(host) for host in nodes
+                    if host and AlternatorLB._validate_node(host)]
+        except Exception as e:
+            self._logger.warning(f"Failed to fetch nodes from {uri}: {e}")
+            return []
+
+    def _host_to_uri(self, host: str) -> str:
+        return f"{self._config.schema}://{host}:{self._config.port}"
+
+    def _next_as_local_nodes_uri(self) -> str:
+        query = ""
+        if self._config.rack:
+            query += f"rack={self._config.rack}"
+        if self._config.datacenter:
+            query += ("&" if query else "") + f"dc={self._config.datacenter}"
+
+        return self._next_as_uri("/localnodes", query)
+
+    async def check_if_rack_and_datacenter_set_correctly(self):
+        if not self._config.rack and not self._config.datacenter:
+            return
+
+        nodes = await self._get_nodes(self._next_as_local_nodes_uri())
+        if not nodes:
+            raise ValueError(
+                "Node returned empty list, datacenter or rack are set incorrectly")
+
+    def get_known_nodes(self):
+        return self._live_nodes[:]
+
+    def get_node_stats(self) -> Dict[str, NodeStats]:
+        return self._node_stats.snapshot()
+
+    def get_node_states(self) -> Dict[str, str]:
+        return self._node_stats.states()
+
+    def add_node_state_listener(self, listener: Callable[[str, str, str], None]):
+        self._node_stats.add_listener(listener)
+
+    def _init_aiobotocore_config(self):
+        from aiobotocore.config import AioConfig
+
+        config_params = {
+            "tcp_keepalive": bool(self._config.max_pool_connections),
+            "connect_timeout": self._config.connect_timeout,
+            "max_pool_connections": self._config.max_pool_connections,
+        }
+        if self._config.client_cert_file:
+            if self._config.client_key_file:
+                config_params["client_cert"] = (
+                    self._config.client_cert_file, self._config.client_key_file)
+            else:
+                config_params["client_cert"] = self._config.client_cert_file
+        return AioConfig(**config_params)
+
+    @contextlib.asynccontextmanager
+    async def new_aiobotocore_dynamodb_client(self, key: str = "", secret: str = "", region: str = ""):
+        from aiobotocore.session import get_session
+
+        session = get_session()
+        if not secret:
+            secret = self._config.aws_secret_access_key
+        if not key:
+            key = self._config.aws_access_key_id
+        if not region:
+            region = self._config.aws_region_name
+
+        async with session.create_client(
+            'dynamodb',
+            region_name=region,
+            aws_access_key_id=key,
+            aws_secret_access_key=secret,
+            verify=False,
+            config=self._init_aiobotocore_config(),
+        ) as ddb:
+            self._patch_dynamodb_client(ddb)
+            yield ddb
+
+    def _patch_dynamodb_client(self, client):
+        from aiobotocore.regions import AioEndpointRulesetResolver
+
+        current_resolver = getattr(client, '_ruleset_resolver', None)
+        if not current_resolver:
+            raise Exception(
+                "looks like client is not an aiobotocore DynamoDB client, it has no _ruleset_resolver")
+        if current_resolver.__class__ != AioEndpointRulesetResolver:
+            raise Exception("client._ruleset_resolver has unexpected class.")
+
+        try:
+            if not client.meta.config.region_name:
+                raise ValueError(
+                    "client can't work properly with empty region name")
+        except AttributeError:
+            raise Exception(
+                "client has no meta.config.region_name, looks like it's not an aiobotocore DynamoDB client.")
+
+        orig = current_resolver.construct_endpoint
+
+        async def construct_endpoint(
+                operation_model,
+                call_args,
+                request_context,
+        ):
+            from botocore.endpoint_provider import RuleSetEndpoint
+            endpoint_info = await orig(operation_model, call_args, request_context)
+            if "dynamodb." not in endpoint_info.url:
+                return endpoint_info
+            node = self._next_alternator_node(request_context)
+            request_context['alternator_node'] = node
+            return RuleSetEndpoint(
+                url=node,
+                properties=endpoint_info.properties,
+                headers=endpoint_info.headers)
+
+        setattr(current_resolver, 'construct_endpoint', construct_endpoint)
+        self._node_stats.register_client_hooks(client)
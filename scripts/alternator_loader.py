@@ -0,0 +1,476 @@
+"""
+Bulk-loads a CSV or JSONL file into an Alternator table with parallel
+BatchWriteItem calls, and records how far it got in a checkpoint file so an
+interrupted load resumes where it stopped instead of starting over.
+
+    python alternator_loader.py users.csv --table users --types id=N age=N tags=SS
+    python alternator_loader.py events.jsonl --table events --nodes 10.1.0.3 --workers 32
+"""
+import argparse
+import base64
+import csv
+import json
+import logging
+import os
+import threading
+import time
+
+from dataclasses import asdict, dataclass
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from alternator_bulk import BATCH_WRITE_LIMIT, BulkWriter
+from alternator_lb import AlternatorLB, Config
+
+ATTRIBUTE_TYPES = ('S', 'N', 'B', 'BOOL', 'NULL', 'SS', 'NS', 'BS', 'L', 'M')
+FORMATS = ('csv', 'jsonl')
+
+_TRUE = {'true', 't', 'yes', 'y', '1'}
+_FALSE = {'false', 'f', 'no', 'n', '0'}
+
+
+def parse_types(specs: List[str]) -> Dict[str, str]:
+    """Parses `name=TYPE` column type declarations, e.g. ['id=N', 'tags=SS']."""
+    types = {}
+    for spec in specs:
+        (name, _, attribute_type) = spec.partition('=')
+        attribute_type = attribute_type.upper()
+        if not name or attribute_type not in ATTRIBUTE_TYPES:
+            raise ValueError(
+                f"Bad column type {spec!r}, expected name=TYPE with TYPE one of {list(ATTRIBUTE_TYPES)}")
+        types[name] = attribute_type
+    return types
+
+
+def _number(value) -> str:
+    if isinstance(value, bool):
+        raise ValueError(f"Not a number: {value!r}")
+    text = str(value).strip()
+    try:
+        if Decimal(text).is_finite():
+            return text
+    except InvalidOperation:
+        pass
+    raise ValueError(f"Not a number: {value!r}")
+
+
+def _boolean(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"Not a boolean: {value!r}")
+
+
+def _binary(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return base64.b64decode(value, validate=True)
+
+
+def _infer(value) -> dict:
+    # JSON value -> attribute of the matching DynamoDB type.
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, Decimal)):
+        return {'N': _number(value)}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, list):
+        return {'L': [_infer(element) for element in value]}
+    if isinstance(value, dict):
+        return {'M': {name: _infer(element) for (name, element) in value.items()}}
+    raise ValueError(f"Unsupported value: {value!r}")
+
+
+class ItemMapper:
+    """
+    Turns an input record (column name -> value) into a DynamoDB item.
+
+    Columns declared in `types` are converted to that attribute type:
+    numbers are checked, BOOL takes true/false/yes/no/1/0, B and BS take
+    base64, SS/NS/BS take a list or a string split on `set_separator`, and
+    L/M take JSON text. Undeclared CSV columns are strings; undeclared JSON
+    values map to their natural type (numbers to N, objects to M, ...). Empty
+    CSV fields and empty sets are left out of the item, a value that does
+    not convert raises ValueError.
+    """
+
+    def __init__(self, types: Dict[str, str] = None, set_separator: str = ';'):
+        self.types = dict(types or {})
+        for (name, attribute_type) in self.types.items():
+            if attribute_type not in ATTRIBUTE_TYPES:
+                raise ValueError(
+                    f"Unknown type {attribute_type} of column {name}, expected one of {list(ATTRIBUTE_TYPES)}")
+        self._separator = set_separator
+
+    def map(self, record: dict, text: bool = False) -> dict:
+        """`text` marks CSV records, whose values are all strings."""
+        item = {}
+        for (name, value) in record.items():
+            attribute_type = self.types.get(name)
+            if text and value == '':
+                continue
+            try:
+                if attribute_type is None:
+                    attribute = {'S': value} if text else _infer(value)
+                else:
+                    attribute = self._convert(attribute_type, value)
+            except ValueError as e:
+                raise ValueError(f"Column {name}: {e}") from None
+            if attribute is not None:
+                item[name] = attribute
+        return item
+
+    def _convert(self, attribute_type: str, value) -> Optional[dict]:
+        if value is None:
+            return {'NULL': True} if attribute_type == 'NULL' else None
+        if attribute_type == 'S':
+            return {'S': value if isinstance(value, str) else json.dumps(value, default=str)}
+        if attribute_type == 'N':
+            return {'N': _number(value)}
+        if attribute_type == 'B':
+            return {'B': _binary(value)}
+        if attribute_type == 'BOOL':
+            return {'BOOL': _boolean(value)}
+        if attribute_type == 'NULL':
+            return {'NULL': True}
+        if attribute_type in ('L', 'M'):
+            if isinstance(value, str):
+                value = json.loads(value, parse_float=Decimal)
+            if not isinstance(value, list if attribute_type == 'L' else dict):
+                raise ValueError(f"Not a {'list' if attribute_type == 'L' else 'map'}: {value!r}")
+            return _infer(value)
+        # A set: SS, NS or BS.
+        elements = value.split(self._separator) if isinstance(value, str) else value
+        if not isinstance(elements, list):
+            raise ValueError(f"Not a set: {value!r}")
+        convert = {'SS': str, 'NS': _number, 'BS': _binary}[attribute_type]
+        elements = list(dict.fromkeys(convert(element) for element in elements if element != ''))
+        return {attribute_type: elements} if elements else None
+
+
+def read_rows(file: BinaryIO, format: str, delimiter: str = ',') -> Iterator[Tuple[int, object]]:
+    """
+    Yields (offset, row) for every row of a CSV or JSONL file opened in
+    binary mode at a row boundary, where offset is the byte offset just past
+    the row and row the list of CSV fields or the JSON text. Reads one line
+    at a time; a quoted CSV field may span lines. Blank lines are skipped.
+    """
+    position = [file.tell()]
+
+    def lines():
+        for raw in file:
+            position[0] += len(raw)
+            yield raw.decode('utf-8')
+
+    if format == 'jsonl':
+        for text in lines():
+            if text.strip():
+                yield (position[0], text)
+    else:
+        for row in csv.reader(lines(), delimiter=delimiter):
+            if row:
+                yield (position[0], row)
+
+
+@dataclass
+class LoadCheckpoint:
+    """Progress of a load: every record before `offset` is in the table."""
+    source: str
+    offset: int
+    rows: int
+    skipped: int = 0
+    done: bool = False
+
+    @classmethod
+    def read(cls, path: str) -> Optional["LoadCheckpoint"]:
+        try:
+            with open(path) as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def write(self, path: str):
+        # Written aside and renamed, so a crash never leaves a torn checkpoint.
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(asdict(self), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+
+@dataclass
+class LoadStats:
+    rows: int = 0
+    items: int = 0
+    skipped: int = 0
+    batches: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    # Rows already loaded by the run(s) this one resumed.
+    resumed_rows: int = 0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+
+class _Watermark:
+    # Batches finish out of order; the checkpoint may only move past a batch
+    # once it and every batch before it are written. Saved every `interval`
+    # seconds under the same lock, so a save never sees a half-moved one.
+
+    def __init__(self, checkpoint: LoadCheckpoint, path: str, interval: float):
+        self.checkpoint = checkpoint
+        self._path = path
+        self._interval = interval
+        self._saved = time.monotonic()
+        self._lock = threading.Lock()
+        self._next = 0
+        self._submitted: Dict[int, Tuple[int, int, int]] = {}
+        self._written = set()
+
+    def submitted(self, sequence: int, offset: int, rows: int, skipped: int):
+        with self._lock:
+            self._submitted[sequence] = (offset, rows, skipped)
+
+    def written(self, sequence: int):
+        with self._lock:
+            self._written.add(sequence)
+            moved = False
+            while self._next in self._written:
+                self._written.discard(self._next)
+                (offset, rows, skipped) = self._submitted.pop(self._next)
+                (self.checkpoint.offset, self.checkpoint.rows, self.checkpoint.skipped) = (
+                    offset, rows, skipped)
+                self._next += 1
+                moved = True
+            if moved and self._interval and time.monotonic() - self._saved >= self._interval:
+                self.checkpoint.write(self._path)
+                self._saved = time.monotonic()
+
+
+class BulkLoader:
+    """
+    Streams a CSV or JSONL file into a table through a BulkWriter: records
+    are read one line at a time, mapped to items by an ItemMapper, grouped
+    into 25-item BatchWriteItem calls and written by `workers` threads,
+    with at most 2 * workers batches read ahead, so memory stays flat
+    whatever the file size.
+
+    Every `checkpoint_interval` seconds the byte offset up to which every
+    record is written goes to `checkpoint_path` (`<path>.checkpoint` by
+    default). load() starts from there when the checkpoint exists, so
+    after a crash at most the batches that were in flight are written
+    again; PutItem overwrites, so that is harmless. A finished load marks
+    the checkpoint done and is not repeated.
+
+    CSV files need a header row unless `columns` names the fields; JSONL
+    files hold one JSON object per line. Rows that fail to map (bad JSON, a
+    bad number, a missing key attribute, ...) stop the load with their row
+    number, or with `skip_invalid` are logged and counted. A key repeated
+    within a batch keeps its last record, as sequential puts would; the
+    same key in batches written concurrently may land in either order.
+
+    How to use:
+    ```
+        loader = BulkLoader(lb, 'users', 'users.csv', types={'id': 'N', 'age': 'N'})
+        stats = loader.load()
+        print(stats.rows, stats.items_per_second)
+    ```
+    """
+    _logger = logging.getLogger('AlternatorBulk')
+
+    def __init__(self, lb: AlternatorLB, table: str, path: str, format: str = None,
+                 types: Dict[str, str] = None, columns: List[str] = None, delimiter: str = ',',
+                 set_separator: str = ';', key_attributes: List[str] = None, workers: int = 0,
+                 client=None, checkpoint_path: str = None, checkpoint_interval: float = 10.0,
+                 skip_invalid: bool = False, report_interval: float = 10.0):
+        format = format or ('jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+        if format not in FORMATS:
+            raise ValueError(f"Unknown input format: {format}, expected one of {list(FORMATS)}")
+        self._lb = lb
+        self._table = table
+        self._path = path
+        self._format = format
+        self._columns = columns
+        self._delimiter = delimiter
+        self._mapper = ItemMapper(types, set_separator)
+        self._client = client or lb.new_botocore_dynamodb_client()
+        self._key_attributes = key_attributes
+        self._workers = workers
+        self._checkpoint_path = checkpoint_path or f"{path}.checkpoint"
+        self._checkpoint_interval = checkpoint_interval
+        self._skip_invalid = skip_invalid
+        self._report_interval = report_interval
+
+    def load(self, resume: bool = True) -> LoadStats:
+        """Loads the file, from the checkpoint if there is one and `resume` is set."""
+        key_attributes = self._key_attributes
+        if not key_attributes:
+            # FastDynamoDBClient has no DescribeTable.
+            describe = getattr(self._client, 'describe_table', None) or \
+                self._lb.new_botocore_dynamodb_client().describe_table
+            key_attributes = [key['AttributeName'] for key in
+                              describe(TableName=self._table)['Table']['KeySchema']]
+        checkpoint = LoadCheckpoint.read(self._checkpoint_path) if resume else None
+        if checkpoint is not None and checkpoint.source != os.path.abspath(self._path):
+            raise ValueError(f"Checkpoint {self._checkpoint_path} is for {checkpoint.source}, "
+                             f"not {os.path.abspath(self._path)}")
+        if checkpoint is not None and checkpoint.done:
+            self._logger.info(f"{self._path} was already loaded ({checkpoint.rows} rows)")
+            return LoadStats(resumed_rows=checkpoint.rows, skipped=checkpoint.skipped)
+
+        stats = LoadStats()
+        start = time.perf_counter()
+        with open(self._path, 'rb') as f:
+            columns = self._columns
+            data_start = 0
+            if self._format == 'csv' and columns is None:
+                columns = self._read_header(f)
+                data_start = f.tell()
+            if checkpoint is None:
+                checkpoint = LoadCheckpoint(os.path.abspath(self._path), data_start, 0)
+            else:
+                size = os.fstat(f.fileno()).st_size
+                if not data_start <= checkpoint.offset <= size:
+                    raise ValueError(f"Checkpoint offset {checkpoint.offset} is outside "
+                                     f"{self._path} ({size} bytes), was the file replaced?")
+                stats.resumed_rows = checkpoint.rows
+                self._logger.info(f"Resuming {self._path} at byte {checkpoint.offset}, "
+                                  f"{checkpoint.rows} rows already loaded")
+            f.seek(checkpoint.offset)
+            base_skipped = checkpoint.skipped
+            watermark = _Watermark(checkpoint, self._checkpoint_path, self._checkpoint_interval)
+            rows = read_rows(f, self._format, self._delimiter)
+            writer = BulkWriter(self._lb, self._table, workers=self._workers, client=self._client,
+                                report_interval=self._report_interval)
+            written = writer.write_batches(
+                self._batches(rows, columns, key_attributes, checkpoint, watermark, stats),
+                watermark.written)
+            # Every batch is written: the checkpoint covers the whole file,
+            # including invalid records after the last batch.
+            checkpoint.offset = f.tell()
+            checkpoint.rows = stats.resumed_rows + stats.rows
+            checkpoint.skipped = base_skipped + stats.skipped
+        checkpoint.done = True
+        checkpoint.write(self._checkpoint_path)
+        stats.items = written.items
+        stats.batches = written.batches
+        stats.retries = written.retries
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+    def _read_header(self, f: BinaryIO) -> List[str]:
+        line = f.readline().decode('utf-8-sig')
+        header = next(csv.reader([line], delimiter=self._delimiter), None)
+        if not header:
+            raise ValueError(f"{self._path} has no header row, pass the column names")
+        return header
+
+    def _record(self, row, columns: List[str]) -> dict:
+        if self._format == 'jsonl':
+            try:
+                record = json.loads(row, parse_float=Decimal)
+            except ValueError as e:
+                raise ValueError(f"not JSON: {e}") from None
+            if not isinstance(record, dict):
+                raise ValueError("not a JSON object")
+            return record
+        if len(row) != len(columns):
+            raise ValueError(f"{len(row)} fields, expected {len(columns)}")
+        return dict(zip(columns, row))
+
+    def _batches(self, rows, columns: List[str], key_attributes: List[str],
+                 checkpoint: LoadCheckpoint, watermark: _Watermark,
+                 stats: LoadStats) -> Iterator[Tuple[int, List[dict]]]:
+        (base_rows, base_skipped) = (checkpoint.rows, checkpoint.skipped)
+        batch: Dict[tuple, dict] = {}
+        sequence = 0
+        text = self._format == 'csv'
+        for (offset, row) in rows:
+            stats.rows += 1
+            try:
+                item = self._mapper.map(self._record(row, columns), text)
+                missing = [name for name in key_attributes if name not in item]
+                if missing:
+                    raise ValueError(f"no key attribute {', '.join(missing)}")
+            except ValueError as e:
+                message = f"{self._path} row {base_rows + stats.rows}: {e}"
+                if not self._skip_invalid:
+                    raise ValueError(message) from None
+                stats.skipped += 1
+                self._logger.warning(f"Skipping {message}")
+                continue
+            # A repeated key replaces the earlier record, BatchWriteItem
+            # refuses a batch holding the same key twice.
+            key = tuple(json.dumps(item[name], sort_keys=True, default=str) for name in key_attributes)
+            batch.pop(key, None)
+            batch[key] = item
+            if len(batch) == BATCH_WRITE_LIMIT:
+                watermark.submitted(sequence, offset, base_rows + stats.rows,
+                                    base_skipped + stats.skipped)
+                yield (sequence, list(batch.values()))
+                (batch, sequence) = ({}, sequence + 1)
+        if batch:
+            watermark.submitted(sequence, offset, base_rows + stats.rows,
+                                base_skipped + stats.skipped)
+            yield (sequence, list(batch.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="CSV or JSONL file")
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--nodes", nargs="+", default=['10.1.0.3'])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--datacenter", default="DC1")
+    parser.add_argument("--format", choices=FORMATS, help="by default from the file extension")
+    parser.add_argument("--types", nargs="+", default=[], metavar="NAME=TYPE",
+                        help=f"attribute type of a column, one of {', '.join(ATTRIBUTE_TYPES)}; "
+                             "CSV columns default to S, JSON values to their own type")
+    parser.add_argument("--columns", help="comma separated CSV column names, for files without a header")
+    parser.add_argument("--delimiter", default=",", help="CSV field delimiter")
+    parser.add_argument("--set-separator", default=";", help="separator of set elements in one field")
+    parser.add_argument("--key", nargs="+", help="key attributes, by default from DescribeTable")
+    parser.add_argument("--workers", type=int, default=0, help="concurrent batches, 2 per node by default")
+    parser.add_argument("--checkpoint", help="checkpoint file, PATH.checkpoint by default")
+    parser.add_argument("--checkpoint-interval", type=float, default=10.0, help="seconds")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and load from the start")
+    parser.add_argument("--skip-invalid", action="store_true",
+                        help="log and skip records that do not map to an item instead of stopping")
+    parser.add_argument("--fast-client", action="store_true", help="write with FastDynamoDBClient")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+    try:
+        types = parse_types(args.types)
+    except ValueError as e:
+        parser.error(str(e))
+    lb = AlternatorLB(Config(nodes=args.nodes, port=args.port, datacenter=args.datacenter,
+                             max_pool_connections=max(10, args.workers)))
+    client = lb.new_fast_dynamodb_client() if args.fast_client else lb.new_botocore_dynamodb_client()
+    loader = BulkLoader(
+        lb, args.table, args.path, format=args.format, types=types,
+        columns=args.columns.split(",") if args.columns else None, delimiter=args.delimiter,
+        set_separator=args.set_separator, key_attributes=args.key, workers=args.workers,
+        client=client, checkpoint_path=args.checkpoint,
+        checkpoint_interval=args.checkpoint_interval, skip_invalid=args.skip_invalid)
+    try:
+        stats = loader.load(resume=not args.restart)
+    except ValueError as e:
+        parser.exit(1, f"error: {e}\n")
+    print(f"{stats.rows} rows read, {stats.items} items written, {stats.skipped} skipped "
+          f"in {stats.elapsed:.2f} seconds ({stats.items_per_second:.0f} items/sec, "
+          f"{stats.retries} retries)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+# Each power of two of microseconds is split into this many linear buckets,
+# so a recorded value is off by less than 1%.
+_SUB_BUCKET_BITS = 7
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in the manner of HdrHistogram: values in
+    microseconds up to 256 are exact, larger ones fall in one of 128 linear
+    buckets per power of two, so percentiles keep 2 significant digits from
+    microseconds to minutes in a few KB. Not thread safe; give every thread
+    its own and merge() them.
+    """
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < 2 * _SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - _SUB_BUCKET_BITS - 1
+        return (shift + 1) * _SUB_BUCKETS + (value >> shift) - _SUB_BUCKETS
+
+    @staticmethod
+    def _value(index: int) -> int:
+        # Highest value that falls in the bucket, as HdrHistogram reports it.
+        if index < 2 * _SUB_BUCKETS:
+            return index
+        shift = index // _SUB_BUCKETS - 1
+        return ((index % _SUB_BUCKETS + _SUB_BUCKETS) << shift) + (1 << shift) - 1
+
+    def record(self, micros: int):
+        index = self._index(micros)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        if micros > self.max:
+            self.max = micros
+
+    def merge(self, other: "LatencyHistogram"):
+        for (index, count) in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile: float) -> int:
+        """Value at `percentile` (0-100) in microseconds, 0 when empty."""
+        if not self.count:
+            return 0
+        rank = max(1, round(self.count * percentile / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+
+@dataclass
+class IntervalReport:
+    """Throughput and latency (milliseconds, from the scheduled start) of one report interval."""
+    start: float
+    elapsed: float
+    ops: int
+    errors: int
+    ops_per_second: float
+    p50: float
+    p99: float
+    p999: float
+    max: float
+    # Largest delay of a scheduled start, a sign the driver itself can not keep up.
+    max_lag: float
+
+    @classmethod
+    def of(cls, start: float, elapsed: float, histogram: LatencyHistogram,
+           errors: int, max_lag: int) -> "IntervalReport":
+        return cls(
+            start=round(start, 3),
+            elapsed=round(elapsed, 3),
+            ops=histogram.count,
+            errors=errors,
+            ops_per_second=round(histogram.count / elapsed, 1) if elapsed > 0 else 0.0,
+            p50=histogram.percentile(50) / 1000,
+            p99=histogram.percentile(99) / 1000,
+            p999=histogram.percentile(99.9) / 1000,
+            max=histogram.max / 1000,
+            max_lag=max_lag / 1000)
+
+
+class _Recorder:
+    # One per worker thread: histograms keyed by the report interval in
+    # which the operation completed, collected by the reporter thread.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.intervals: Dict[int, list] = {}
+
+    def record(self, interval: int, micros: int, failed: bool, lag: int):
+        with self.lock:
+            entry = self.intervals.get(interval)
+            if entry is None:
+                entry = self.intervals[interval] = [LatencyHistogram(), 0, 0]
+            entry[0].record(micros)
+            entry[1] += failed
+            entry[2] = max(entry[2], lag)
+
+    def collect(self, before: int) -> List[list]:
+        with self.lock:
+            done = [self.intervals.pop(interval) for interval in list(self.intervals)
+                    if interval < before]
+        return done
+
+
+def _run_local(make_operation: Callable, rate: float, duration: float, threads: int,
+               interval: float, start_at: float, first_slot: int, stride: int,
+               emit: Callable[[int, LatencyHistogram, int, int], None]):
+    # Runs this process's share of the schedule, slots first_slot,
+    # first_slot + stride, ...; slot k is due start_at + k / rate seconds,
+    # whatever happened to earlier slots. Workers claim the next slot when
+    # they are free, so one stuck on a slow operation does not hold back
+    # the slots another worker could send on time.
+    operation = make_operation()
+    slots = int(rate * duration)
+    recorders = [_Recorder() for _ in range(threads)]
+    claims = itertools.count()
+
+    def worker(recorder: _Recorder):
+        while True:
+            slot = first_slot + next(claims) * stride
+            if slot >= slots:
+                return
+            due = start_at + slot / rate
+            now = time.monotonic()
+            if now < due:
+                time.sleep(due - now)
+                now = time.monotonic()
+            failed = False
+            try:
+                operation(slot)
+            except Exception:
+                failed = True
+            end = time.monotonic()
+            recorder.record(int((end - start_at) // interval), int((end - due) * 1e6),
+                            failed, int((now - due) * 1e6))
+
+    workers = [threading.Thread(target=worker, args=(recorder,), daemon=True)
+               for recorder in recorders]
+    for thread in workers:
+        thread.start()
+
+    def flush(before: int, report_as: int, final: bool = False):
+        histogram = LatencyHistogram()
+        (errors, lag) = (0, 0)
+        for recorder in recorders:
+            for (interval_histogram, interval_errors, interval_lag) in recorder.collect(before):
+                histogram.merge(interval_histogram)
+                errors += interval_errors
+                lag = max(lag, interval_lag)
+        if histogram.count or not final:
+            emit(report_as, histogram, errors, lag)
+
+    current = 0
+    while any(thread.is_alive() for thread in workers):
+        boundary = start_at + (current + 1) * interval
+        for thread in workers:
+            thread.join(max(0.0, boundary - time.monotonic()))
+        if time.monotonic() >= boundary:
+            current += 1
+            # Completions recorded just after the previous flush are carried
+            # into this report rather than lost.
+            flush(current, current - 1)
+    flush(current + 1, current, final=True)
+
+
+def _process_main(make_operation, rate, duration, threads, interval, start_at,
+                  first_slot, stride, results):
+    def emit(index, histogram, errors, lag):
+        results.put((index, histogram, errors, lag))
+
+    try:
+        _run_local(make_operation, rate, duration, threads, interval, start_at,
+                   first_slot, stride, emit)
+    finally:
+        results.put(None)
+
+
+def run_open_loop(make_operation: Callable[[], Callable[[int], object]], rate: float,
+                  duration: float, threads: int = 1, processes: int = 1,
+                  interval: float = 1.0, on_report: Optional[Callable[[IntervalReport], None]] = None,
+                  start_delay: float = 1.0) -> IntervalReport:
+    """
+    Drives `rate` operations per second for `duration` seconds on a fixed
+    schedule (open loop): operation k is due at start + k / rate no matter
+    how long earlier ones took, spread over `threads` threads in each of
+    `processes` processes. Latency is measured from when an operation was
+    due, not from when a free thread got to it, so a stall shows up in
+    every operation it delayed instead of being hidden by a slower send
+    rate (coordinated omission).
+
+    make_operation() is called once per process and returns the operation,
+    a callable taking the slot number; an exception counts as an error.
+    With processes > 1 it must be picklable (a module-level function or a
+    functools.partial of one).
+
+    on_report is called with an IntervalReport for every `interval`
+    seconds; the report for the whole run is returned.
+
+    How to use:
+    ```
+        def make_operation():
+            client = AlternatorLB(Config(nodes=[...])).new_botocore_dynamodb_client()
+            return lambda slot: client.get_item(TableName='t', Key={'id': {'N': str(slot % 1000)}})
+
+        total = run_open_loop(make_operation, rate=5000, duration=60, threads=64, on_report=print)
+    ```
+    """
+    start_at = time.monotonic() + start_delay
+    stride = processes
+    total = LatencyHistogram()
+    totals = {'errors': 0, 'lag': 0}
+    pending: Dict[int, list] = {}
+
+    def report(index: int, histogram: LatencyHistogram, errors: int, lag: int):
+        total.merge(histogram)
+        totals['errors'] += errors
+        totals['lag'] = max(totals['lag'], lag)
+        if on_report is not None:
+            on_report(IntervalReport.of(index * interval, interval, histogram, errors, lag))
+
+    if processes == 1:
+        _run_local(make_operation, rate, duration, threads, interval, start_at, 0, stride, report)
+    else:
+        results = multiprocessing.Queue()
+        children = [multiprocessing.Process(
+            target=_process_main,
+            args=(make_operation, rate, duration, threads, interval, start_at,
+                  index, stride, results), daemon=True)
+            for index in range(processes)]
+        for child in children:
+            child.start()
+        running = processes
+        reported = 0
+        while running:
+            try:
+                result = results.get(timeout=1.0)
+            except queue.Empty:
+                if not any(child.is_alive() for child in children):
+                    break
+                continue
+            if result is None:
+                running -= 1
+                continue
+            (index, histogram, errors, lag) = result
+            entry = pending.setdefault(index, [LatencyHistogram(), 0, 0, 0])
+            entry[0].merge(histogram)
+            entry[1] += errors
+            entry[2] = max(entry[2], lag)
+            entry[3] += 1
+            # Every process reports every interval, in order.
+            while reported in pending and pending[reported][3] == processes:
+                report(reported, *pending.pop(reported)[:3])
+                reported += 1
+        for index in sorted(pending):
+            report(index, *pending.pop(index)[:3])
+        for child in children:
+            child.join()
+
+    elapsed = max(time.monotonic() - start_at, 1e-9)
+    return IntervalReport.of(0.0, elapsed, total, totals['errors'], totals['lag'])
@@ -0,0 +1,380 @@
+import bisect
+import threading
+import time
+import weakref
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for (name, value) in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    A metric family. Children for a label combination are created once and
+    cached, so the request path only pays for one dict lookup and a short
+    uncontended lock per update.
+    """
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for (values, child) in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for (bound, count) in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds metric families and collectors (any object with a `render()`
+    returning exposition lines) and renders them in Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors = []
+        self._named_collectors = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, cls, name: str, documentation: str, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as {metric.type}")
+            return metric
+
+    def get_or_create_collector(self, name: str, factory):
+        """The collector registered under `name`, created with factory() the first time."""
+        with self._lock:
+            collector = self._named_collectors.get(name)
+            if collector is None:
+                collector = self._named_collectors[name] = factory()
+                self._collectors.append(collector)
+            return collector
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collector in list(self._collectors):
+            lines.extend(collector.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _RequestCell:
+    """All request counters of one (node, operation) pair, behind one lock."""
+    __slots__ = ('requests', 'retries', 'bytes_out', 'bytes_in', 'in_flight', 'errors',
+                 'latency_counts', 'latency_sum', 'lock')
+
+    def __init__(self, buckets):
+        self.requests = 0
+        self.retries = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.in_flight = 0
+        self.errors = {}
+        self.latency_counts = [0] * (len(buckets) + 1)
+        self.latency_sum = 0.0
+        self.lock = threading.Lock()
+
+
+class LoadBalancerMetrics:
+    """
+    Client-side AlternatorLB metrics in Prometheus format: requests, errors,
+    retries, bytes sent and received, in-flight requests and latency per
+    node and operation, plus `/localnodes` refresh duration and outcome.
+
+    Fed from the same botocore request events as NodeStatsRegistry. Each
+    event does one dict lookup and takes one uncontended lock, so the cost
+    stays around a microsecond per request; all the formatting is done at
+    scrape time. Every instance on a registry is rendered by one shared
+    _LoadBalancerCollector, so several AlternatorLBs in a process expose
+    each metric family once.
+    """
+    _CONTEXT_KEY = 'alternator_lb_metrics'
+    _COUNTERS = (
+        ('requests', 'alternator_lb_requests_total',
+         'Requests sent by AlternatorLB clients, retries included.'),
+        ('retries', 'alternator_lb_retries_total', 'Requests that were a retry attempt.'),
+        ('bytes_out', 'alternator_lb_request_bytes_total', 'Request body bytes sent.'),
+        ('bytes_in', 'alternator_lb_response_bytes_total', 'Response body bytes received.'),
+    )
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY,
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        self._cells: Dict[Tuple[str, str], _RequestCell] = {}
+        self._cells_lock = threading.Lock()
+        self.refresh_duration = registry.get_or_create(
+            Histogram, 'alternator_lb_discovery_refresh_duration_seconds',
+            'Duration of /localnodes refreshes, by outcome: updated, empty or error.',
+            ('outcome',))
+        collector = registry.get_or_create_collector(
+            'alternator_lb_requests', lambda: _LoadBalancerCollector(self._buckets))
+        if collector.buckets != self._buckets:
+            raise ValueError(
+                f"Request latency buckets {self._buckets} differ from {collector.buckets} "
+                f"of the other AlternatorLB metrics on this registry")
+        collector.add(self)
+
+    def _cell(self, node: str, operation: str) -> _RequestCell:
+        key = (node, operation)
+        cell = self._cells.get(key)
+        if cell is None:
+            with self._cells_lock:
+                cell = self._cells.setdefault(key, _RequestCell(self._buckets))
+        return cell
+
+    def cells(self) -> List[Tuple[Tuple[str, str], _RequestCell]]:
+        return list(self._cells.items())
+
+    def observe_refresh(self, duration: float, outcome: str):
+        self.refresh_duration.labels(outcome).observe(duration)
+
+    def register_client_hooks(self, client):
+        events = client.meta.events
+        events.register('request-created.dynamodb', self._on_request_created,
+                        unique_id='alternator-lb-metrics-start')
+        events.register('response-received.dynamodb', self._on_response_received,
+                        unique_id='alternator-lb-metrics-end')
+
+    def _on_request_created(self, request, operation_name, **kwargs):
+        context = getattr(request, 'context', None)
+        if context is None:
+            return
+        node = context.get('alternator_node')
+        if node is None:
+            return
+        cell = self._cell(node, operation_name)
+        retry = context.get('retries', {}).get('attempt', 1) > 1
+        body = request.body
+        size = len(body) if body else 0
+        with cell.lock:
+            cell.requests += 1
+            cell.retries += retry
+            cell.bytes_out += size
+            cell.in_flight += 1
+        context[self._CONTEXT_KEY] = (cell, time.perf_counter())
+
+    def _on_response_received(self, context, exception=None, response_dict=None, **kwargs):
+        started = context.pop(self._CONTEXT_KEY, None)
+        if started is None:
+            return
+        (cell, start) = started
+        latency = time.perf_counter() - start
+        index = bisect.bisect_left(self._buckets, latency)
+        error = None
+        size = 0
+        if exception is not None:
+            error = 'connection'
+        else:
+            body = response_dict.get('body')
+            size = len(body) if body else 0
+            status = response_dict.get('status_code', 0)
+            if status >= 500:
+                error = 'server'
+            elif status >= 400:
+                error = 'client'
+        with cell.lock:
+            cell.in_flight -= 1
+            cell.bytes_in += size
+            cell.latency_counts[index] += 1
+            cell.latency_sum += latency
+            if error is not None:
+                cell.errors[error] = cell.errors.get(error, 0) + 1
+
+
+class _LoadBalancerCollector:
+    """
+    Renders the request metrics of every LoadBalancerMetrics on a registry
+    as one set of families, summed per node and operation. Instances are
+    held weakly, so the metrics of a released AlternatorLB stop being
+    reported instead of piling up.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self._sources = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def add(self, metrics: LoadBalancerMetrics):
+        with self._lock:
+            self._sources.add(metrics)
+
+    def _totals(self) -> Dict[Tuple[str, str], _RequestCell]:
+        with self._lock:
+            sources = list(self._sources)
+        totals = {}
+        for source in sources:
+            for (key, cell) in source.cells():
+                total = totals.get(key)
+                if total is None:
+                    total = totals[key] = _RequestCell(self.buckets)
+                with cell.lock:
+                    total.requests += cell.requests
+                    total.retries += cell.retries
+                    total.bytes_out += cell.bytes_out
+                    total.bytes_in += cell.bytes_in
+                    total.in_flight += cell.in_flight
+                    for (kind, count) in cell.errors.items():
+                        total.errors[kind] = total.errors.get(kind, 0) + count
+                    for (index, count) in enumerate(cell.latency_counts):
+                        total.latency_counts[index] += count
+                    total.latency_sum += cell.latency_sum
+        return totals
+
+    def render(self) -> List[str]:
+        labels = ('node', 'operation')
+        cells = sorted(self._totals().items())
+        lines = []
+        for (attribute, name, documentation) in LoadBalancerMetrics._COUNTERS:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} counter"]
+            for (key, cell) in cells:
+                lines.append(f"{name}{_format_labels(labels, key)} {getattr(cell, attribute)}")
+
+        name = 'alternator_lb_errors_total'
+        lines += [f"# HELP {name} Failed requests, by kind: connection (no response), "
+                  f"server (5xx) or client (4xx).", f"# TYPE {name} counter"]
+        for (key, cell) in cells:
+            for (kind, count) in sorted(cell.errors.items()):
+                lines.append(f"{name}{_format_labels(labels + ('kind',), key + (kind,))} {count}")
+
+        name = 'alternator_lb_in_flight_requests'
+        in_flight = {}
+        for ((node, _), cell) in cells:
+            in_flight[node] = in_flight.get(node, 0) + cell.in_flight
+        lines += [f"# HELP {name} Requests waiting for a response.", f"# TYPE {name} gauge"]
+        for (node, count) in sorted(in_flight.items()):
+            lines.append(f"{name}{_format_labels(('node',), (node,))} {count}")
+
+        name = 'alternator_lb_request_duration_seconds'
+        lines += [f"# HELP {name} Latency of each request attempt.",
+                  f"# TYPE {name} histogram"]
+        for (key, cell) in cells:
+            (counts, total) = (cell.latency_counts, cell.latency_sum)
+            cumulative = 0
+            for (bound, count) in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket = _format_labels(labels, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{name}_bucket{bucket} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels, key)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels, key)} {cumulative}")
+        return lines
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def start_http_server(port: int, addr: str = "", registry: MetricsRegistry = REGISTRY):
+    """
+    Serves `registry` in Prometheus text format on http://addr:port/metrics
+    from a daemon thread. Starting it again for the same port is a no-op.
+    """
+    with _servers_lock:
+        server = _servers.get((addr, port))
+        if server is not None:
+            return server
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((addr, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True,
+                         name="alternator-lb-metrics").start()
+        _servers[(addr, port)] = server
+        return server
@@ -0,0 +1,143 @@
+import logging
+import random
+import threading
+import time
+
+from urllib.parse import urlsplit, urlunsplit
+
+_RETRYABLE_STATUS = frozenset((500, 502, 503, 504))
+_RETRYABLE_ERRORS = frozenset((
+    'ProvisionedThroughputExceededException', 'ThrottlingException', 'Throttling',
+    'RequestLimitExceeded', 'TransactionInProgressException',
+    'InternalServerError', 'ServiceUnavailable'))
+
+
+class RetryBudget:
+    """
+    Cluster-wide cap on retries: every first attempt deposits `ratio`
+    tokens, every retry spends one, and `min_per_second` tokens are added
+    over time so a quiet client can still retry. The balance never exceeds
+    `burst`, so when most requests fail at once, retries stop at about
+    `ratio` of the traffic instead of multiplying it.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, burst: float = 10.0):
+        self._ratio = ratio
+        self._min_per_second = min_per_second
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._burst, self._tokens + self._ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst,
+                               self._tokens + (now - self._updated) * self._min_per_second)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class NodeAwareRetries:
+    """
+    Replaces botocore's retry handler on patched clients so retries work
+    with the LB rather than around it.
+
+    botocore re-sends a failed request to the URL resolved for the first
+    attempt, so a retry lands on the node that just failed. Here every
+    attempt after the first is moved, before it is signed, to a node no
+    earlier attempt of the request went to, picked by the LB's selection
+    policy (circuit breakers and concurrency limits included) from the
+    same candidates as the first attempt: the key's replicas with
+    token-aware routing, and only the tiers in use with tiered routing. The
+    failed attempt has already been counted against its own node by the
+    node statistics hooks.
+
+    Connection errors, 5xx responses and throttling errors are retried, up
+    to Config.retry_max_attempts attempts in total, after a full-jitter
+    exponential backoff (Config.retry_backoff doubling per attempt, capped
+    at Config.retry_max_backoff). Every retry must also be paid for from a
+    RetryBudget shared by all clients of the LB (Config.retry_budget_ratio
+    of the requests, plus Config.retry_budget_min_per_second), so a node or
+    cluster failure can not turn into a retry storm.
+
+    Installed on every client by AlternatorLB; FastDynamoDBClient uses the
+    same budget and backoff for its own retries.
+    """
+    CALL_ARGS_KEY = 'alternator_call_args'
+    _TRIED_KEY = 'alternator_tried_nodes'
+    _logger = logging.getLogger('AlternatorLB')
+
+    def __init__(self, lb, config):
+        self._lb = lb
+        self._max_attempts = config.retry_max_attempts
+        self._backoff = config.retry_backoff
+        self._max_backoff = config.retry_max_backoff
+        self.budget = RetryBudget(config.retry_budget_ratio, config.retry_budget_min_per_second)
+
+    def register_client_hooks(self, client):
+        events = client.meta.events
+        service = client.meta.service_model.service_id.hyphenize()
+        events.unregister(f'needs-retry.{service}', unique_id=f'retry-config-{service}')
+        events.register(f'needs-retry.{service}', self._needs_retry,
+                        unique_id='alternator-lb-retries')
+        # First, so the request is signed and counted for the node it goes to.
+        events.register_first('request-created.dynamodb', self._on_request_created,
+                              unique_id='alternator-lb-retry-node')
+
+    def delay(self, attempt: int) -> float:
+        """Full-jitter backoff before retry number `attempt` (1 for the first retry)."""
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** (attempt - 1)))
+
+    def allow(self, attempt: int) -> bool:
+        """Whether a request that has made `attempt` attempts may make another."""
+        return attempt < self._max_attempts and self.budget.try_spend()
+
+    def _on_request_created(self, request, **kwargs):
+        context = getattr(request, 'context', None)
+        if context is None:
+            return
+        node = context.get('alternator_node')
+        if node is None:
+            return
+        if context.get('retries', {}).get('attempt', 1) == 1:
+            self.budget.deposit()
+            return
+        tried = context.setdefault(self._TRIED_KEY, set())
+        tried.add(node)
+        alternative = self._lb._alternative_node(
+            tried, kwargs.get('operation_name'), context.get(self.CALL_ARGS_KEY), context)
+        if alternative is None:
+            return
+        parts = urlsplit(request.url)
+        (scheme, netloc) = urlsplit(alternative)[:2]
+        request.url = urlunsplit((scheme, netloc) + tuple(parts[2:]))
+        context['alternator_node'] = alternative
+        self._logger.debug(f"Retrying {kwargs.get('operation_name')} on {alternative} instead of {node}")
+
+    def _needs_retry(self, attempts, response=None, caught_exception=None, **kwargs):
+        if not self._retryable(response, caught_exception):
+            return None
+        if not self.allow(attempts):
+            return None
+        return self.delay(attempts)
+
+    @staticmethod
+    def _retryable(response, caught_exception) -> bool:
+        if caught_exception is not None:
+            from botocore.exceptions import ConnectionError, HTTPClientError
+
+            return isinstance(caught_exception, (ConnectionError, HTTPClientError))
+        if response is None:
+            return False
+        (http_response, parsed) = response
+        if http_response.status_code in _RETRYABLE_STATUS:
+            return True
+        return parsed.get('Error', {}).get('Code') in _RETRYABLE_ERRORS
@@ -0,0 +1,150 @@
+import bisect
+import struct
+
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List
+
+_MASK = 0xFFFFFFFFFFFFFFFF
+_C1 = 0x87c37b91114253d5
+_C2 = 0x4cf5ad432745937f
+_MIN_TOKEN = -(1 << 63)
+_MAX_TOKEN = (1 << 63) - 1
+
+
+def _rotl(x: int, r: int) -> int:
+    return ((x << r) | (x >> (64 - r))) & _MASK
+
+
+def _fmix(k: int) -> int:
+    k ^= k >> 33
+    k = (k * 0xff51afd7ed558ccd) & _MASK
+    k ^= k >> 33
+    k = (k * 0xc4ceb9fe1a85ec53) & _MASK
+    k ^= k >> 33
+    return k
+
+
+def _tail_block(tail: bytes) -> int:
+    # Scylla (like Cassandra) reads the tail bytes as *signed* chars, so bytes
+    # >= 0x80 are sign-extended before being shifted into place.
+    k = 0
+    for i in reversed(range(len(tail))):
+        b = tail[i]
+        if b > 127:
+            b -= 256
+        k ^= (b << (i * 8)) & _MASK
+    return k
+
+
+def murmur3_token(data: bytes) -> int:
+    """Scylla's Murmur3Partitioner token of a serialized partition key."""
+    length = len(data)
+    nblocks = length // 16
+    h1 = h2 = 0
+    for (k1, k2) in struct.iter_unpack('<QQ', data[:nblocks * 16]):
+        k1 = (k1 * _C1) & _MASK
+        k1 = _rotl(k1, 31)
+        k1 = (k1 * _C2) & _MASK
+        h1 ^= k1
+        h1 = _rotl(h1, 27)
+        h1 = (h1 + h2) & _MASK
+        h1 = (h1 * 5 + 0x52dce729) & _MASK
+
+        k2 = (k2 * _C2) & _MASK
+        k2 = _rotl(k2, 33)
+        k2 = (k2 * _C1) & _MASK
+        h2 ^= k2
+        h2 = _rotl(h2, 31)
+        h2 = (h2 + h1) & _MASK
+        h2 = (h2 * 5 + 0x38495ab5) & _MASK
+
+    tail = data[nblocks * 16:]
+    if len(tail) > 8:
+        k2 = _tail_block(tail[8:])
+        k2 = (k2 * _C2) & _MASK
+        k2 = _rotl(k2, 33)
+        k2 = (k2 * _C1) & _MASK
+        h2 ^= k2
+    if tail:
+        k1 = _tail_block(tail[:8])
+        k1 = (k1 * _C1) & _MASK
+        k1 = _rotl(k1, 31)
+        k1 = (k1 * _C2) & _MASK
+        h1 ^= k1
+
+    h1 ^= length
+    h2 ^= length
+    h1 = (h1 + h2) & _MASK
+    h2 = (h2 + h1) & _MASK
+    h1 = _fmix(h1)
+    h2 = _fmix(h2)
+    h1 = (h1 + h2) & _MASK
+
+    token = h1 - (1 << 64) if h1 >= (1 << 63) else h1
+    # The minimum token is reserved, Scylla normalizes it to the maximum one.
+    return _MAX_TOKEN if token == _MIN_TOKEN else token
+
+
+def _serialize_decimal(value: str) -> bytes:
+    # Alternator stores numeric keys as CQL decimals: a 32-bit scale followed
+    # by the unscaled value as a big-endian two's complement varint.
+    try:
+        (sign, digits, exponent) = Decimal(value).as_tuple()
+    except InvalidOperation:
+        raise ValueError(f"Invalid number: {value}")
+    if not isinstance(exponent, int):
+        raise ValueError(f"Invalid number: {value}")
+    unscaled = int("".join(map(str, digits)) or "0")
+    if sign:
+        unscaled = -unscaled
+    size = ((unscaled if unscaled >= 0 else ~unscaled).bit_length() + 8) // 8
+    return struct.pack('>i', -exponent) + unscaled.to_bytes(size, 'big', signed=True)
+
+
+def serialize_partition_key(value: dict) -> bytes:
+    """
+    Serializes a DynamoDB typed partition key value ({'S': ...}, {'N': ...} or
+    {'B': ...}) the way Alternator stores it in the base table.
+    """
+    if 'S' in value:
+        return value['S'].encode('utf-8')
+    if 'N' in value:
+        return _serialize_decimal(value['N'])
+    if 'B' in value:
+        data = value['B']
+        return data.encode('utf-8') if isinstance(data, str) else bytes(data)
+    raise ValueError(f"Unsupported partition key value: {value}")
+
+
+def partition_key_token(value: dict) -> int:
+    return murmur3_token(serialize_partition_key(value))
+
+
+class TokenRing:
+    """
+    Token ranges of one table and the replicas that own them, as reported by
+    Scylla's `/storage_service/describe_ring/<keyspace>` REST endpoint.
+    Each range is (start_token, end_token], the last one wraps around.
+    """
+
+    def __init__(self, ranges: Dict[int, List[str]]):
+        if not ranges:
+            raise ValueError("token ring cannot be empty")
+        self._end_tokens = sorted(ranges)
+        self._replicas = [ranges[token] for token in self._end_tokens]
+
+    @classmethod
+    def from_describe_ring(cls, entries: List[dict], host_to_node=None) -> "TokenRing":
+        ranges = {}
+        for entry in entries:
+            endpoints = entry.get('endpoints') or []
+            if host_to_node is not None:
+                endpoints = [host_to_node(host) for host in endpoints]
+            ranges[int(entry['end_token'])] = endpoints
+        return cls(ranges)
+
+    def replicas(self, token: int) -> List[str]:
+        index = bisect.bisect_left(self._end_tokens, token)
+        if index == len(self._end_tokens):
+            index = 0
+        return self._replicas[index]
@@ -0,0 +1,106 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class TopologyEntry:
+    nodes: List[str]
+    tiers: Optional[List[List[str]]]
+    updated: float
+
+    def age(self) -> float:
+        return time.time() - self.updated
+
+
+class TopologyCache:
+    """
+    Live node list shared through a small JSON file by every process on the
+    host that uses the same Config.topology_cache_path.
+
+    Readers only stat the file and re-parse it when its mtime changed. A
+    process that finds the entry older than update_interval tries to take an
+    exclusive, non-blocking flock on `<path>.lock`; the one that gets it polls
+    `/localnodes` and replaces the file atomically, the others keep using the
+    entry they have. So a host runs one discovery per update_interval no
+    matter how many workers it has, and a restarted worker starts from the
+    last known nodes instead of the seed list.
+
+    Entries are tagged with `key` (the discovery settings), so processes
+    talking to different clusters or DCs can not share a file by mistake.
+    Locking needs fcntl; without it (Windows) every process refreshes on its
+    own but still shares the file for warm starts.
+    """
+    _logger = logging.getLogger('AlternatorLB')
+
+    def __init__(self, path: str, key: str):
+        self._path = path
+        self._key = key
+        self._mtime = None
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def read(self) -> Optional[TopologyEntry]:
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            if mtime == self._mtime:
+                return self._entry
+            try:
+                with open(self._path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                self._logger.warning(f"Failed to read topology cache {self._path}: {e}")
+                return None
+            entry = None
+            if data.get('key') == self._key and data.get('nodes'):
+                entry = TopologyEntry(data['nodes'], data.get('tiers'), data['updated'])
+            (self._mtime, self._entry) = (mtime, entry)
+            return entry
+
+    def write(self, nodes: List[str], tiers: Optional[List[List[str]]] = None):
+        data = {'key': self._key, 'nodes': nodes, 'tiers': tiers, 'updated': time.time()}
+        tmp = f"{self._path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, self._path)
+        except OSError as e:
+            self._logger.warning(f"Failed to write topology cache {self._path}: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+
+    @contextlib.contextmanager
+    def refresh_lock(self):
+        """Yields True if this process should run the refresh, False if another one is."""
+        try:
+            import fcntl
+        except ImportError:
+            yield True
+            return
+        try:
+            fd = os.open(f"{self._path}.lock", os.O_CREAT | os.O_RDWR, 0o644)
+        except OSError as e:
+            self._logger.warning(f"Failed to open topology cache lock: {e}")
+            yield True
+            return
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
@@ -0,0 +1,119 @@
+import itertools
+import json
+import random
+import time
+
+from dataclasses import asdict, dataclass
+from typing import IO, List, Optional
+
+
+@dataclass
+class TraceRecord:
+    """One sampled request attempt."""
+    # Wall clock time the attempt was sent, seconds since the epoch.
+    time: float
+    node: str
+    operation: str
+    # 1 for the first try, higher for retries and hedges of the same call.
+    attempt: int
+    # Seconds until the response (or the connection error).
+    latency: float
+    # HTTP status, 0 when no response arrived.
+    status: int
+    # DynamoDB error code, or the exception name of a connection error.
+    error: Optional[str] = None
+
+
+class RequestTracer:
+    """
+    Records the node, operation, latency and outcome of a sampled fraction
+    of requests into a fixed-size ring buffer that keeps the most recent
+    `capacity` attempts, to see where requests went and how they fared
+    without logging every one of them.
+
+    The sampling decision is made once per call, so all attempts of a
+    sampled call are recorded. Writers take no lock: each record claims a
+    slot from an itertools.count and replaces the old record there, both
+    single atomic steps under the GIL. Unsampled requests pay one random()
+    call; with Config.trace_sample_rate 0 the hooks are not installed at all.
+
+    How to use:
+    ```
+        lb = AlternatorLB(Config(nodes=['x.x.x.x'], trace_sample_rate=0.01))
+        ...
+        for record in lb.get_traces():
+            print(record)
+    ```
+    """
+    _CONTEXT_KEY = 'alternator_lb_trace'
+
+    def __init__(self, sample_rate: float, capacity: int = 10000):
+        if not 0 < sample_rate <= 1:
+            raise ValueError(f"Trace sample rate must be in (0, 1], got {sample_rate}")
+        if capacity < 1:
+            raise ValueError(f"Trace buffer size must be positive, got {capacity}")
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self._buffer: List[Optional[tuple]] = [None] * capacity
+        self._sequence = itertools.count()
+
+    def sample(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, started: float, node: str, operation: str, attempt: int,
+               latency: float, status: int, error: Optional[str] = None):
+        sequence = next(self._sequence)
+        self._buffer[sequence % self.capacity] = (
+            sequence, started, node, operation, attempt, latency, status, error)
+
+    def records(self) -> List[TraceRecord]:
+        """The buffered records, oldest first."""
+        entries = sorted(entry for entry in list(self._buffer) if entry is not None)
+        return [TraceRecord(*entry[1:]) for entry in entries]
+
+    def dump(self, file: IO[str]) -> int:
+        """Writes the buffered records to `file` as JSON lines, returns how many."""
+        records = self.records()
+        for record in records:
+            file.write(json.dumps(asdict(record)) + "\n")
+        return len(records)
+
+    def register_client_hooks(self, client):
+        events = client.meta.events
+        events.register('request-created.dynamodb', self._on_request_created,
+                        unique_id='alternator-lb-trace-start')
+        events.register('response-received.dynamodb', self._on_response_received,
+                        unique_id='alternator-lb-trace-end')
+
+    def _on_request_created(self, request, operation_name, **kwargs):
+        context = getattr(request, 'context', None)
+        if context is None:
+            return
+        node = context.get('alternator_node')
+        if node is None:
+            return
+        sampled = context.get(self._CONTEXT_KEY)
+        if sampled is None:
+            sampled = context[self._CONTEXT_KEY] = self.sample()
+        if sampled:
+            attempt = context.get('retries', {}).get('attempt', 1)
+            context[self._CONTEXT_KEY] = (node, operation_name, attempt, time.time(),
+                                          time.perf_counter())
+
+    def _on_response_received(self, context, exception=None, response_dict=None,
+                              parsed_response=None, **kwargs):
+        started = context.get(self._CONTEXT_KEY)
+        if not isinstance(started, tuple):
+            return
+        # Retries of the call are sampled too.
+        context[self._CONTEXT_KEY] = True
+        (node, operation, attempt, wall_start, start) = started
+        latency = time.perf_counter() - start
+        if exception is not None:
+            (status, error) = (0, type(exception).__name__)
+        else:
+            status = response_dict.get('status_code', 0)
+            error = None
+            if status >= 400 and parsed_response:
+                error = parsed_response.get('Error', {}).get('Code')
+        self.record(wall_start, node, operation, attempt, latency, status, error)
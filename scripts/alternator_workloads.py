@@ -0,0 +1,224 @@
+import random
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+# zeta(n, theta) is summed exactly up to this many terms; the rest is
+# approximated by an integral, keeping setup O(1) for huge key spaces.
+_ZETA_EXACT_TERMS = 10000
+
+
+def zeta(n: int, theta: float) -> float:
+    m = min(n, _ZETA_EXACT_TERMS)
+    total = sum(1 / i ** theta for i in range(1, m + 1))
+    if n > m:
+        # Euler-Maclaurin: the tail sum is close to the integral over [m + .5, n + .5].
+        total += ((n + 0.5) ** (1 - theta) - (m + 0.5) ** (1 - theta)) / (1 - theta)
+    return total
+
+
+class UniformKeys:
+    """Every key in [0, n) equally likely."""
+
+    def __init__(self, n: int):
+        self._n = n
+
+    def next(self) -> int:
+        return int(random.random() * self._n)
+
+
+class ZipfianKeys:
+    """
+    Zipfian keys in [0, n), key i drawn with probability proportional to
+    1 / (i + 1) ** theta, with YCSB's constant-time generator (Gray et al.,
+    "Quickly generating billion-record synthetic databases"). theta close
+    to 1 is more skewed; YCSB uses 0.99.
+    """
+
+    def __init__(self, n: int, theta: float = 0.99):
+        if not 0 < theta < 1:
+            raise ValueError(f"Zipfian theta must be between 0 and 1, got {theta}")
+        self._n = n
+        self._theta = theta
+        self._alpha = 1 / (1 - theta)
+        self._zetan = zeta(n, theta)
+        self._second = 1 + 0.5 ** theta
+        self._eta = (1 - (2 / n) ** (1 - theta)) / (1 - zeta(2, theta) / self._zetan)
+
+    def next(self) -> int:
+        u = random.random()
+        uz = u * self._zetan
+        if uz < 1:
+            return 0
+        if uz < self._second:
+            return 1
+        return min(self._n - 1, int(self._n * (self._eta * u - self._eta + 1) ** self._alpha))
+
+
+class HotspotKeys:
+    """`hot_access` of the requests go to the first `hot_fraction` of the keys, the rest to the others."""
+
+    def __init__(self, n: int, hot_fraction: float = 0.2, hot_access: float = 0.8):
+        self._n = n
+        self._hot = max(1, int(n * hot_fraction))
+        self._hot_access = hot_access
+
+    def next(self) -> int:
+        if random.random() < self._hot_access or self._hot >= self._n:
+            return int(random.random() * self._hot)
+        return self._hot + int(random.random() * (self._n - self._hot))
+
+
+class LatestKeys:
+    """
+    Zipfian over recency: the most recently inserted keys are the most
+    popular. `inserted` lists the keys inserted during the run in order;
+    ranks beyond it fall back to the loaded keys, newest first.
+    """
+
+    def __init__(self, n: int, inserted: List[int], theta: float = 0.99):
+        self._n = n
+        self._inserted = inserted
+        self._ranks = ZipfianKeys(n, theta)
+
+    def next(self) -> int:
+        rank = self._ranks.next()
+        inserted = self._inserted
+        if rank < len(inserted):
+            return inserted[-1 - rank]
+        return max(0, self._n - 1 - (rank - len(inserted)))
+
+
+KEY_DISTRIBUTIONS = ('uniform', 'zipfian', 'latest', 'hotspot')
+
+
+@dataclass
+class WorkloadProfile:
+    """Proportions of each operation (summing to 1) and the key distribution of reads and writes."""
+    read: float = 0.0
+    update: float = 0.0
+    insert: float = 0.0
+    scan: float = 0.0
+    read_modify_write: float = 0.0
+    distribution: str = 'zipfian'
+    max_scan_length: int = 100
+
+
+# The YCSB core workloads.
+WORKLOADS: Dict[str, WorkloadProfile] = {
+    # Update heavy, e.g. a session store recording recent actions.
+    'a': WorkloadProfile(read=0.5, update=0.5),
+    # Read mostly, e.g. photo tagging.
+    'b': WorkloadProfile(read=0.95, update=0.05),
+    # Read only, e.g. a user profile cache.
+    'c': WorkloadProfile(read=1.0),
+    # Read latest, e.g. user status updates.
+    'd': WorkloadProfile(read=0.95, insert=0.05, distribution='latest'),
+    # Short ranges, e.g. threaded conversations.
+    'e': WorkloadProfile(scan=0.95, insert=0.05),
+    # Read-modify-write, e.g. a user database.
+    'f': WorkloadProfile(read=0.5, read_modify_write=0.5),
+}
+
+
+class Workload:
+    """
+    Builds the load driver operation for a WorkloadProfile against a table
+    with a numeric hash key `id` holding `records` loaded items (0..records-1):
+
+    - read: GetItem of a key from the distribution.
+    - update: UpdateItem setting the payload of such a key.
+    - insert: PutItem of a new key past the loaded ones.
+    - scan: Scan of up to max_scan_length items (uniform length) starting
+      after a key from the distribution, in Alternator's token order, the
+      nearest equivalent of YCSB's range scan on a hash-keyed table.
+    - read_modify_write: GetItem then PutItem of the same key.
+
+    Keys are generated in constant time from `random`, about a microsecond
+    each, a small fraction of the client CPU a request takes, so the
+    generator does not limit the driver.
+
+    How to use:
+    ```
+        workload = Workload(WORKLOADS['a'], records=100000)
+        operation = workload.operation(dynamodb, 'test_table')
+        run_open_loop(lambda: operation, rate=5000, duration=60, threads=64)
+    ```
+    """
+
+    def __init__(self, profile: WorkloadProfile, records: int,
+                 distribution: str = None, theta: float = 0.99):
+        distribution = distribution or profile.distribution
+        if distribution not in KEY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown key distribution: {distribution}, expected one of {list(KEY_DISTRIBUTIONS)}")
+        self.profile = profile
+        self.records = records
+        # Keys inserted during the run, in insert order (list.append is thread safe).
+        self.inserted: List[int] = []
+        if distribution == 'uniform':
+            self.keys = UniformKeys(records)
+        elif distribution == 'zipfian':
+            self.keys = ZipfianKeys(records, theta)
+        elif distribution == 'hotspot':
+            self.keys = HotspotKeys(records)
+        else:
+            self.keys = LatestKeys(records, self.inserted, theta)
+
+    def operation(self, dynamodb, table: str) -> Callable[[int], None]:
+        """Returns operation(slot); inserts use key records + slot, unique across processes."""
+        profile = self.profile
+        next_key = self.keys.next
+        records = self.records
+        inserted = self.inserted
+        max_scan_length = profile.max_scan_length
+        thresholds = []
+        cumulative = 0.0
+        for (name, share) in (('read', profile.read), ('update', profile.update),
+                              ('insert', profile.insert), ('scan', profile.scan),
+                              ('read_modify_write', profile.read_modify_write)):
+            if share:
+                cumulative += share
+                thresholds.append((cumulative, name))
+        if not thresholds:
+            raise ValueError("Workload profile has no operations")
+
+        def read(slot):
+            dynamodb.get_item(TableName=table, Key={'id': {'N': str(next_key())}})
+
+        def update(slot):
+            dynamodb.update_item(
+                TableName=table, Key={'id': {'N': str(next_key())}},
+                UpdateExpression='SET payload = :payload',
+                ExpressionAttributeValues={':payload': {'S': f'data_{slot}'}})
+
+        def insert(slot):
+            key = records + slot
+            dynamodb.put_item(TableName=table,
+                              Item={'id': {'N': str(key)}, 'payload': {'S': f'data_{slot}'}})
+            inserted.append(key)
+
+        def scan(slot):
+            dynamodb.scan(TableName=table, Limit=1 + int(random.random() * max_scan_length),
+                          ExclusiveStartKey={'id': {'N': str(next_key())}})
+
+        def read_modify_write(slot):
+            key = {'N': str(next_key())}
+            item = dynamodb.get_item(TableName=table, Key={'id': key}).get('Item') or {'id': key}
+            item['payload'] = {'S': f'data_{slot}'}
+            dynamodb.put_item(TableName=table, Item=item)
+
+        operations = {'read': read, 'update': update, 'insert': insert,
+                      'scan': scan, 'read_modify_write': read_modify_write}
+        choices = [(threshold, operations[name]) for (threshold, name) in thresholds]
+        if len(choices) == 1:
+            return choices[0][1]
+
+        def operation(slot):
+            u = random.random() * cumulative
+            for (threshold, run) in choices:
+                if u < threshold:
+                    return run(slot)
+            return choices[-1][1](slot)
+
+        return operation
@@ -0,0 +1,96 @@
+"""
+Compare the threaded AlternatorLB botocore client with AsyncAlternatorLB on
+an aiobotocore client, issuing the same GetItem workload at the same
+concurrency. Reports requests/sec and requests per CPU-second (i.e. per
+core), which is what decides how many client processes a host needs.
+
+    python bench_async_lb.py --nodes 192.168.100.101 --port 8000 \
+        --requests 20000 --concurrency 64
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from alternator_lb import AlternatorLB, Config
+from alternator_lb_async import AsyncAlternatorLB
+
+
+def _key(args):
+    return {'id': {'N': str(random.randint(0, args.keys - 1))}}
+
+
+def prepare_table(lb, args):
+    dynamodb = lb.new_botocore_dynamodb_client()
+    try:
+        dynamodb.describe_table(TableName=args.table)
+    except dynamodb.exceptions.ResourceNotFoundException:
+        dynamodb.create_table(
+            TableName=args.table,
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'N'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+    for i in range(args.keys):
+        dynamodb.put_item(
+            TableName=args.table,
+            Item={'id': {'N': str(i)}, 'payload': {'S': f'data_{i}'}})
+
+
+def run_threaded(config, args):
+    lb = AlternatorLB(config)
+    dynamodb = lb.new_botocore_dynamodb_client()
+    per_worker = args.requests // args.concurrency
+
+    def worker():
+        for _ in range(per_worker):
+            dynamodb.get_item(TableName=args.table, Key=_key(args))
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(args.concurrency)]:
+            future.result()
+    return per_worker * args.concurrency, time.perf_counter() - wall, time.process_time() - cpu
+
+
+async def run_async(config, args):
+    per_worker = args.requests // args.concurrency
+    async with AsyncAlternatorLB(config) as lb:
+        async with lb.new_aiobotocore_dynamodb_client() as dynamodb:
+            async def worker():
+                for _ in range(per_worker):
+                    await dynamodb.get_item(TableName=args.table, Key=_key(args))
+
+            wall, cpu = time.perf_counter(), time.process_time()
+            await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+            return per_worker * args.concurrency, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def report(name, result):
+    requests, wall, cpu = result
+    print(f"{name:<10} {requests:>9} {wall:>9.2f} {requests / wall:>12.0f} {requests / cpu:>16.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", nargs="+", default=["192.168.100.101"])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--table", default="bench_async_lb")
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    config = Config(nodes=args.nodes, port=args.port,
+                    max_pool_connections=args.concurrency)
+    prepare_table(AlternatorLB(config), args)
+
+    print(f"{'client':<10} {'requests':>9} {'wall s':>9} {'req/s':>12} {'req/s per core':>16}")
+    report("threaded", run_threaded(config, args))
+    report("asyncio", asyncio.run(run_async(config, args)))
+
+
+if __name__ == "__main__":
+    main()
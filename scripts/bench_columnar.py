@@ -0,0 +1,75 @@
+"""
+Compare decoding Query/Scan result pages item by item with boto3's
+TypeDeserializer against ColumnarDecoder, with and without NumPy. By
+default the pages are generated in memory so only decoding is measured;
+with --table they are read from the cluster through AlternatorLB.
+
+    python bench_columnar.py --items 200000
+    python bench_columnar.py --nodes 192.168.100.101 --port 8000 --table test_table
+"""
+import argparse
+import time
+
+from alternator_columnar import ColumnarDecoder, paginate
+
+SCHEMA = {'id': 'int', 'price': 'float', 'quantity': 'int', 'name': 'str', 'active': 'bool'}
+
+
+def synthetic_pages(items, page_size=1000):
+    for start in range(0, items, page_size):
+        yield {'Items': [{
+            'id': {'N': str(i)},
+            'price': {'N': f"{i % 1000 / 7:.4f}"},
+            'quantity': {'N': str(i % 50)},
+            'name': {'S': f"item-{i}"},
+            'active': {'BOOL': i % 2 == 0},
+        } for i in range(start, min(items, start + page_size))]}
+
+
+def per_item(pages):
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserializer = TypeDeserializer()
+    return [{name: deserializer.deserialize(value) for (name, value) in item.items()}
+            for page in pages for item in page['Items']]
+
+
+def timed(fn, pages):
+    start = time.perf_counter()
+    fn(pages)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--nodes", nargs="+", default=["192.168.100.101"])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--table", default=None)
+    args = parser.parse_args()
+
+    if args.table:
+        from alternator_lb import AlternatorLB, Config
+
+        lb = AlternatorLB(Config(nodes=args.nodes, port=args.port))
+        pages = list(paginate(lb.new_botocore_dynamodb_client(), 'scan', TableName=args.table))
+    else:
+        pages = list(synthetic_pages(args.items))
+    items = sum(len(page['Items']) for page in pages)
+
+    decoders = {
+        "TypeDeserializer per item": per_item,
+        "ColumnarDecoder (lists)": ColumnarDecoder(SCHEMA, use_numpy=False).decode_pages,
+        "ColumnarDecoder (numpy)": ColumnarDecoder(SCHEMA, use_numpy=True).decode_pages,
+    }
+    baseline = None
+    print(f"{items} items in {len(pages)} pages")
+    for (name, decode) in decoders.items():
+        elapsed = timed(decode, pages)
+        baseline = baseline or elapsed
+        print(f"{name:<28} {elapsed * 1000:8.1f}ms  {items / elapsed:>10.0f} items/sec  "
+              f"{baseline / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
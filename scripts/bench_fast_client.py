@@ -0,0 +1,70 @@
+"""
+Compare the botocore client patched by AlternatorLB with FastDynamoDBClient
+on the same GetItem and PutItem workload. Every thread runs a closed loop;
+the report shows throughput and client CPU time (process time) per
+operation, whose inverse is the ops/sec a single core can drive.
+
+    python bench_fast_client.py --nodes 192.168.100.101 192.168.100.102 --port 8000
+"""
+import argparse
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from alternator_lb import AlternatorLB, Config
+
+
+def item(i):
+    return {'id': {'N': str(i)}, 'name': {'S': f"name-{i}"}, 'score': {'N': str(i * 7 % 1000)}}
+
+
+def measure(operation, requests, threads):
+    def worker(offset):
+        for i in range(offset, requests, threads):
+            operation(i)
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(threads)))
+    return time.perf_counter() - start, time.process_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", nargs="+", default=["192.168.100.101"])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--table", default="test_table")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    lb = AlternatorLB(Config(nodes=args.nodes, port=args.port,
+                             max_pool_connections=args.threads))
+    clients = {
+        "botocore": lb.new_botocore_dynamodb_client(),
+        "fast": lb.new_fast_dynamodb_client(),
+    }
+    table = args.table
+
+    print(f"{'client':<10} {'operation':<8} {'ops/sec':>10} {'cpu us/op':>10} {'ops/cpu-sec':>12}")
+    results = {}
+    for (name, client) in clients.items():
+        operations = {
+            "PutItem": lambda i: client.put_item(TableName=table, Item=item(i)),
+            "GetItem": lambda i: client.get_item(TableName=table, Key={'id': {'N': str(i)}}),
+        }
+        for (operation, call) in operations.items():
+            call(0)
+            (elapsed, cpu) = measure(call, args.requests, args.threads)
+            results[(name, operation)] = cpu
+            print(f"{name:<10} {operation:<8} {args.requests / elapsed:>10.0f} "
+                  f"{cpu / args.requests * 1e6:>10.1f} {args.requests / cpu:>12.0f}")
+
+    for operation in ("PutItem", "GetItem"):
+        gain = results[("botocore", operation)] / results[("fast", operation)]
+        print(f"{operation}: fast client drives {gain:.1f}x the ops/sec per core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark of AlternatorLB endpoint selection: how many
+`_next_alternator_node` picks per second the LB sustains when 1, 8, 64 and
+256 threads select concurrently, for every selection policy. No cluster is
+needed; the LB is built over a fixed node list with discovery disabled.
+
+    python bench_node_selection.py --nodes 5 --duration 2
+"""
+import argparse
+import threading
+import time
+
+from alternator_lb import AlternatorLB, Config, SELECTION_POLICIES
+
+THREADS = (1, 8, 64, 256)
+
+
+def measure(lb, threads, duration):
+    start = threading.Barrier(threads + 1)
+    stop = threading.Event()
+    counts = [0] * threads
+
+    def worker(index):
+        pick = lb._next_alternator_node
+        count = 0
+        start.wait()
+        while not stop.is_set():
+            for _ in range(100):
+                pick()
+            count += 100
+        counts[index] = count
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--policies", nargs="+", default=list(SELECTION_POLICIES))
+    args = parser.parse_args()
+
+    nodes = [f"10.0.0.{i + 1}" for i in range(args.nodes)]
+    print(f"{'policy':<22}" + "".join(f"{f'{t} threads':>16}" for t in THREADS) + "   (picks/sec)")
+    for policy in args.policies:
+        lb = AlternatorLB(Config(nodes=nodes, update_interval=0, selection_policy=policy))
+        results = [measure(lb, threads, args.duration) for threads in THREADS]
+        print(f"{policy:<22}" + "".join(f"{r:>16,.0f}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measure the cold-start cost that connection prewarming removes: the
+latency of the first burst of concurrent GetItem requests made by a fresh
+AlternatorLB client, with and without Config.prewarm_connections. The
+burst is as wide as the connection pools (nodes * max_pool_connections),
+so without prewarming every request in it opens a new TCP (and with
+--schema https, TLS) connection.
+
+    python bench_prewarm.py --nodes 192.168.100.101 192.168.100.102 --port 8000
+"""
+import argparse
+import statistics
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from alternator_lb import AlternatorLB, Config
+
+
+def burst(dynamodb, table, requests):
+    def get_item(i):
+        start = time.perf_counter()
+        dynamodb.get_item(TableName=table, Key={'id': {'N': str(i)}})
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        return sorted(executor.map(get_item, range(requests)))
+
+
+def run(args, prewarm):
+    config = Config(nodes=args.nodes, port=args.port, schema=args.schema,
+                    update_interval=0, max_pool_connections=args.connections,
+                    prewarm_connections=prewarm)
+    lb = AlternatorLB(config)
+    start = time.perf_counter()
+    dynamodb = lb.new_botocore_dynamodb_client()
+    created = time.perf_counter() - start
+    requests = len(args.nodes) * args.connections
+    return created, burst(dynamodb, args.table, requests), burst(dynamodb, args.table, requests)
+
+
+def describe(latencies):
+    return (f"mean {statistics.mean(latencies) * 1000:7.2f}ms  "
+            f"p50 {latencies[len(latencies) // 2] * 1000:7.2f}ms  "
+            f"max {latencies[-1] * 1000:7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nodes", nargs="+", default=["192.168.100.101"])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--schema", default="http")
+    parser.add_argument("--table", default="test_table")
+    parser.add_argument("--connections", type=int, default=10)
+    args = parser.parse_args()
+
+    for prewarm in (False, True):
+        (created, first, second) = run(args, prewarm)
+        print(f"prewarm={prewarm!s:<5}  client created in {created * 1000:.1f}ms")
+        print(f"  first burst:  {describe(first)}")
+        print(f"  second burst: {describe(second)}")
+
+
+if __name__ == "__main__":
+    main()
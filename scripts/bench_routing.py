@@ -0,0 +1,264 @@
+"""
+Routing benchmark: runs every selection/discovery strategy of AlternatorLB
+through fixed scenarios on a FakeAlternatorCluster (steady state, one slow
+node, node loss, node join, rack outage) under the same open-loop
+GetItem/PutItem load, and reports throughput, latency percentiles, how
+evenly requests spread over the nodes and how fast the client reacted.
+
+- skew: requests of the busiest node over the mean of the nodes up.
+- replica: share of keyed requests sent to a replica of the key.
+- slow: share of the requests the slow node served (slow_node).
+- react: seconds from the event until the client last sent a request to a
+  stopped node (node_loss, rack_outage), or until the new node served its
+  first one (node_join), at the --interval resolution.
+
+Results are written as JSON (--output), with a timeline of every run, so
+runs of two versions can be diffed. The fake cluster shares the process,
+and the GIL, with the client, so compare strategies and versions with each
+other rather than with numbers from a real cluster.
+
+    python bench_routing.py --output routing.json
+    python bench_routing.py --scenarios node_loss --strategies round_robin token_aware
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+from alternator_fake_cluster import FakeAlternatorCluster, bimodal_latency, lognormal_latency
+from alternator_lb import SELECTION_POLICIES, AlternatorLB, Config
+from alternator_loadgen import run_open_loop
+
+TABLE = 'bench_routing'
+RACKS = ['rack1', 'rack2', 'rack3']
+
+# Config overrides of each strategy: every selection policy, then the
+# discovery modes; the tiered client runs in rack1.
+STRATEGIES = {name: {'selection_policy': name} for name in SELECTION_POLICIES}
+STRATEGIES.update({
+    'token_aware': {'token_aware': True},
+    'tiered': {'tiered_routing': True, 'rack': 'rack1'},
+})
+
+
+def slow_node(cluster):
+    cluster.nodes[0].latency = bimodal_latency(0.001, 0.05, 0.5)
+    return {'node': cluster.nodes[0].address}
+
+
+def node_loss(cluster):
+    node = cluster.nodes[-1]
+    cluster.stop_node(node, delist_after=2.0)
+    return {'node': node.address}
+
+
+def node_join(cluster):
+    node = cluster.add_node(rack=RACKS[len(cluster.nodes) % len(RACKS)])
+    node.latency = cluster.nodes[0].latency
+    return {'node': node.address}
+
+
+def rack_outage(cluster):
+    nodes = [node for node in cluster.nodes if node.rack == 'rack1']
+    for node in nodes:
+        cluster.stop_node(node, delist_after=2.0)
+    return {'nodes': [node.address for node in nodes]}
+
+
+# Scenario -> the event injected at --event-at of the run, if any.
+SCENARIOS = {
+    'steady': None,
+    'slow_node': slow_node,
+    'node_loss': node_loss,
+    'node_join': node_join,
+    'rack_outage': rack_outage,
+}
+
+
+def run(scenario, strategy, port, args):
+    random.seed(args.seed)
+    cluster = FakeAlternatorCluster(nodes=args.nodes, port=port, racks=RACKS, track_replicas=True)
+    try:
+        for node in cluster.nodes:
+            node.latency = lognormal_latency(0.001, 0.3)
+        lb = AlternatorLB(Config(
+            nodes=cluster.seeds(), port=port, api_port=port, datacenter='DC1',
+            update_interval=args.update_interval, max_pool_connections=args.threads,
+            **STRATEGIES[strategy]))
+        dynamodb = lb.new_botocore_dynamodb_client()
+        dynamodb.create_table(
+            TableName=TABLE, KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'N'}])
+        for i in range(args.keys):
+            dynamodb.put_item(TableName=TABLE, Item={'id': {'N': str(i)}, 'payload': {'S': 'x' * 100}})
+        # Pick up the token ring of the new table before measuring.
+        time.sleep(args.update_interval)
+        dynamodb.describe_table(TableName=TABLE)
+        for node in cluster.nodes:
+            node.requests.clear()
+            node.keyed_requests = node.replica_requests = 0
+
+        def make_operation():
+            rng = random.Random(args.seed)
+
+            def operation(slot):
+                key = {'id': {'N': str(rng.randrange(args.keys))}}
+                if rng.random() < args.read_ratio:
+                    dynamodb.get_item(TableName=TABLE, Key=key)
+                else:
+                    dynamodb.put_item(TableName=TABLE, Item=dict(key, payload={'S': f'data_{slot}'}))
+            return operation
+
+        start_delay = 0.5
+        event = {}
+        # End of the last report interval in which the client still sent
+        # attempts to a stopped node, or the first in which a joined node
+        # served requests.
+        marks = {}
+        timeline = []
+
+        def inject():
+            stopped = [node for node in cluster.nodes if not node.up]
+            event.update(SCENARIOS[scenario](cluster) or {})
+            event['at'] = args.event_at
+            event['stopped'] = [node.address for node in cluster.nodes
+                                if not node.up and node not in stopped]
+            event['attempts'] = attempts(lb, event['stopped'])
+
+        def on_report(report):
+            timeline.append(report)
+            end = report.start + report.elapsed
+            if event.get('stopped'):
+                sent = attempts(lb, event['stopped'])
+                if sent > event['attempts']:
+                    (event['attempts'], marks['last_attempt']) = (sent, end)
+            if scenario == 'node_join' and 'node' in event and 'first_request' not in marks:
+                if sum(cluster.node(event['node']).requests.values()):
+                    marks['first_request'] = end
+
+        timer = None
+        if SCENARIOS[scenario] is not None:
+            timer = threading.Timer(start_delay + args.event_at, inject)
+            timer.daemon = True
+            timer.start()
+        total = run_open_loop(make_operation, args.rate, args.duration, threads=args.threads,
+                              interval=args.interval, on_report=on_report, start_delay=start_delay)
+        if timer is not None:
+            timer.cancel()
+
+        result = {
+            'scenario': scenario,
+            'strategy': strategy,
+            'ops_per_second': total.ops_per_second,
+            'ops': total.ops,
+            'errors': total.errors,
+            'p50_ms': total.p50,
+            'p99_ms': total.p99,
+            'p999_ms': total.p999,
+            'max_ms': total.max,
+        }
+        result.update(distribution(cluster))
+        if event.get('stopped'):
+            last = marks.get('last_attempt', args.event_at)
+            result['failover_seconds'] = round(max(0.0, last - args.event_at), 3)
+        elif scenario == 'node_join':
+            first = marks.get('first_request')
+            result['join_seconds'] = round(first - args.event_at, 3) if first is not None else None
+        elif scenario == 'slow_node':
+            served = {node.address: sum(node.requests.values()) for node in cluster.nodes}
+            result['slow_node_share'] = round(served[event['node']] / max(1, sum(served.values())), 4)
+        result['event'] = event
+        result['timeline'] = [
+            {'t': report.start, 'ops_per_second': report.ops_per_second, 'p99_ms': report.p99,
+             'errors': report.errors} for report in timeline]
+        return result
+    finally:
+        cluster.close()
+
+
+def distribution(cluster):
+    """Share of requests per node and skew (max/mean and coefficient of variation) over the nodes still up."""
+    served = {node.address: sum(node.requests.values()) for node in cluster.nodes}
+    total = sum(served.values()) or 1
+    counts = [served[node.address] for node in cluster.nodes if node.up]
+    mean = statistics.mean(counts) if counts else 0
+    keyed = sum(node.keyed_requests for node in cluster.nodes)
+    return {
+        'request_share': {address: round(count / total, 4) for (address, count) in served.items()},
+        'skew_max_over_mean': round(max(counts) / mean, 3) if mean else None,
+        'skew_cv': round(statistics.pstdev(counts) / mean, 3) if mean else None,
+        'replica_ratio': round(sum(node.replica_requests for node in cluster.nodes) / keyed, 4)
+        if keyed else None,
+    }
+
+
+def attempts(lb, addresses):
+    """Requests, retries included, the client has sent to the given nodes so far."""
+    return sum(stats.completed + stats.in_flight for (node, stats) in lb.get_node_stats().items()
+               if urlsplit(node).hostname in addresses)
+
+
+def version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument("--nodes", type=int, default=6)
+    parser.add_argument("--port", type=int, default=18500,
+                        help="first port; every run gets its own cluster on the next one")
+    parser.add_argument("--rate", type=float, default=300, help="operations per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--event-at", type=float, default=3.0, help="seconds into the run")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--interval", type=float, default=0.25, help="timeline resolution, seconds")
+    parser.add_argument("--update-interval", type=float, default=1.0, help="LB discovery interval")
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--read-ratio", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    logging.getLogger('AlternatorLB').setLevel(logging.ERROR)
+
+    print(f"{'scenario':<12} {'strategy':<22} {'ops/sec':>8} {'errors':>7} {'p50':>7} {'p99':>8} "
+          f"{'p99.9':>8} {'skew':>6} {'replica':>8} {'slow':>6} {'react':>7}")
+    results = []
+    for scenario in args.scenarios:
+        for strategy in args.strategies:
+            result = run(scenario, strategy, args.port + len(results), args)
+            results.append(result)
+            slow = result.get('slow_node_share')
+            react = result.get('failover_seconds', result.get('join_seconds'))
+            print(f"{scenario:<12} {strategy:<22} {result['ops_per_second']:>8.0f} "
+                  f"{result['errors']:>7} {result['p50_ms']:>7.2f} {result['p99_ms']:>8.2f} "
+                  f"{result['p999_ms']:>8.2f} {result['skew_max_over_mean'] or 0:>6.2f} "
+                  f"{result['replica_ratio'] or 0:>8.2f} {'' if slow is None else f'{slow:.1%}':>6} "
+                  f"{'' if react is None else f'{react:.2f}s':>7}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                'version': version(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'settings': {name: value for (name, value) in vars(args).items() if name != 'output'},
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
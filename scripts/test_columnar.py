@@ -0,0 +1,96 @@
+"""
+Checks of ColumnarDecoder, with and without NumPy.
+
+    python -m unittest test_columnar
+"""
+import math
+import unittest
+
+from alternator_columnar import ColumnarDecoder
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SCHEMA = {'id': 'int', 'price': 'float', 'name': 'str', 'active': 'bool'}
+ITEMS = [
+    {'id': {'N': '1'}, 'price': {'N': '9.5'}, 'name': {'S': 'a'}, 'active': {'BOOL': True},
+     'other': {'S': 'ignored'}},
+    {'id': {'N': '-2'}, 'price': {'N': '0'}, 'name': {'S': 'b'}, 'active': {'BOOL': False}},
+]
+
+
+class ListColumnsTest(unittest.TestCase):
+    use_numpy = False
+
+    def decode(self, items, schema=None):
+        return ColumnarDecoder(schema or SCHEMA, use_numpy=self.use_numpy).decode(items)
+
+    def column(self, values) -> list:
+        return list(values)
+
+    def test_decodes_one_column_per_schema_attribute(self):
+        columns = self.decode(ITEMS)
+        self.assertEqual(set(columns), set(SCHEMA))
+        self.assertEqual(self.column(columns['id']), [1, -2])
+        self.assertEqual(self.column(columns['price']), [9.5, 0.0])
+        self.assertEqual(columns['name'], ['a', 'b'])
+        self.assertEqual(columns['active'], [True, False])
+
+    def test_decodes_pages_into_one_set_of_columns(self):
+        decoder = ColumnarDecoder({'id': 'int'}, use_numpy=self.use_numpy)
+        columns = decoder.decode_pages([{'Items': ITEMS[:1]}, {'Items': ITEMS[1:]}, {}])
+        self.assertEqual(self.column(columns['id']), [1, -2])
+        self.assertEqual(decoder.rows, 2)
+
+    def test_missing_values(self):
+        columns = self.decode(ITEMS + [{'id': {'N': '3'}}])
+        self.assertIsNone(columns['name'][2])
+        self.assertTrue(self.is_missing(columns['price'][2]))
+
+    def is_missing(self, value) -> bool:
+        return value is None
+
+    def test_value_of_another_type_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'Column id is declared int'):
+            self.decode([{'id': {'S': '1'}}])
+
+    def test_unknown_column_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ColumnarDecoder({'id': 'decimal'}, use_numpy=self.use_numpy)
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class NumpyColumnsTest(ListColumnsTest):
+    use_numpy = True
+
+    def column(self, values) -> list:
+        self.assertIsInstance(values, numpy.ndarray)
+        return values.tolist()
+
+    def is_missing(self, value) -> bool:
+        return math.isnan(value)
+
+    def test_numeric_columns_are_int64_and_float64(self):
+        columns = self.decode(ITEMS)
+        self.assertEqual(columns['id'].dtype, numpy.int64)
+        self.assertEqual(columns['price'].dtype, numpy.float64)
+
+    def test_int_column_with_missing_values_is_float_with_nan(self):
+        column = self.decode([{'id': {'N': '1'}}, {}], {'id': 'int'})['id']
+        self.assertEqual(column.dtype, numpy.float64)
+        self.assertTrue(math.isnan(column[1]))
+
+    def test_int_column_keeps_the_full_int64_range(self):
+        values = [str(2 ** 63 - 1), str(-2 ** 63), '7']
+        column = self.decode([{'id': {'N': value}} for value in values], {'id': 'int'})['id']
+        self.assertEqual(column.tolist(), [int(value) for value in values])
+
+    def test_int_beyond_int64_raises_overflow(self):
+        with self.assertRaises(OverflowError):
+            self.decode([{'id': {'N': str(2 ** 63)}}], {'id': 'int'})
+
+
+if __name__ == '__main__':
+    unittest.main()
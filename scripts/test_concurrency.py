@@ -0,0 +1,59 @@
+"""
+Checks of the per-node adaptive concurrency limits.
+
+    python -m unittest test_concurrency
+"""
+import time
+import unittest
+
+from alternator_concurrency import AIMDLimit
+
+
+class AIMDLimitTest(unittest.TestCase):
+    def test_failure_cuts_the_limit_once_per_round_trip(self):
+        limit = AIMDLimit(initial=100, min_limit=10, max_limit=200)
+        limit.on_sample(0.01, in_flight=50, failed=True)
+        self.assertEqual(limit.limit, 90)
+        # The same burst of failures counts once.
+        limit.on_sample(0.01, in_flight=50, failed=True)
+        self.assertEqual(limit.limit, 90)
+        time.sleep(0.02)
+        limit.on_sample(0.01, in_flight=50, failed=True)
+        self.assertEqual(limit.limit, 81)
+
+    def test_latency_rise_cuts_the_limit(self):
+        limit = AIMDLimit(initial=100, min_limit=10, max_limit=200)
+        for _ in range(10):
+            limit.on_sample(0.001, in_flight=10, failed=False)
+        for _ in range(10):
+            limit.on_sample(0.05, in_flight=10, failed=False)
+        self.assertLess(limit.limit, 100)
+
+    def test_grows_about_one_slot_per_round_trip_under_load(self):
+        limit = AIMDLimit(initial=10, min_limit=1, max_limit=100)
+        for _ in range(10):
+            limit.on_sample(0.001, in_flight=10, failed=False)
+        self.assertEqual(limit.limit, 10)
+        for _ in range(2):
+            limit.on_sample(0.001, in_flight=10, failed=False)
+        self.assertEqual(limit.limit, 11)
+
+    def test_does_not_grow_while_mostly_idle(self):
+        limit = AIMDLimit(initial=10, min_limit=1, max_limit=100)
+        for _ in range(100):
+            limit.on_sample(0.001, in_flight=2, failed=False)
+        self.assertEqual(limit.limit, 10)
+
+    def test_stays_within_bounds(self):
+        limit = AIMDLimit(initial=5, min_limit=4, max_limit=6)
+        for _ in range(100):
+            limit.on_sample(0.001, in_flight=6, failed=False)
+        self.assertEqual(limit.limit, 6)
+        for _ in range(5):
+            time.sleep(0.002)
+            limit.on_sample(0.001, in_flight=6, failed=True)
+        self.assertEqual(limit.limit, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
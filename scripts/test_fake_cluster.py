@@ -0,0 +1,310 @@
+"""
+Behavior checks of AlternatorLB and the features built on it, run against
+the in-process fake cluster: discovery and failover, tiered routing, the
+throughput governor, the item cache, read coalescing, hedged reads and
+resuming a bulk load from its checkpoint.
+
+    python -m unittest test_fake_cluster
+"""
+import os
+import tempfile
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from alternator_fake_cluster import FakeAlternatorCluster, constant_latency
+from alternator_governor import ThroughputLimit
+from alternator_lb import AlternatorLB, Config
+from alternator_loader import BulkLoader, LoadCheckpoint
+from alternator_token_ring import murmur3_token
+
+PORT = 18900
+TABLE = 'fake_cluster_test'
+
+
+class _ClusterTestCase(unittest.TestCase):
+    """Starts a fresh fake cluster for every test, see `cluster_options`."""
+    cluster_options = {'nodes': 3}
+
+    def setUp(self):
+        self.cluster = FakeAlternatorCluster(port=PORT, **self.cluster_options)
+        self.addCleanup(self.cluster.close)
+
+    def make_lb(self, **options) -> AlternatorLB:
+        # The datacenter alternator_crud.py and alternator_loader.py default to.
+        options.setdefault('datacenter', 'DC1')
+        options.setdefault('nodes', [node.address for node in self.cluster.nodes])
+        lb = AlternatorLB(Config(port=PORT, update_interval=0, **options))
+        lb._update_live_nodes()
+        return lb
+
+    def create_table(self, dynamodb):
+        dynamodb.create_table(
+            TableName=TABLE, KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'N'}])
+
+    def node_uri(self, node) -> str:
+        return f"http://{node.address}:{PORT}"
+
+    @staticmethod
+    def completed(lb: AlternatorLB) -> dict:
+        return {node: stats.completed for (node, stats) in lb.get_node_stats().items()}
+
+    @staticmethod
+    def nodes_used(lb: AlternatorLB, before: dict) -> set:
+        return {node for (node, count) in _ClusterTestCase.completed(lb).items()
+                if count > before.get(node, 0)}
+
+
+class FakeClusterTest(_ClusterTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lb = self.make_lb()
+
+    def test_discovers_every_node_of_the_default_datacenter(self):
+        self.assertEqual(
+            sorted(self.lb.get_known_nodes()),
+            sorted(self.node_uri(node) for node in self.cluster.nodes))
+
+    def test_requests_fail_over_when_a_node_stops(self):
+        dynamodb = self.lb.new_botocore_dynamodb_client()
+        self.create_table(dynamodb)
+        dynamodb.put_item(TableName=TABLE, Item={'id': {'N': '1'}})
+
+        stopped = self.cluster.nodes[0]
+        self.cluster.stop_node(stopped)
+        for _ in range(10):
+            response = dynamodb.get_item(TableName=TABLE, Key={'id': {'N': '1'}})
+            self.assertEqual(response['Item']['id'], {'N': '1'})
+
+        self.lb._update_live_nodes()
+        self.assertNotIn(self.node_uri(stopped), self.lb.get_known_nodes())
+
+    def test_murmur3_token_matches_scylla(self):
+        # Token Scylla reports for an int partition key of 1.
+        self.assertEqual(murmur3_token(b'\x00\x00\x00\x01'), -4069959284402364209)
+
+
+class TieredRoutingTest(_ClusterTestCase):
+    # Two local racks of two nodes, plus two nodes in a remote DC.
+    cluster_options = {'nodes': 4, 'racks': ['rack1', 'rack2']}
+
+    def setUp(self):
+        super().setUp()
+        self.remote = [self.cluster.add_node(rack='rack1', datacenter='DC2') for _ in range(2)]
+        self.local = [node for node in self.cluster.nodes if node.datacenter == 'DC1']
+        self.rack1 = [node for node in self.local if node.rack == 'rack1']
+        self.rack2 = [node for node in self.local if node.rack == 'rack2']
+        # Seeded with a rack1 node only, so discovery has to cope with it going down.
+        self.lb = self.make_lb(nodes=[self.rack1[0].address], rack='rack1', tiered_routing=True,
+                               remote_datacenters=['DC2'], retry_backoff=0.01)
+        self.dynamodb = self.lb.new_botocore_dynamodb_client()
+        self.create_table(self.dynamodb)
+        self.dynamodb.put_item(TableName=TABLE, Item={'id': {'N': '1'}})
+
+    def read(self, times: int = 20) -> set:
+        before = self.completed(self.lb)
+        for _ in range(times):
+            response = self.dynamodb.get_item(TableName=TABLE, Key={'id': {'N': '1'}})
+            self.assertEqual(response['Item']['id'], {'N': '1'})
+        return self.nodes_used(self.lb, before)
+
+    def stop(self, nodes):
+        for node in nodes:
+            self.cluster.stop_node(node)
+        self.lb._update_live_nodes()
+
+    def test_stays_in_the_local_rack_while_it_is_healthy(self):
+        self.assertEqual(self.read(), {self.node_uri(node) for node in self.rack1})
+
+    def test_spills_over_to_the_local_dc_when_the_rack_is_down(self):
+        self.stop(self.rack1)
+        self.assertEqual([len(tier) for tier in self.lb._snapshot.tiers], [0, 2, 2])
+        self.assertEqual(self.read(), {self.node_uri(node) for node in self.rack2})
+
+    def test_fails_over_to_the_remote_dc_when_the_local_dc_is_down(self):
+        self.stop(self.local)
+        self.assertEqual([len(tier) for tier in self.lb._snapshot.tiers], [0, 0, 2])
+        self.assertEqual(sorted(self.lb.get_known_nodes()),
+                         sorted(self.node_uri(node) for node in self.remote))
+        self.assertEqual(self.read(), {self.node_uri(node) for node in self.remote})
+
+
+class ThroughputGovernorTest(_ClusterTestCase):
+    cluster_options = {'nodes': 1}
+
+    def test_reject_mode_raises_the_clients_throttling_exception(self):
+        lb = self.make_lb(throughput_limits={TABLE: ThroughputLimit(write_units=1)},
+                          throughput_mode='reject')
+        for dynamodb in (lb.new_botocore_dynamodb_client(), lb.new_fast_dynamodb_client()):
+            if not hasattr(self, 'created'):
+                self.create_table(dynamodb)
+                self.created = True
+            # Let the bucket refill after the other client's rejection.
+            time.sleep(1.1)
+            dynamodb.put_item(TableName=TABLE, Item={'id': {'N': '1'}})
+            with self.assertRaises(dynamodb.exceptions.ProvisionedThroughputExceededException):
+                dynamodb.put_item(TableName=TABLE, Item={'id': {'N': '2'}})
+        self.assertEqual(lb.get_throughput_stats()[TABLE].throttled, 2)
+
+    def test_block_mode_paces_writes_to_the_limit(self):
+        lb = self.make_lb(throughput_limits={
+            TABLE: ThroughputLimit(write_units=10, burst_seconds=0.1)})
+        dynamodb = lb.new_botocore_dynamodb_client()
+        self.create_table(dynamodb)
+        start = time.monotonic()
+        for i in range(6):
+            dynamodb.put_item(TableName=TABLE, Item={'id': {'N': str(i)}})
+        # 1 unit of burst, then 10 units per second.
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+        stats = lb.get_throughput_stats()[TABLE]
+        self.assertEqual(stats.write_units, 6)
+        self.assertGreater(stats.waited, 0)
+
+
+class ItemCacheTest(_ClusterTestCase):
+    cluster_options = {'nodes': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.lb = self.make_lb(item_cache=True, item_cache_ttl=60)
+        self.dynamodb = self.lb.new_botocore_dynamodb_client()
+        self.create_table(self.dynamodb)
+        self.put(self.dynamodb, 'old')
+
+    @staticmethod
+    def put(dynamodb, value: str):
+        dynamodb.put_item(TableName=TABLE, Item={'id': {'N': '1'}, 'value': {'S': value}})
+
+    def get(self) -> str:
+        return self.dynamodb.get_item(TableName=TABLE, Key={'id': {'N': '1'}})['Item']['value']['S']
+
+    def test_serves_repeated_reads_from_the_cache(self):
+        self.assertEqual(self.get(), 'old')
+        self.assertEqual(self.get(), 'old')
+        stats = self.lb.get_item_cache_stats()
+        self.assertEqual((stats.hits, stats.misses), (1, 1))
+
+    def test_writes_through_the_lb_invalidate_the_item(self):
+        for writer in (self.dynamodb, self.lb.new_fast_dynamodb_client()):
+            self.get()
+            self.put(writer, type(writer).__name__)
+            self.assertEqual(self.get(), type(writer).__name__)
+
+    def test_writes_from_elsewhere_are_not_seen_until_the_cache_is_cleared(self):
+        self.get()
+        self.put(self.make_lb().new_botocore_dynamodb_client(), 'new')
+        self.assertEqual(self.get(), 'old')
+        self.lb._item_cache.clear()
+        self.assertEqual(self.get(), 'new')
+
+
+class ReadCoalescingTest(_ClusterTestCase):
+    cluster_options = {'nodes': 1}
+
+    def test_concurrent_identical_reads_share_one_request(self):
+        lb = self.make_lb(coalesce_reads=True,
+                          throughput_limits={TABLE: ThroughputLimit(read_units=1000)})
+        dynamodb = lb.new_botocore_dynamodb_client()
+        self.create_table(dynamodb)
+        dynamodb.put_item(TableName=TABLE, Item={'id': {'N': '1'}})
+        self.cluster.nodes[0].latency = constant_latency(0.3)
+
+        with ThreadPoolExecutor(10) as executor:
+            responses = list(executor.map(
+                lambda _: dynamodb.get_item(TableName=TABLE, Key={'id': {'N': '1'}}), range(10)))
+        self.assertTrue(all(response['Item']['id'] == {'N': '1'} for response in responses))
+        stats = lb.get_coalescing_stats()
+        self.assertGreater(stats.coalesced, 0)
+        # Only the reads that were sent are charged, half a unit each.
+        self.assertEqual(lb.get_throughput_stats()[TABLE].read_units,
+                         0.5 * (stats.requests - stats.coalesced))
+
+
+class HedgedReadsTest(_ClusterTestCase):
+    cluster_options = {'nodes': 2}
+
+    def start(self, budget_ratio: float):
+        self.lb = self.make_lb(hedged_reads=True, hedge_delay=0.05,
+                               hedge_budget_ratio=budget_ratio, trace_sample_rate=1)
+        self.dynamodb = self.lb.new_botocore_dynamodb_client()
+        self.create_table(self.dynamodb)
+        self.dynamodb.put_item(TableName=TABLE, Item={'id': {'N': '1'}})
+
+    def read(self, times: int):
+        for _ in range(times):
+            self.dynamodb.get_item(TableName=TABLE, Key={'id': {'N': '1'}})
+        # Let the primaries that lost finish.
+        time.sleep(0.5)
+
+    def test_slow_node_is_hedged_and_keeps_its_own_latency(self):
+        self.start(budget_ratio=1)
+        (slow, fast) = self.cluster.nodes
+        slow.latency = constant_latency(0.3)
+        self.read(6)
+        hedging = self.lb._hedging
+        self.assertGreater(hedging.hedges, 0)
+        self.assertEqual(hedging.hedge_wins, hedging.hedges)
+        stats = self.lb.get_node_stats()
+        self.assertGreater(stats[self.node_uri(slow)].latency_ewma, 0.2)
+        self.assertLess(stats[self.node_uri(fast)].latency_ewma, 0.1)
+        self.assertTrue(all(node_stats.in_flight == 0 for node_stats in stats.values()))
+        hedge_traces = [record for record in self.lb.get_traces() if record.attempt == 2]
+        self.assertEqual(len(hedge_traces), hedging.hedges)
+        self.assertTrue(all(record.node == self.node_uri(fast) for record in hedge_traces))
+
+    def test_hedges_stop_when_the_budget_is_spent(self):
+        self.start(budget_ratio=0)
+        for node in self.cluster.nodes:
+            node.latency = constant_latency(0.1)
+        self.read(15)
+        # The budget starts with a burst of 10 hedges and earns none back.
+        self.assertEqual(self.lb._hedging.hedges, 10)
+
+
+class BulkLoaderTest(_ClusterTestCase):
+    cluster_options = {'nodes': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.lb = self.make_lb()
+        self.dynamodb = self.lb.new_botocore_dynamodb_client()
+        self.create_table(self.dynamodb)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'rows.csv')
+        with open(self.path, 'w') as f:
+            f.write('id,name\n')
+            for i in range(100):
+                f.write(f'{i},row{i}\n')
+
+    def loaded_ids(self) -> set:
+        items = self.dynamodb.scan(TableName=TABLE)['Items']
+        return {int(item['id']['N']) for item in items}
+
+    def test_resumes_from_the_checkpoint_and_does_not_repeat_a_finished_load(self):
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        offset = sum(len(line) for line in lines[:61])
+        LoadCheckpoint(os.path.abspath(self.path), offset, rows=60).write(f"{self.path}.checkpoint")
+
+        stats = BulkLoader(self.lb, TABLE, self.path, types={'id': 'N'}).load()
+        self.assertEqual((stats.rows, stats.resumed_rows), (40, 60))
+        self.assertEqual(self.loaded_ids(), set(range(60, 100)))
+        checkpoint = LoadCheckpoint.read(f"{self.path}.checkpoint")
+        self.assertEqual((checkpoint.rows, checkpoint.done), (100, True))
+
+        stats = BulkLoader(self.lb, TABLE, self.path, types={'id': 'N'}).load()
+        self.assertEqual((stats.rows, stats.resumed_rows), (0, 100))
+
+    def test_load_without_resume_starts_over(self):
+        LoadCheckpoint(os.path.abspath(self.path), 0, rows=100, done=True).write(
+            f"{self.path}.checkpoint")
+        stats = BulkLoader(self.lb, TABLE, self.path, types={'id': 'N'}).load(resume=False)
+        self.assertEqual(stats.rows, 100)
+        self.assertEqual(self.loaded_ids(), set(range(100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Checks of the load generator's latency histogram.
+
+    python -m unittest test_loadgen
+"""
+import random
+import unittest
+
+from alternator_loadgen import LatencyHistogram
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_empty_histogram_reports_zero(self):
+        self.assertEqual(LatencyHistogram().percentile(99), 0)
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        for micros in range(1, 201):
+            histogram.record(micros)
+        self.assertEqual(histogram.percentile(50), 100)
+        self.assertEqual(histogram.percentile(99), 198)
+        self.assertEqual(histogram.percentile(100), 200)
+
+    def test_large_values_are_within_one_percent(self):
+        values = sorted(random.Random(1).randrange(1000, 60_000_000) for _ in range(10_000))
+        histogram = LatencyHistogram()
+        for micros in values:
+            histogram.record(micros)
+        for percentile in (50, 90, 99, 99.9):
+            expected = values[round(len(values) * percentile / 100) - 1]
+            self.assertAlmostEqual(histogram.percentile(percentile), expected,
+                                   delta=expected * 0.01)
+        self.assertEqual(histogram.percentile(100), values[-1])
+
+    def test_merge_adds_up_both_histograms(self):
+        (fast, slow) = (LatencyHistogram(), LatencyHistogram())
+        for _ in range(90):
+            fast.record(100)
+        for _ in range(10):
+            slow.record(100_000)
+        fast.merge(slow)
+        self.assertEqual((fast.count, fast.max), (100, 100_000))
+        self.assertEqual(fast.percentile(90), 100)
+        self.assertAlmostEqual(fast.percentile(91), 100_000, delta=1000)
+
+
+if __name__ == '__main__':
+    unittest.main()